@@ -94,10 +94,13 @@ class ApplicationBuilder:
         Get text displayed on the right bottom corner
         :return: text string
         """
-        return " {}:{}  ".format(
-            self.text_field.document.cursor_position_row + 1,
-            self.text_field.document.cursor_position_col + 1,
-        )
+        # row and column come from the line index of the document, so the
+        # whole text is not split on every render
+        doc = self.doc_editor.doc
+        position = self.text_field.document.cursor_position
+        row = doc.line_of(position)
+        line_start, _ = doc.line_range(row)
+        return " {}:{}  ".format(row + 1, position - line_start + 1)
 
     def __build_body(self) -> HSplit:
         """
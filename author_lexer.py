@@ -1,7 +1,7 @@
 """
 Base classes for prompt_toolkit lexers.
 """
-from typing import Callable
+from typing import Callable, List, Optional
 
 from prompt_toolkit.document import Document
 from prompt_toolkit.formatted_text.base import StyleAndTextTuples
@@ -12,7 +12,7 @@ from docengine import Doc
 
 class AuthorLexer(Lexer):
     """
-    Lexer that highlights each char with it's author color
+    Lexer that highlights each run of chars with it's author color
     from the COLORS palette
     """
     COLORS = (
@@ -29,6 +29,9 @@ class AuthorLexer(Lexer):
 
     def __init__(self, doc: Doc) -> None:
         self.doc = doc
+        # lexed lines of doc at version, None for lines not lexed yet
+        self.__lines: List[Optional[StyleAndTextTuples]] = []
+        self.__version = -1
 
     def __get_author_color(self, site_id) -> str:
         """
@@ -41,33 +44,45 @@ class AuthorLexer(Lexer):
     def lex_document(self, document: Document)\
             -> Callable[[int], StyleAndTextTuples]:
         """
-        Highlight document
+        Highlight document. Lines lexed before are reused, only lines
+        changed since the last call are lexed again.
         :param document: document object
         :return: function that returns line at line number as formatted text
         """
-        colored_lines = []
-        line_colors: StyleAndTextTuples = []
-        closed_line = False
-
-        for c, a in zip(self.doc.text, self.doc.authors[1:-1]):
-            if c == "\n":
-                colored_lines.append(line_colors)
-                line_colors = []
-                closed_line = True
-                continue
-            else:
-                line_colors.append((self.__get_author_color(a), c))
-                closed_line = False
-        if not closed_line:
-            colored_lines.append(line_colors)
+        doc = self.doc
+        changes = doc.changes_since(self.__version)
+        if changes is None:
+            self.__lines = [None] * doc.line_count
+        else:
+            for line, removed, inserted in changes:
+                self.__lines[line:line + removed + 1] = [None] * (inserted + 1)
+        self.__version = version = doc.version
+        lines = self.__lines
 
         def get_line(line_number: int) -> StyleAndTextTuples:
             """
-            Return the tokens for the provided line.
+            Return the tokens for the provided line. Only the requested
+            line is read from the document, by its newline index.
             """
+            if not 0 <= line_number < len(lines):
+                return []
+            if lines[line_number] is not None:
+                return lines[line_number]
+
             try:
-                return colored_lines[line_number]
+                start, end = doc.line_range(line_number)
             except IndexError:
+                # line removed after lex
                 return []
+            # one fragment per run of chars written by the same author
+            text = doc.text_range(start, end)
+            tokens = [(self.__get_author_color(site),
+                       text[span_start - start:span_end - start])
+                      for span_start, span_end, site
+                      in doc.author_spans(start, end)]
+            # document may have changed after lex, then line is not cached
+            if doc.version == version:
+                lines[line_number] = tokens
+            return tokens
 
         return get_line
@@ -0,0 +1,4 @@
+"""
+Performance benchmarks for the document engine and client pipeline.
+Run from repository root, e.g. python -m benchmarks.bench_char_position
+"""
@@ -0,0 +1,111 @@
+"""
+Compare allocation policies on synthetic edit traces: identifier depth,
+patch size and cost of comparing positions. Every trace is recorded once
+as a list of edits and replayed with each policy.
+"""
+import random
+import time
+
+from docengine import Doc, Patch
+from docengine.allocation_policy import POLICIES
+from docengine.codec import BinaryCodec
+
+NUM_EDITS = 3000
+
+
+def append_trace(rnd):
+    """
+    Text written at the end of document in bursts of typing.
+    """
+    length = 0
+    for _ in range(NUM_EDITS):
+        text = "x" * rnd.randint(1, 8)
+        yield "insert", length, text
+        length += len(text)
+
+
+def typing_trace(rnd):
+    """
+    Typing at a cursor which sometimes jumps, with backspaces.
+    """
+    length = cursor = 0
+    for _ in range(NUM_EDITS):
+        if rnd.random() < 0.05:
+            cursor = rnd.randint(0, length)
+        if cursor and rnd.random() < 0.15:
+            cursor -= 1
+            length -= 1
+            yield "delete", cursor, None
+        else:
+            yield "insert", cursor, "x"
+            cursor += 1
+            length += 1
+
+
+def random_trace(rnd):
+    """
+    Single char inserts and deletes at random places.
+    """
+    length = 0
+    for _ in range(NUM_EDITS):
+        if length and rnd.random() < 0.3:
+            length -= 1
+            yield "delete", rnd.randrange(length + 1), None
+        else:
+            length += 1
+            yield "insert", rnd.randint(0, length - 1), "x"
+
+
+TRACES = {"append": append_trace, "typing": typing_trace,
+          "random": random_trace}
+
+
+def replay(trace, policy):
+    doc = Doc(site=1, policy=policy)
+    patches = []
+    for op, position, text in trace:
+        if op == "delete":
+            doc.delete(position)
+        elif len(text) == 1:
+            patches.append(doc.insert(position, text))
+        else:
+            patches.extend(doc.insert_text(position, text))
+    return doc, [Patch.from_json(patch) for patch in patches]
+
+
+def measure(trace_name, policy_name, trace):
+    try:
+        doc, patches = replay(trace, POLICIES[policy_name]())
+    except Exception as error:
+        print(f"{trace_name:>7} {policy_name:>9}: {error}")
+        return
+
+    stats = doc._alloc.stats
+    binary = BinaryCodec()
+    binary_size = sum(len(binary.pack([patch])) for patch in patches)
+    json_size = sum(len(patch.to_json()) for patch in patches)
+
+    chars = [patch.character for patch in patches]
+    shuffled = chars[:]
+    random.Random(0).shuffle(shuffled)
+    start = time.perf_counter()
+    for _ in range(5):
+        sorted(shuffled)
+    compare_time = (time.perf_counter() - start) / 5 / len(chars)
+
+    print(f"{trace_name:>7} {policy_name:>9}: "
+          f"depth mean {stats.mean_depth:5.2f} max {stats.max_depth:2d}, "
+          f"json {json_size / len(patches):5.1f} B, "
+          f"binary {binary_size / len(patches):4.1f} B, "
+          f"sort {compare_time * 1e9:5.0f} ns/char")
+
+
+def main():
+    for trace_name, generate in TRACES.items():
+        trace = list(generate(random.Random(42)))
+        for policy_name in POLICIES:
+            measure(trace_name, policy_name, trace)
+
+
+if __name__ == "__main__":
+    main()
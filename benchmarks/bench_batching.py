@@ -0,0 +1,55 @@
+"""
+Frames and bytes sent for a paste of 2000 chars and for fast typing,
+with and without patch batching.
+"""
+import asyncio
+
+from application_state import ApplicationState
+from docengine import Doc
+from message_service import MessageService
+
+
+class CountingWebsocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send(self, message):
+        self.frames += 1
+        self.bytes += len(message)
+
+
+async def send(patches, batching, encoding, interval):
+    msg_service = MessageService(ApplicationState(), CountingWebsocket())
+    msg_service.negotiate_encoding({"encoding": encoding,
+                                    "batching": batching})
+    task = asyncio.create_task(msg_service.send_worker())
+    for patch in patches:
+        msg_service.put_patch(patch)
+        if interval:
+            await asyncio.sleep(interval)
+    await msg_service.send_queue.join()
+    task.cancel()
+    return msg_service
+
+
+def main():
+    doc = Doc(site=1)
+    paste = doc.insert_text(0, "x" * 2000)
+    typing = [doc.insert(len(doc.text), "y") for _ in range(200)]
+    for name, patches, interval in (("paste", paste, 0),
+                                    ("typing", typing, 0.002)):
+        for encoding in ("json", "binary"):
+            for batching in (False, True):
+                msg_service = asyncio.run(
+                    send(patches, batching, encoding, interval))
+                websocket = msg_service.websocket
+                print(f"{name:>6} {encoding:>6} batching {batching!s:>5}: "
+                      f"{websocket.frames:5d} frames, "
+                      f"{websocket.bytes / len(patches):6.1f} B/patch, "
+                      f"{msg_service.sent.patches_per_frame:6.1f} "
+                      f"patches/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare memory and throughput of CharPosition/Character ordering
+against the previous list-of-pairs implementation.
+"""
+import random
+import time
+import tracemalloc
+
+from sortedcontainers import SortedList
+
+from docengine.char_position import CharPosition
+from docengine.character import Character
+
+NUM_CHARS = 1000000
+NUM_SITES = 10
+
+
+class LegacyCharPosition:
+    """
+    CharPosition before precomputed keys: __dict__ and zip on comparison.
+    """
+    def __init__(self, position, sites):
+        self.position = position
+        self.sites = sites
+        self.base_bits = CharPosition.BASE_BITS
+
+    def __lt__(self, other):
+        return list(zip(self.position, self.sites)) < list(
+            zip(other.position, other.sites))
+
+
+class LegacyCharacter:
+    def __init__(self, char, position, clock):
+        self.char = char
+        self.position = position
+        self.clock = clock
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+
+def generate_paths(count):
+    """
+    Generate random tree paths of depth 1-4 with a handful of authors.
+    """
+    rnd = random.Random(42)
+    sites = [rnd.getrandbits(32) for _ in range(NUM_SITES)]
+    paths = []
+    for _ in range(count):
+        depth = rnd.randint(1, 4)
+        position = [rnd.randrange(2 ** (CharPosition.BASE_BITS + level))
+                    for level in range(depth)]
+        site = rnd.choice(sites)
+        paths.append((position, [-1] * (depth - 1) + [site]))
+    return paths
+
+
+def measure(name, make_char, paths):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chars = [make_char(list(pos), list(sites), clock)
+             for clock, (pos, sites) in enumerate(paths)]
+    build_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    doc = SortedList(chars)
+    sort_time = time.perf_counter() - start
+
+    probes = chars[:100000]
+    start = time.perf_counter()
+    for char in probes:
+        doc.remove(char)
+        doc.add(char)
+    update_time = time.perf_counter() - start
+
+    print(f"{name:>8}: {memory / len(chars):7.1f} B/char, "
+          f"build {build_time:6.2f}s, sort {sort_time:6.2f}s, "
+          f"100k remove+add {update_time:6.2f}s")
+
+
+def main():
+    paths = generate_paths(NUM_CHARS)
+    print(f"{NUM_CHARS} characters, {NUM_SITES} sites")
+    measure("legacy", lambda pos, sites, clock: LegacyCharacter(
+        "x", LegacyCharPosition(pos, sites), clock), paths)
+    measure("current", lambda pos, sites, clock: Character(
+        "x", CharPosition(pos, sites), clock), paths)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Cost and memory of detecting received patches which were applied before:
+list of raw patches against per-site version vector, after a session of
+20k patches by 5 authors.
+"""
+import random
+import time
+import tracemalloc
+
+from docengine import Doc, Patch
+from docengine.version_vector import VersionVector
+
+NUM_PATCHES = 20000
+NUM_AUTHORS = 5
+PROBES = 500
+
+
+def generate_patches():
+    rnd = random.Random(42)
+    docs = [Doc(site=site) for site in range(1, NUM_AUTHORS + 1)]
+    patches = []
+    for _ in range(NUM_PATCHES):
+        doc = rnd.choice(docs)
+        patches.append(doc.insert(rnd.randint(0, len(doc.text)), "x"))
+    return [Patch.from_json(patch) for patch in patches]
+
+
+def main():
+    patches = generate_patches()
+    probes = random.Random(0).sample(patches, PROBES)
+
+    tracemalloc.start()
+    seen = [patch.to_json() for patch in patches]
+    list_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for patch in probes:
+        assert patch.to_json() in seen
+    list_time = (time.perf_counter() - start) / PROBES
+
+    tracemalloc.start()
+    versions = VersionVector()
+    for patch in patches:
+        versions.add(patch.character.author, patch.character.clock)
+    vector_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for patch in probes:
+        assert not versions.add(patch.character.author,
+                                patch.character.clock)
+    vector_time = (time.perf_counter() - start) / PROBES
+
+    print(f"{len(patches)} patches by {len(versions)} authors")
+    print(f"patch list:     {list_time * 1e6:8.2f} us/patch, "
+          f"{list_memory / 1024:8.1f} KB")
+    print(f"version vector: {vector_time * 1e6:8.2f} us/patch, "
+          f"{vector_memory / 1024:8.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Fsyncs and time spent journaling a paste of 2000 chars with a commit
+per patch and with group commit.
+"""
+import asyncio
+import tempfile
+import time
+
+from docengine import Doc
+from patch_journal import PatchJournal
+
+
+async def append(journal, patches):
+    for patch in patches:
+        journal.append(patch)
+    await asyncio.sleep(journal.COMMIT_WINDOW * 2)
+
+
+def main():
+    patches = Doc(site=1).insert_text(0, "x" * 2000)
+    with tempfile.TemporaryDirectory() as directory:
+        journal = PatchJournal(f"{directory}/single.journal")
+        start = time.perf_counter()
+        for patch in patches:
+            journal.append(patch)
+        elapsed = time.perf_counter() - start
+        print(f"commit per patch: {journal.commits} fsyncs, "
+              f"{elapsed * 1000:.1f} ms")
+        journal.close()
+
+        journal = PatchJournal(f"{directory}/group.journal")
+        start = time.perf_counter()
+        asyncio.run(append(journal, patches))
+        elapsed = time.perf_counter() - start - journal.COMMIT_WINDOW * 2
+        print(f"group commit: {journal.commits} fsyncs, "
+              f"{elapsed * 1000:.1f} ms")
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cost of rendering a screen of 50 lines by the author lexer and of the
+status bar cursor position, against splitting the whole text, on a
+document of 20k lines. Frames of typing one char and rendering a screen
+compare lexer with cached lines to a lexer relexing the whole screen.
+"""
+import time
+
+from author_lexer import AuthorLexer
+from docengine import Doc
+
+NUM_LINES = 20000
+SCREEN = 50
+REPEAT = 20
+
+
+def main():
+    doc = Doc(site=1)
+    doc.insert_text(0, "".join(f"line {idx:5d} of text\n"
+                               for idx in range(NUM_LINES)))
+    lexer = AuthorLexer(doc)
+    first = NUM_LINES // 2
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        lines = doc.text.split("\n")
+        authors = doc.authors[1:-1]
+        [lines[line] for line in range(first, first + SCREEN)]
+        len(authors)
+    split_time = (time.perf_counter() - start) / REPEAT
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        get_line = AuthorLexer(doc).lex_document(None)
+        for line in range(first, first + SCREEN):
+            get_line(line)
+    lex_time = (time.perf_counter() - start) / REPEAT
+
+    position = len(doc.text) // 2
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        doc.text[:position].count("\n")
+    row_split = (time.perf_counter() - start) / REPEAT
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        doc.line_of(position)
+    row_index = (time.perf_counter() - start) / REPEAT
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        doc.insert(doc.line_range(first + 10)[0], "x")
+        get_line = AuthorLexer(doc).lex_document(None)
+        for line in range(first, first + SCREEN):
+            get_line(line)
+    frame_fresh = (time.perf_counter() - start) / REPEAT
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        doc.insert(doc.line_range(first + 10)[0], "x")
+        get_line = lexer.lex_document(None)
+        for line in range(first, first + SCREEN):
+            get_line(line)
+    frame_cached = (time.perf_counter() - start) / REPEAT
+
+    print(f"{len(doc.text)} chars, {doc.line_count} lines")
+    print(f"screen, whole text: {split_time * 1e3:8.2f} ms")
+    print(f"screen, line index: {lex_time * 1e3:8.2f} ms")
+    print(f"cursor row, text:   {row_split * 1e6:8.1f} us")
+    print(f"cursor row, index:  {row_index * 1e6:8.1f} us")
+    print(f"frame, relex:       {frame_fresh * 1e3:8.2f} ms")
+    print(f"frame, cached:      {frame_cached * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
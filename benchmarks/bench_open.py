@@ -0,0 +1,56 @@
+"""
+Time and bytes to open a file of 100k chars: downloading and applying
+whole patch history against loading cached snapshot and applying 100
+newer operations.
+"""
+import json
+import tempfile
+import time
+from unittest import mock
+
+from docengine import Doc
+from document_editor import DocumentEditor
+from snapshot_cache import SnapshotCache
+
+NUM_CHARS = 100000
+NUM_NEW = 100
+
+
+def new_editor():
+    with mock.patch("document_editor.MessageService"):
+        return DocumentEditor(None)
+
+
+def main():
+    doc = Doc(site=1)
+    history = []
+    for start in range(0, NUM_CHARS, 100):
+        history += doc.insert_text(start, "x" * 100)
+
+    start = time.perf_counter()
+    editor = new_editor()
+    editor.load_patches(history)
+    full_time = time.perf_counter() - start
+    full_bytes = len(json.dumps(history))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SnapshotCache(directory)
+        cache.save("1", ("user", None, "file"), editor.doc.snapshot(),
+                   editor.versions.to_dict())
+        newer = doc.insert_text(0, "y" * NUM_NEW)
+
+        start = time.perf_counter()
+        editor = new_editor()
+        editor.load_snapshot(*cache.load(cache.find("user", None, "file")))
+        editor.merge_patches(newer)
+        cached_time = time.perf_counter() - start
+    cached_bytes = len(json.dumps(newer))
+    assert editor.doc.text == doc.text
+
+    print(f"full history:    {full_time:6.2f} s, {full_bytes / 1024:8.0f} KB")
+    print(f"cached snapshot: {cached_time:6.2f} s, "
+          f"{cached_bytes / 1024:8.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
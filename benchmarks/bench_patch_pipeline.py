@@ -0,0 +1,63 @@
+"""
+Compare per-patch cost of the receive pipeline when raw json is decoded
+at every stage against a Patch object parsed once at network boundary.
+"""
+import json
+import time
+
+from docengine import Doc, Patch
+
+NUM_PATCHES = 50000
+
+
+def generate_messages(count):
+    """
+    Generate network messages with remote insert patches.
+    """
+    doc = Doc()
+    doc.site = 1
+    return [json.dumps({"type": "patch", "content": patch}).encode("utf-8")
+            for patch in doc.insert_text(0, "x" * count)]
+
+
+def receive_raw(doc, message):
+    """
+    Pipeline passing raw patch string: decoded in editor, in
+    Doc.apply_patch and in Doc.get_real_position.
+    """
+    packet = json.loads(message.decode("utf-8"))
+    raw_patch = packet["content"]
+    json.loads(raw_patch)
+    doc.apply_patch(raw_patch)
+    return doc.get_real_position(raw_patch)
+
+
+def receive_parsed(doc, message):
+    """
+    Pipeline passing Patch object created once.
+    """
+    packet = json.loads(message.decode("utf-8"))
+    patch = Patch.from_json(packet["content"])
+    doc.apply_patch(patch)
+    return doc.get_real_position(patch)
+
+
+def measure(name, receive, messages):
+    doc = Doc()
+    doc.site = 0
+    start = time.perf_counter()
+    for message in messages:
+        receive(doc, message)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>7}: {elapsed / len(messages) * 1e6:6.2f} us/patch")
+
+
+def main():
+    messages = generate_messages(NUM_PATCHES)
+    print(f"{NUM_PATCHES} remote insert patches")
+    measure("raw", receive_raw, messages)
+    measure("parsed", receive_parsed, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Compare position depth, patch size, comparison cost and snapshot size of
+a long-edited document before and after rebalance.
+"""
+import random
+import time
+
+from docengine import Doc, Patch
+
+NUM_EDITS = 20000
+
+
+def generate_doc():
+    """
+    Edit document by three authors typing at random places.
+    """
+    rnd = random.Random(42)
+    doc = Doc()
+    for _ in range(NUM_EDITS):
+        doc.site = rnd.randint(1, 3)
+        position = rnd.randint(0, len(doc.text))
+        if doc.text and rnd.random() < 0.2:
+            doc.delete(min(position, len(doc.text) - 1))
+        else:
+            doc.insert_text(position, "x" * rnd.randint(1, 5))
+    return doc
+
+
+def measure(name, doc):
+    patches = [Patch.from_json(raw) for raw in doc.patch_set]
+    chars = [patch.character for patch in patches]
+    depth = sum(len(char.key) // 2 for char in chars) / len(chars)
+    json_size = sum(len(patch.to_json()) for patch in patches) / len(chars)
+
+    shuffled = chars[:]
+    random.Random(0).shuffle(shuffled)
+    start = time.perf_counter()
+    sorted(shuffled)
+    sort_time = (time.perf_counter() - start) / len(chars)
+
+    print(f"{name:>10}: {len(chars)} chars, depth mean {depth:5.2f}, "
+          f"json {json_size:5.1f} B/patch, sort {sort_time * 1e9:5.0f} "
+          f"ns/char, snapshot {len(doc.snapshot()) / len(chars):5.1f} "
+          f"B/char")
+
+
+def main():
+    doc = generate_doc()
+    measure("before", doc)
+    start = time.perf_counter()
+    doc.rebalance()
+    print(f"rebalance: {time.perf_counter() - start:.2f}s")
+    measure("after", doc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Memory of document characters received as patches, with and without
+interning of site ids, at 1M characters written by 10 authors.
+"""
+import random
+import time
+import tracemalloc
+
+from docengine import Doc, Patch
+from docengine.site_table import SiteTable
+
+NUM_CHARS = 1000000
+NUM_AUTHORS = 10
+RUN_LENGTH = 50
+
+
+def generate_patches():
+    """
+    Generate insert patches of 10 authors with 32-bit ids, as assigned by
+    the editor, typing runs at random places.
+    """
+    rnd = random.Random(42)
+    authors = [rnd.getrandbits(32) for _ in range(NUM_AUTHORS)]
+    doc = Doc()
+    while len(doc.text) < NUM_CHARS:
+        doc.site = rnd.choice(authors)
+        doc.insert_text(rnd.randint(0, len(doc.text)), "x" * RUN_LENGTH)
+    return list(doc.patch_set)
+
+
+def main():
+    start = time.perf_counter()
+    patches = generate_patches()
+    print(f"{len(patches)} chars generated in "
+          f"{time.perf_counter() - start:.0f}s")
+
+    tracemalloc.start()
+    chars = [Patch.from_json(raw).character for raw in patches]
+    plain, _ = tracemalloc.get_traced_memory()
+    table = SiteTable()
+    for char in chars:
+        table.intern_char(char)
+    interned, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    depth = sum(len(char.key) // 2 for char in chars) / len(chars)
+    print(f"depth mean {depth:.2f}, {len(table)} distinct sites")
+    print(f"parsed chars:   {plain / len(chars):6.1f} B/char")
+    print(f"interned chars: {interned / len(chars):6.1f} B/char")
+    del chars
+
+    tracemalloc.start()
+    doc = Doc(site=1)
+    doc.apply_patches(patches)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Doc:            {memory / len(patches):6.1f} B/char")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare memory and edit throughput of Doc storage backends on a document
+written in runs of text at random places.
+"""
+import random
+import time
+import tracemalloc
+
+from docengine import Doc
+from docengine.block_storage import BlockStorage
+from docengine.storage import SortedListStorage
+from docengine.trie_storage import TrieStorage
+
+NUM_RUNS = 4000
+RUN_LENGTH = 50
+NUM_EDITS = 10000
+STORAGES = [SortedListStorage, BlockStorage, TrieStorage]
+
+
+def generate_patches():
+    """
+    Generate insert patches of a document typed in runs by 10 authors.
+    """
+    rnd = random.Random(42)
+    doc = Doc()
+    for _ in range(NUM_RUNS):
+        doc.site = rnd.randrange(10)
+        doc.insert_text(rnd.randint(0, len(doc.text)), "x" * RUN_LENGTH)
+    return list(doc.patch_set)
+
+
+def measure(storage_cls, patches):
+    tracemalloc.start()
+    doc = Doc(site=99, storage=storage_cls())
+    doc.apply_patches(patches)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    doc = Doc(site=99, storage=storage_cls())
+    doc.apply_patches(patches)
+    load_time = time.perf_counter() - start
+
+    rnd = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(NUM_EDITS):
+        position = rnd.randint(0, len(doc.text) - 1)
+        if rnd.random() < 0.5:
+            doc.insert(position, "y")
+        else:
+            doc.delete(position)
+    edit_time = time.perf_counter() - start
+
+    storage = doc._Doc__doc
+    nodes = storage.blocks if hasattr(storage, "blocks") else len(storage)
+    print(f"{storage_cls.__name__:>18}: {memory / len(patches):6.1f} B/char, "
+          f"{nodes:7d} nodes, load {load_time:5.2f}s, "
+          f"{NUM_EDITS} edits {edit_time:5.2f}s")
+
+
+def main():
+    patches = generate_patches()
+    print(f"{len(patches)} characters in runs of {RUN_LENGTH}")
+    for storage_cls in STORAGES:
+        measure(storage_cls, patches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare size and encode/decode throughput of json and binary patch
+encodings. Json has the same per-patch cost in a batch, binary batches
+share site table and clock deltas.
+"""
+import random
+import time
+
+from docengine import Doc, Patch
+from docengine.codec import BinaryCodec, JsonCodec
+
+NUM_PATCHES = 20000
+BATCH_SIZE = 100
+
+
+def generate_patches(count):
+    """
+    Generate two authors inserting bursts of text at random places.
+    """
+    rnd = random.Random(42)
+    doc = Doc()
+    patches = []
+    while len(patches) < count:
+        doc.site = rnd.choice((1234567890, 987654321))
+        position = rnd.randint(0, len(doc.text))
+        patches.extend(map(Patch.from_json, doc.insert_text(
+            position, "x" * rnd.randint(1, 20))))
+    return patches[:count]
+
+
+def measure(name, encode, decode, items):
+    start = time.perf_counter()
+    encoded = [encode(item) for item in items]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for content in encoded:
+        decode(content)
+    decode_time = time.perf_counter() - start
+    size = sum(len(content) for content in encoded)
+    print(f"{name:>16}: {size / NUM_PATCHES:6.1f} B/patch, "
+          f"encode {encode_time / NUM_PATCHES * 1e6:5.2f} us/patch, "
+          f"decode {decode_time / NUM_PATCHES * 1e6:5.2f} us/patch")
+
+
+def main():
+    patches = generate_patches(NUM_PATCHES)
+    batches = [patches[i:i + BATCH_SIZE]
+               for i in range(0, len(patches), BATCH_SIZE)]
+    json_codec, binary_codec = JsonCodec(), BinaryCodec()
+    print(f"{NUM_PATCHES} patches, batches of {BATCH_SIZE}")
+    measure("json single", lambda p: Patch(p.op, p.character).to_json(),
+            json_codec.decode, patches)
+    measure("binary single", binary_codec.encode, binary_codec.decode,
+            patches)
+    measure("binary raw single", lambda p: binary_codec.pack([p]),
+            binary_codec.unpack, patches)
+    measure("binary batch", binary_codec.encode_batch,
+            binary_codec.decode_batch, batches)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,4 @@ defined on this paper:
 https://hal.archives-ouvertes.fr/hal-00921633/document
 """
 from .doc import Doc
+from .patch import Patch
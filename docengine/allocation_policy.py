@@ -0,0 +1,120 @@
+"""
+Allocation policies of Allocator. A policy decides on which side of the
+free interval between two positions a new position is taken (boundary+
+near the left one, boundary- near the right one) and how far from it.
+"""
+from random import Random
+from typing import Dict, Optional, Tuple
+
+BOUNDARY = 5
+
+
+class RandomBoundaryPolicy:
+    """
+    LSEQ strategy: boundary+ or boundary- is picked randomly once per
+    depth, step is random up to boundary.
+    """
+    name = "random"
+
+    def __init__(self, boundary=BOUNDARY, rng=None) -> None:
+        """
+        :param boundary: max distance of new pos from its neighbour
+        :param rng: random generator, seeded one makes allocation
+        reproducible
+        :type boundary: int
+        :type rng: Random
+        """
+        self.boundary = boundary
+        self.rng = rng if rng is not None else Random()
+        self.__strategy_history: Dict[int, bool] = {}
+
+    def strategy(self, depth, p=None, q=None) -> bool:
+        """
+        :param depth: depth of new pos
+        :param p: left neighbour pos, if known
+        :param q: right neighbour pos, if known
+        :type depth: int
+        :type p: CharPosition
+        :type q: CharPosition
+        :return: True if boundary+, False if boundary-
+        """
+        if depth not in self.__strategy_history:
+            self.__strategy_history[depth] = bool(self.rng.getrandbits(1))
+
+        return self.__strategy_history[depth]
+
+    def step(self, depth, interval) -> int:
+        """
+        :param depth: depth of new pos
+        :param interval: number of free positions at depth
+        :type depth: int
+        :type interval: int
+        :return: distance of new pos from its neighbour
+        """
+        return min(self.boundary, self.rng.randint(1, interval))
+
+    def allocated(self, depth, pos) -> None:
+        """
+        Observe allocated pos
+        :type depth: int
+        :type pos: CharPosition
+        """
+
+
+class AppendBiasedPolicy(RandomBoundaryPolicy):
+    """
+    Always boundary+, so text typed forward or appended at the end of
+    document keeps the whole free interval after the last char.
+    """
+    name = "append"
+
+    def strategy(self, depth, p=None, q=None) -> bool:
+        return True
+
+
+class AdaptivePolicy(RandomBoundaryPolicy):
+    """
+    Picks strategy of every depth from observed editing direction: a pos
+    allocated right after the previous one moves the depth towards
+    boundary+, right before it towards boundary-. While edits keep going
+    in the direction of the strategy, step shrinks to 1, so runs of typing
+    go deeper less often.
+    """
+    name = "adaptive"
+    # balance of observed directions, at which strategy is switched
+    THRESHOLD = 2
+
+    def __init__(self, boundary=BOUNDARY, rng=None) -> None:
+        super().__init__(boundary, rng)
+        self.__balance: Dict[int, int] = {}
+        self.__last: Optional[Tuple[int, ...]] = None
+        self.__sequential = False
+
+    def strategy(self, depth, p=None, q=None) -> bool:
+        balance = self.__balance.get(depth, 0)
+        if p is not None and q is not None:
+            if p.key == self.__last:
+                balance = min(balance + 1, self.THRESHOLD)
+            elif q.key == self.__last:
+                balance = max(balance - 1, -self.THRESHOLD)
+            self.__balance[depth] = balance
+            self.__sequential = abs(balance) >= self.THRESHOLD and \
+                self.__last == (p.key if balance > 0 else q.key)
+
+        if balance >= self.THRESHOLD:
+            return True
+        if balance <= -self.THRESHOLD:
+            return False
+        return super().strategy(depth, p, q)
+
+    def step(self, depth, interval) -> int:
+        if self.__sequential:
+            return 1
+        return super().step(depth, interval)
+
+    def allocated(self, depth, pos) -> None:
+        self.__last = pos.key
+
+
+POLICIES = {policy.name: policy for policy in
+            (RandomBoundaryPolicy, AppendBiasedPolicy, AdaptivePolicy)}
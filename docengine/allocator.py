@@ -1,19 +1,75 @@
-from random import randint, getrandbits
-from typing import Dict
+from collections import Counter
+from typing import List, Tuple
+from . import allocation_policy
+from .allocation_policy import RandomBoundaryPolicy
 from .char_position import CharPosition
 
 
+class AllocationStats:
+    """
+    Per-depth statistics of allocated positions
+    """
+    def __init__(self) -> None:
+        # depth -> number of positions allocated at depth
+        self.depths: Counter = Counter()
+        # depth -> number of single allocations which had to descend to
+        # depth because shallower levels were full
+        self.overflows: Counter = Counter()
+
+    def record(self, depth, count=1, descended=False) -> None:
+        """
+        Record allocation
+        :param depth: depth of allocated positions
+        :param count: number of allocated positions
+        :param descended: whether depth is below the depth of neighbours
+        :type depth: int
+        :type count: int
+        :type descended: bool
+        """
+        self.depths[depth] += count
+        if descended:
+            self.overflows[depth] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.depths.values())
+
+    @property
+    def max_depth(self) -> int:
+        return max(self.depths, default=0)
+
+    @property
+    def mean_depth(self) -> float:
+        total = self.total
+        return sum(depth * count for depth, count in self.depths.items()) \
+            / total if total else 0.0
+
+    def __repr__(self) -> str:
+        return f"AllocationStats(total={self.total}, " \
+               f"mean_depth={self.mean_depth:.2f}, " \
+               f"max_depth={self.max_depth}, depths={dict(self.depths)})"
+
+
 class Allocator:
     """
     Allocate position between provided p and q positions
     https://hal.archives-ouvertes.fr/hal-00921633/document
     section 3.3
     """
-    BOUNDARY = 5
+    BOUNDARY = allocation_policy.BOUNDARY
     MAX_DEPTH = 32 - CharPosition.BASE_BITS
 
-    def __init__(self, site: int) -> None:
-        self.__strategy_history: Dict[int, bool] = {}
+    def __init__(self, site: int, policy=None) -> None:
+        """
+        :param site: author id
+        :param policy: allocation policy, RandomBoundaryPolicy by default
+        :type site: int
+        :type policy: RandomBoundaryPolicy or AppendBiasedPolicy or
+        AdaptivePolicy
+        """
+        self.policy = policy if policy is not None \
+            else RandomBoundaryPolicy(self.BOUNDARY)
+        self.stats = AllocationStats()
         self._site = site
 
     def allocate(self, p, q) -> CharPosition:
@@ -25,7 +81,7 @@ class Allocator:
         :type q: CharPosition
         :return: allocated pos
         """
-        if p.position == q.position and p.sites == q.sites:
+        if p.key == q.key:
             raise Exception("Provided p and q are equal. Cannot allocate.")
 
         depth = 0
@@ -38,32 +94,155 @@ class Allocator:
             if depth > self.MAX_DEPTH:
                 raise Exception("Max depth reached. Aborting.")
 
-        alloc_step = min(self.BOUNDARY, randint(0, interval - 1) + 1)
+        boundary_plus = self.policy.strategy(depth, p, q)
+        alloc_step = self.policy.step(depth, interval)
 
-        if self.get_strategy(depth) or is_equal:
+        if boundary_plus or is_equal:
             res = p.convert_to_int(depth) + alloc_step
         else:
             res = q.convert_to_int(depth) - alloc_step
 
-        sites_len = depth - len(p.sites)
-        sites = p.sites + [self._site] * sites_len
-        sites[-1] = self._site
+        pos = self.__create(res, depth, p, q)
+        self.__record(depth, 1, p, q, pos)
+        return pos
+
+    def allocate_run(self, p, q, count) -> List[CharPosition]:
+        """
+        Generate count ordered positions between provided positions in one
+        pass. Positions are taken at the shallowest depth that fits all of
+        them, a policy step apart, on the side of the interval chosen by
+        the policy, so following edits next to the run find free room at
+        the same depth.
+        :param p: character pos
+        :param q: character pos
+        :param count: number of positions to allocate
+        :type p: CharPosition
+        :type q: CharPosition
+        :type count: int
+        :return: allocated positions in ascending order
+        """
+        if p.key == q.key:
+            raise Exception("Provided p and q are equal. Cannot allocate.")
 
-        return CharPosition.create_from_int(res, depth, sites,
-                                            base_bits=p.base_bits)
+        depth = 0
+        interval = 0
+        is_equal = False
+        while interval < count:
+            depth += 1
+            interval, is_equal = p.get_interval_between(q, depth)
+
+            if depth > self.MAX_DEPTH:
+                raise Exception("Max depth reached. Aborting.")
+
+        boundary_plus = self.policy.strategy(depth, p, q)
+        step = self.policy.step(depth, (interval + 1) // (count + 1))
+        if boundary_plus or is_equal:
+            base = p.convert_to_int(depth)
+        else:
+            base = q.convert_to_int(depth) - step * (count + 1)
+        positions = [self.__create(base + step * i, depth, p, q)
+                     for i in range(1, count + 1)]
+        self.__record(depth, count, p, q, positions[-1])
+        return positions
+
+    def spread(self, p, q, count) -> Tuple[int, int, int]:
+        """
+        Lay out ordered positions between provided positions, spread
+        evenly at the shallowest depth which leaves at least boundary free
+        positions around every one of them. Result depends only on
+        arguments, so every site computes the same positions.
+        :param p: character pos
+        :param q: character pos
+        :param count: number of positions
+        :type p: CharPosition
+        :type q: CharPosition
+        :type count: int
+        :return: layout of positions, see spread_position
+        """
+        depth = 0
+        interval = 0
+        while interval < (count + 1) * (self.policy.boundary + 1):
+            depth += 1
+            interval, _ = p.get_interval_between(q, depth)
+
+            if depth > self.MAX_DEPTH:
+                raise Exception("Max depth reached. Aborting.")
+
+        return depth, p.convert_to_int(depth), (interval + 1) // (count + 1)
+
+    @staticmethod
+    def spread_position(layout, idx, author, base_bits) -> CharPosition:
+        """
+        Create position of spread layout
+        :param layout: depth, integer of the lower pos at depth and step
+        between positions, as returned by spread
+        :param idx: index of position in layout
+        :param author: author id of position
+        :param base_bits: pos base bits
+        :type layout: Tuple[int, int, int]
+        :type idx: int
+        :type author: int
+        :type base_bits: int
+        :return: generated CharPosition object
+        """
+        depth, base, step = layout
+        return CharPosition.create_from_int(base + step * (idx + 1), depth,
+                                            [-1] * (depth - 1) + [author],
+                                            base_bits=base_bits)
+
+    def __record(self, depth, count, p, q, last) -> None:
+        """
+        Update stats and policy with allocated positions
+        :param last: the last allocated pos
+        """
+        neighbour_depth = max(len(p.key), len(q.key)) // 2
+        self.stats.record(depth, count, descended=depth > neighbour_depth)
+        self.policy.allocated(depth, last)
+
+    def __create(self, value, depth, p, q) -> CharPosition:
+        """
+        Create new pos between p and q from its integer representation.
+        While the path of new pos follows the path of p or q, it takes
+        their author ids, so it is ordered by digits against both of them.
+        The last level always gets own author id.
+        :param value: integer representation of new pos
+        :param depth: depth of new pos
+        :type value: int
+        :type depth: int
+        :type p: CharPosition
+        :type q: CharPosition
+        :return: new pos
+        """
+        digits = CharPosition.create_from_int(
+            value, depth, [0] * depth, base_bits=p.base_bits).position
+        p_key, q_key = p.key, q.key
+        follows_p = follows_q = True
+        sites = []
+        for level in range(0, 2 * (depth - 1), 2):
+            digit = digits[level // 2]
+            follows_p = follows_p and level < len(p_key) and \
+                p_key[level] == digit
+            follows_q = follows_q and level < len(q_key) and \
+                q_key[level] == digit
+            if follows_p:
+                sites.append(p_key[level + 1])
+                follows_q = follows_q and q_key[level + 1] == sites[-1]
+            elif follows_q:
+                sites.append(q_key[level + 1])
+            else:
+                sites.append(self._site)
+        sites.append(self._site)
+        return CharPosition(digits, sites, base_bits=p.base_bits)
 
     def get_strategy(self, depth: int):
         """
-        If it was not allocated before, picks random allocation strategy
-        (boundary+ or boundary-) for specified depth.
+        Strategy (boundary+ or boundary-) of the policy for specified
+        depth, by default picked randomly on first allocation at depth.
         :param depth: depth level
         :type depth: int
         :return True if boundary+, False if boundary-
         """
-        if depth not in self.__strategy_history:
-            self.__strategy_history[depth] = bool(getrandbits(1))
-
-        return self.__strategy_history[depth]
+        return self.policy.strategy(depth)
 
     def __call__(self, p, q) -> CharPosition:
         """
@@ -0,0 +1,417 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from typing import Iterator, List, Optional, Tuple
+
+from .char_position import CharPosition
+from .character import Character
+
+
+class Block:
+    """
+    Run of adjacent characters which share author ids of every tree level,
+    i.e. were allocated by one author at one depth. With equal sites,
+    order of positions is order of their integer representation, so block
+    stores only that integer per character. Characters are materialized
+    on access.
+    """
+    __slots__ = ("sites", "base_bits", "values", "clocks", "text")
+
+    # integer representation of deeper positions does not fit into array
+    MAX_VALUE_BITS = 64
+
+    def __init__(self, char) -> None:
+        """
+        Create block holding a single character
+        :type char: Character
+        """
+        self.sites: Tuple[int, ...] = char.key[1::2]
+        self.base_bits: int = char.position.base_bits
+        depth = len(self.sites)
+        value = char.position.convert_to_int()
+        value_bits = depth * self.base_bits + depth * (depth - 1) // 2
+        self.values = array("Q", [value]) \
+            if value_bits <= self.MAX_VALUE_BITS else [value]
+        self.clocks = array("Q", [char.clock])
+        # str with one symbol per character; list for a single character
+        # which holds other than one symbol
+        self.text = char.char if len(char.char) == 1 else [char.char]
+
+    def key(self, idx) -> Tuple[int, ...]:
+        """
+        :param idx: index of character in block
+        :type idx: int
+        :return: comparison key of character pos
+        """
+        return CharPosition.create_from_int(
+            self.values[idx], len(self.sites), self.sites,
+            base_bits=self.base_bits).key
+
+    def identifier(self, idx) -> Tuple[Tuple[int, ...], int]:
+        """
+        :param idx: index of character in block
+        :type idx: int
+        :return: identifier of character
+        """
+        return self.key(idx), self.clocks[idx]
+
+    def character(self, idx) -> Character:
+        """
+        :param idx: index of character in block
+        :type idx: int
+        :return: new Character object
+        """
+        return Character(self.text[idx], CharPosition.create_from_int(
+            self.values[idx], len(self.sites), self.sites,
+            base_bits=self.base_bits), self.clocks[idx])
+
+    def accepts(self, char, idx) -> bool:
+        """
+        Check if char can be stored in block at idx
+        :type char: Character
+        :type idx: int
+        """
+        if not isinstance(self.text, str) or len(char.char) != 1 or \
+                len(self.text) >= BlockStorage.MAX_BLOCK or \
+                char.key[1::2] != self.sites or \
+                char.position.base_bits != self.base_bits:
+            return False
+
+        value = char.position.convert_to_int()
+        return (idx == 0 or self.values[idx - 1] < value) and \
+            (idx == len(self.values) or value < self.values[idx])
+
+    def insert(self, idx, char) -> None:
+        """
+        Insert accepted char at idx
+        :type idx: int
+        :type char: Character
+        """
+        self.values.insert(idx, char.position.convert_to_int())
+        self.clocks.insert(idx, char.clock)
+        self.text = self.text[:idx] + char.char + self.text[idx:]
+
+    def delete(self, idx) -> None:
+        """
+        Delete character at idx
+        :type idx: int
+        """
+        del self.values[idx]
+        del self.clocks[idx]
+        self.text = self.text[:idx] + self.text[idx + 1:]
+
+    def split(self, idx) -> 'Block':
+        """
+        Move characters starting from idx to a new block
+        :type idx: int
+        :return: new block
+        """
+        tail = Block.__new__(Block)
+        tail.sites, tail.base_bits = self.sites, self.base_bits
+        tail.values, tail.clocks, tail.text = \
+            self.values[idx:], self.clocks[idx:], self.text[idx:]
+        del self.values[idx:]
+        del self.clocks[idx:]
+        self.text = self.text[:idx]
+        return tail
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class BlockStorage:
+    """
+    Storage backend of Doc which keeps runs of characters typed by one
+    author as blocks instead of separate Character objects. A block is
+    split when a character is inserted inside of it. Characters returned
+    by the storage are created on access, so they are matched by
+    identifier, not by object identity.
+
+    Blocks are kept in groups of up to 2 * LOAD blocks, like sublists of
+    SortedList, and character counts of groups are kept in a Fenwick tree,
+    so creating a block costs O(LOAD) and flat index lookups O(log n).
+    """
+    MAX_BLOCK = 256
+    LOAD = 64
+
+    def __init__(self) -> None:
+        self.__groups: List[List[Block]] = []
+        # identifier of the first character of every block by group
+        self.__firsts: List[List[Tuple]] = []
+        # identifier of the first character of every group
+        self.__group_firsts: List[Tuple] = []
+        self.__tree: List[int] = [0]
+        self.__len = 0
+
+    @property
+    def blocks(self) -> int:
+        """
+        Number of blocks
+        """
+        return sum(map(len, self.__groups))
+
+    def add(self, char) -> None:
+        if not self.__groups:
+            self.__build([char])
+            return
+
+        group_idx, block_idx, idx, found = self.__locate(char)
+        if found:
+            return
+        self.__len += 1
+        blocks = self.__groups[group_idx]
+
+        if block_idx >= 0:
+            block = blocks[block_idx]
+            if block.accepts(char, idx):
+                block.insert(idx, char)
+                self.__update(group_idx, 1)
+                return
+        if block_idx < 0 or idx == len(blocks[block_idx]):
+            next_group, next_block = (group_idx, block_idx + 1) \
+                if block_idx + 1 < len(blocks) else (group_idx + 1, 0)
+            if next_group < len(self.__groups):
+                block = self.__groups[next_group][next_block]
+                if block.accepts(char, 0):
+                    block.insert(0, char)
+                    self.__set_first(next_group, next_block,
+                                     char.identifier)
+                    self.__update(next_group, 1)
+                    return
+
+        firsts = self.__firsts[group_idx]
+        if block_idx >= 0 and 0 < idx < len(blocks[block_idx]):
+            tail = blocks[block_idx].split(idx)
+            blocks.insert(block_idx + 1, tail)
+            firsts.insert(block_idx + 1, tail.identifier(0))
+        blocks.insert(block_idx + 1, Block(char))
+        firsts.insert(block_idx + 1, char.identifier)
+        if block_idx < 0:
+            self.__group_firsts[group_idx] = char.identifier
+        self.__update(group_idx, 1)
+
+        if len(blocks) > 2 * self.LOAD:
+            self.__groups.insert(group_idx + 1, blocks[self.LOAD:])
+            self.__firsts.insert(group_idx + 1, firsts[self.LOAD:])
+            self.__group_firsts.insert(group_idx + 1, firsts[self.LOAD])
+            del blocks[self.LOAD:]
+            del firsts[self.LOAD:]
+            self.__rebuild()
+
+    def update(self, chars) -> None:
+        chars = sorted(chars)
+        if len(chars) <= len(self):
+            for char in chars:
+                self.add(char)
+            return
+
+        # rebuild all blocks in a single pass over merged characters
+        self.__build(list(merge(self, chars)))
+
+    def remove(self, char) -> None:
+        group_idx, block_idx, idx, found = self.__locate(char)
+        if not found:
+            raise ValueError(f"{char} is not in storage")
+        self.__len -= 1
+
+        blocks = self.__groups[group_idx]
+        block = blocks[block_idx]
+        block.delete(idx)
+        if block:
+            if idx == 0:
+                self.__set_first(group_idx, block_idx, block.identifier(0))
+            self.__update(group_idx, -1)
+            return
+
+        del blocks[block_idx]
+        del self.__firsts[group_idx][block_idx]
+        if not blocks:
+            del self.__groups[group_idx]
+            del self.__firsts[group_idx]
+            del self.__group_firsts[group_idx]
+            self.__rebuild()
+            return
+        if block_idx == 0:
+            self.__group_firsts[group_idx] = self.__firsts[group_idx][0]
+        self.__update(group_idx, -1)
+
+    def delete_range(self, start, stop) -> List[Character]:
+        old_chars = list(self.islice(start, stop))
+        for old_char in old_chars:
+            self.remove(old_char)
+        return old_chars
+
+    def find(self, char) -> Optional[Character]:
+        if not self.__groups:
+            return None
+        group_idx, block_idx, idx, found = self.__locate(char)
+        return self.__groups[group_idx][block_idx].character(idx) \
+            if found else None
+
+    def bisect_left(self, char) -> int:
+        if not self.__groups:
+            return 0
+        group_idx, block_idx, idx, _ = self.__locate(char)
+        return self.__start(group_idx, block_idx) + idx
+
+    def index(self, char) -> int:
+        if not self.__groups:
+            raise ValueError(f"{char} is not in storage")
+        group_idx, block_idx, idx, found = self.__locate(char)
+        if not found:
+            raise ValueError(f"{char} is not in storage")
+        return self.__start(group_idx, block_idx) + idx
+
+    def islice(self, start, stop) -> Iterator[Character]:
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+
+        group_idx, block_idx, idx = self.__select(start)
+        blocks = self.__groups[group_idx]
+        for _ in range(start, stop):
+            block = blocks[block_idx]
+            yield block.character(idx)
+            idx += 1
+            if idx == len(block):
+                block_idx, idx = block_idx + 1, 0
+                if block_idx == len(blocks) and \
+                        group_idx + 1 < len(self.__groups):
+                    group_idx, block_idx = group_idx + 1, 0
+                    blocks = self.__groups[group_idx]
+
+    def __getitem__(self, idx) -> Character:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("storage index out of range")
+        group_idx, block_idx, idx = self.__select(idx)
+        return self.__groups[group_idx][block_idx].character(idx)
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __iter__(self) -> Iterator[Character]:
+        return self.islice(0, len(self))
+
+    def __locate(self, char) -> Tuple[int, int, int, bool]:
+        """
+        Find place of char in non-empty storage
+        :type char: Character
+        :return: index of group and index in it of the last block starting
+        before or at char (-1 if none), index in that block of the first
+        character not ordered before char, whether that character is char
+        itself
+        """
+        ident = char.identifier
+        group_idx = bisect_right(self.__group_firsts, ident) - 1
+        if group_idx < 0:
+            return 0, -1, 0, False
+        block_idx = bisect_right(self.__firsts[group_idx], ident) - 1
+        block = self.__groups[group_idx][block_idx]
+
+        if char.key[1::2] == block.sites and \
+                char.position.base_bits == block.base_bits:
+            # values of block are ordered like keys and unique
+            value = char.position.convert_to_int()
+            idx = bisect_left(block.values, value)
+            if idx < len(block) and block.values[idx] == value:
+                if block.clocks[idx] == char.clock:
+                    return group_idx, block_idx, idx, True
+                if block.clocks[idx] < char.clock:
+                    idx += 1
+            return group_idx, block_idx, idx, False
+
+        low, high = 0, len(block)
+        while low < high:
+            mid = (low + high) // 2
+            if block.identifier(mid) < ident:
+                low = mid + 1
+            else:
+                high = mid
+        found = low < len(block) and block.identifier(low) == ident
+        return group_idx, block_idx, low, found
+
+    def __set_first(self, group_idx, block_idx, ident) -> None:
+        """
+        Set identifier of the first character of block
+        """
+        self.__firsts[group_idx][block_idx] = ident
+        if block_idx == 0:
+            self.__group_firsts[group_idx] = ident
+
+    def __build(self, chars) -> None:
+        """
+        Replace content with ordered characters
+        :type chars: List[Character]
+        """
+        blocks: List[Block] = []
+        for char in chars:
+            if blocks and blocks[-1].accepts(char, len(blocks[-1])):
+                blocks[-1].insert(len(blocks[-1]), char)
+            else:
+                blocks.append(Block(char))
+
+        self.__groups = [blocks[i:i + self.LOAD]
+                         for i in range(0, len(blocks), self.LOAD)]
+        self.__firsts = [[block.identifier(0) for block in group]
+                         for group in self.__groups]
+        self.__group_firsts = [firsts[0] for firsts in self.__firsts]
+        self.__len = len(chars)
+        self.__rebuild()
+
+    def __start(self, group_idx, block_idx) -> int:
+        """
+        Flat index of the first character of block
+        """
+        result = sum(map(len, self.__groups[group_idx][:max(block_idx, 0)]))
+        while group_idx:
+            result += self.__tree[group_idx]
+            group_idx -= group_idx & -group_idx
+        return result
+
+    def __select(self, idx) -> Tuple[int, int, int]:
+        """
+        Find block containing flat index
+        :type idx: int
+        :return: group index, block index in group, index inside of block
+        """
+        size = len(self.__groups)
+        pos = 0
+        mask = 1 << size.bit_length()
+        while mask:
+            nxt = pos + mask
+            if nxt <= size and self.__tree[nxt] <= idx:
+                pos = nxt
+                idx -= self.__tree[nxt]
+            mask >>= 1
+
+        block_idx = 0
+        for block in self.__groups[pos]:
+            if idx < len(block):
+                break
+            idx -= len(block)
+            block_idx += 1
+        return pos, block_idx, idx
+
+    def __update(self, group_idx, delta) -> None:
+        """
+        Add delta to character count of group at group_idx
+        """
+        group_idx += 1
+        size = len(self.__groups)
+        while group_idx <= size:
+            self.__tree[group_idx] += delta
+            group_idx += group_idx & -group_idx
+
+    def __rebuild(self) -> None:
+        """
+        Rebuild Fenwick tree of group character counts
+        """
+        size = len(self.__groups)
+        tree = [0] + [sum(map(len, group)) for group in self.__groups]
+        for idx in range(1, size + 1):
+            parent = idx + (idx & -idx)
+            if parent <= size:
+                tree[parent] += tree[idx]
+        self.__tree = tree
@@ -0,0 +1,53 @@
+from typing import Dict, Iterator, Optional, Tuple
+
+from .patch import Patch
+
+
+class CausalBuffer:
+    """
+    Operations received before the operations they depend on. Positions
+    of LSEQ are dense, so inserts are always applicable; a delete depends
+    only on the insert of its character. Deletes are held by identifier
+    and epoch of the character, as received, until the insert arrives.
+    A delete whose insert never comes, e.g. a repeated delete of a
+    removed character, would be held forever, so only MAX_SIZE latest
+    deletes are kept and older ones are dropped.
+    """
+    MAX_SIZE = 4096
+
+    def __init__(self) -> None:
+        # (epoch, identifier) -> held delete, oldest first
+        self.__deletes: Dict[Tuple, Patch] = {}
+
+    def hold(self, patch) -> None:
+        """
+        Keep delete until insert of its character arrives
+        :param patch: delete patch as received
+        :type patch: Patch
+        """
+        key = self.__key(patch)
+        self.__deletes.pop(key, None)
+        self.__deletes[key] = patch
+        if len(self.__deletes) > self.MAX_SIZE:
+            del self.__deletes[next(iter(self.__deletes))]
+
+    def release(self, patch) -> Optional[Patch]:
+        """
+        Take delete held for character of insert
+        :param patch: insert patch as received
+        :type patch: Patch
+        :return: held delete or None if there is none
+        """
+        if not self.__deletes:
+            return None
+        return self.__deletes.pop(self.__key(patch), None)
+
+    @staticmethod
+    def __key(patch) -> Tuple:
+        return patch.epoch, patch.character.identifier
+
+    def __iter__(self) -> Iterator[Patch]:
+        return iter(self.__deletes.values())
+
+    def __len__(self) -> int:
+        return len(self.__deletes)
@@ -5,7 +5,11 @@ class CharPosition:
     """
     Defines a character pos in CRDT document tree.
     Every element is part of the tree path.
+    Position is immutable once created: tree path is stored only as
+    precomputed comparison key, position and sites are derived from it.
     """
+    __slots__ = ("base_bits", "key")
+
     BASE_BITS = 5
 
     def __init__(self, position=None, sites=None, base_bits=0) -> None:
@@ -17,9 +21,65 @@ class CharPosition:
         :type sites: List[int]
         :type base_bits: int
         """
-        self.position = position or []
-        self.sites = sites or []
         self.base_bits = base_bits or self.BASE_BITS
+        self.key = self.make_key(position or [], sites or [])
+
+    @property
+    def position(self) -> List[int]:
+        """
+        Tree path digits of the pos
+        """
+        return list(self.key[0::2])
+
+    @property
+    def sites(self) -> List[int]:
+        """
+        Author ids for each tree level
+        """
+        return list(self.key[1::2])
+
+    @property
+    def author(self) -> int:
+        """
+        Author id of the last tree level
+        """
+        return self.key[-1]
+
+    @staticmethod
+    def make_key(position, sites) -> Tuple[int, ...]:
+        """
+        Build comparison key: flattened (digit, site) pairs of the tree path.
+        Comparing keys is equivalent to comparing lists of pairs.
+        Paths made by the first Allocator may have more sites than digits,
+        its author id is the last site, so the last level takes it.
+        :param position: array of int specifying char pos
+        :param sites: array of author ids for each tree level
+        :type position: List[int]
+        :type sites: List[int]
+        :return: tuple (digit0, site0, digit1, site1, ...)
+        """
+        if len(sites) > len(position) > 0:
+            sites = sites[:len(position) - 1] + sites[-1:]
+        depth = min(len(position), len(sites))
+        key = [0] * (2 * depth)
+        key[0::2] = position[:depth]
+        key[1::2] = sites[:depth]
+        return tuple(key)
+
+    @classmethod
+    def from_key(cls, key, base_bits=0) -> 'CharPosition':
+        """
+        Create pos from existing comparison key
+        :param key: comparison key, as built by make_key
+        :param base_bits: pos base bits
+        :type key: Tuple[int, ...]
+        :type base_bits: int
+        :return: CharPosition object
+        """
+        result = cls.__new__(cls)
+        result.base_bits = base_bits or cls.BASE_BITS
+        result.key = key
+        return result
 
     @classmethod
     def create_from_int(cls, position, depth, sites, base_bits=0) -> \
@@ -36,16 +96,16 @@ class CharPosition:
         :type base_bits: int
         :return: generated CharPosition object
         """
-        result = cls(sites=sites, base_bits=base_bits)
+        digits = [0] * depth
 
         for curr_depth in range(depth, 0, -1):
             shift = base_bits + curr_depth - 1
 
             # ref to pdf algorithm
-            result.position.insert(0, position & (1 << shift) - 1)
+            digits[curr_depth - 1] = position & (1 << shift) - 1
             position >>= shift
 
-        return result
+        return cls(digits, sites, base_bits=base_bits)
 
     def convert_to_int(self, trim=0) -> int:
         """
@@ -54,8 +114,9 @@ class CharPosition:
         :type trim: int
         :return: integer representation of pos object
         """
-        pos_as_list = self.__cut_position(self.position, trim) if trim \
-            else self.position
+        position = self.key[0::2]
+        pos_as_list = self.__cut_position(position, trim) if trim \
+            else position
 
         result = 0
         for curr_depth, i in enumerate(pos_as_list):
@@ -73,10 +134,23 @@ class CharPosition:
         :param depth: depth level
         :type other_pos: CharPosition
         :type depth: int
+        :return: number of free positions at depth and whether they are
+        bounded only by the subtree of current pos, i.e. paths of both
+        positions have the same digit with different sites at some level
         """
-        if self.position == other_pos.position and self.sites[-1] \
-                != other_pos.sites[-1] and depth > len(self.position):
-            return self.interval_at(depth), True
+        key, other_key = self.key, other_pos.key
+        for level in range(0, min(len(key), len(other_key)), 2):
+            if key[level] != other_key[level]:
+                break
+            if key[level + 1] != other_key[level + 1]:
+                tie_depth = level // 2 + 1
+                if depth <= tie_depth:
+                    break
+                # other pos follows the whole subtree of the tie level
+                shift = sum(range(self.base_bits + tie_depth,
+                                  self.base_bits + depth))
+                upper = (self.convert_to_int(tie_depth) + 1) << shift
+                return upper - self.convert_to_int(depth) - 1, True
 
         return other_pos.convert_to_int(depth) - self.convert_to_int(
             depth) - 1, False
@@ -115,5 +189,4 @@ class CharPosition:
         """
         # order by pos
         # if equal positions, order by site id
-        return list(zip(self.position, self.sites)) < list(
-            zip(other.position, other.sites))
+        return self.key < other.key
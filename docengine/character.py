@@ -1,3 +1,5 @@
+from typing import Tuple
+
 from .char_position import CharPosition
 
 
@@ -5,6 +7,8 @@ class Character:
     """
     Represents a character in CRDT document.
     """
+    __slots__ = ("char", "position", "clock", "key")
+
     def __init__(self, char, position, clock) -> None:
         """
         :param char: character symbol
@@ -17,6 +21,7 @@ class Character:
         self.char = char
         self.position = position
         self.clock = clock
+        self.key = position.key
 
     @property
     def author(self) -> int:
@@ -24,7 +29,19 @@ class Character:
         Getter for author of character
         :return: author site id of character
         """
-        return self.position.sites[-1]
+        return self.key[-1]
+
+    @property
+    def identifier(self) -> Tuple[Tuple[int, ...], int]:
+        """
+        Unique identifier of character. Tree path of a deleted character
+        can be allocated again, so clock is part of the identifier.
+        :return: comparison key of pos and clock
+        """
+        return self.key, self.clock
 
     def __lt__(self, other) -> bool:
-        return self.position < other.position
+        # characters sharing tree path are ordered by clock
+        if self.key == other.key:
+            return self.clock < other.clock
+        return self.key < other.key
@@ -0,0 +1,228 @@
+"""
+Wire encodings of patches. Every encoding turns a batch of patches into
+a text content of a message and back. JSON is the reference encoding
+understood by every peer, binary is used when both sides negotiated it.
+"""
+import base64
+from typing import Dict, List, Tuple
+
+from .char_position import CharPosition
+from .character import Character
+from .patch import Patch
+
+
+class JsonCodec:
+    """
+    Patches as json strings, one string per patch.
+    """
+    name = "json"
+
+    def encode(self, patch) -> str:
+        """
+        Encode single patch
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: message content
+        """
+        return patch if isinstance(patch, str) else patch.to_json()
+
+    def decode(self, content) -> Patch:
+        """
+        Decode single patch
+        :param content: message content
+        :type content: str
+        :return: Patch object
+        """
+        return Patch.from_json(content)
+
+    def encode_batch(self, patches) -> List[str]:
+        """
+        Encode list of patches
+        :type patches: List[str or Patch]
+        :return: message content
+        """
+        return [self.encode(patch) for patch in patches]
+
+    def decode_batch(self, content) -> List[Patch]:
+        """
+        Decode list of patches
+        :type content: List[str]
+        :return: Patch objects
+        """
+        return [self.decode(raw) for raw in content]
+
+
+class BinaryCodec:
+    """
+    Compact binary encoding of a batch of patches, base64 encoded to fit
+    into json message envelope.
+
+    Layout: version byte, varint patch count, then for every patch
+    varint (depth << 2 | epoch changed << 1 | op), varint epoch if it
+    differs from epoch of previous patch (initially 0), depth varint
+    digits, depth site references, zigzag varint clock delta to previous
+    patch, varint utf-8 length and bytes of char. Site reference is varint
+    index into the table of sites seen earlier in the message; index equal
+    to table size is followed by zigzag varint site id which is appended
+    to the table.
+    """
+    name = "binary"
+    VERSION = 2
+    OPS = (Patch.INSERT, Patch.DELETE)
+
+    def encode(self, patch) -> str:
+        """
+        Encode single patch
+        :type patch: str or Patch
+        :return: message content
+        """
+        return self.encode_batch([patch])
+
+    def decode(self, content) -> Patch:
+        """
+        Decode single patch
+        :type content: str
+        :return: Patch object
+        """
+        patches = self.decode_batch(content)
+        if len(patches) != 1:
+            raise ValueError("Expected single patch in message")
+        return patches[0]
+
+    def encode_batch(self, patches) -> str:
+        """
+        Encode list of patches
+        :type patches: List[str or Patch]
+        :return: message content
+        """
+        return base64.b64encode(self.pack(patches)).decode("ascii")
+
+    def decode_batch(self, content) -> List[Patch]:
+        """
+        Decode list of patches
+        :type content: str
+        :return: Patch objects
+        """
+        return self.unpack(base64.b64decode(content))
+
+    def pack(self, patches) -> bytes:
+        """
+        Pack patches into binary form
+        :param patches: raw patches or Patch objects
+        :type patches: List[str or Patch]
+        :return: packed patches
+        """
+        out = bytearray([self.VERSION])
+        site_table: Dict[int, int] = {}
+        prev_clock = 0
+        prev_epoch = 0
+        patches = [Patch.parse(patch) for patch in patches]
+        self.__write_varint(out, len(patches))
+
+        for patch in patches:
+            char = patch.character
+            key = char.key
+            depth = len(key) // 2
+            epoch_changed = patch.epoch != prev_epoch
+            self.__write_varint(out, depth << 2 | epoch_changed << 1 |
+                                self.OPS.index(patch.op))
+            if epoch_changed:
+                self.__write_varint(out, patch.epoch)
+                prev_epoch = patch.epoch
+            for digit in key[0::2]:
+                self.__write_varint(out, digit)
+            for site in key[1::2]:
+                idx = site_table.get(site)
+                if idx is None:
+                    self.__write_varint(out, len(site_table))
+                    self.__write_varint(out, self.__zigzag(site))
+                    site_table[site] = len(site_table)
+                else:
+                    self.__write_varint(out, idx)
+            self.__write_varint(out, self.__zigzag(char.clock - prev_clock))
+            prev_clock = char.clock
+            encoded = char.char.encode("utf-8")
+            self.__write_varint(out, len(encoded))
+            out += encoded
+
+        return bytes(out)
+
+    def unpack(self, data) -> List[Patch]:
+        """
+        Unpack patches from binary form
+        :param data: packed patches
+        :type data: bytes
+        :return: Patch objects
+        """
+        if not data or data[0] != self.VERSION:
+            raise ValueError("Unsupported binary patch format")
+
+        site_table: List[int] = []
+        prev_clock = 0
+        epoch = 0
+        count, offset = self.__read_varint(data, 1)
+        patches = []
+        for _ in range(count):
+            header, offset = self.__read_varint(data, offset)
+            depth = header >> 2
+            if header & 2:
+                epoch, offset = self.__read_varint(data, offset)
+            position = []
+            for _ in range(depth):
+                digit, offset = self.__read_varint(data, offset)
+                position.append(digit)
+            sites = []
+            for _ in range(depth):
+                idx, offset = self.__read_varint(data, offset)
+                if idx == len(site_table):
+                    site, offset = self.__read_varint(data, offset)
+                    site_table.append(self.__unzigzag(site))
+                elif idx > len(site_table):
+                    raise ValueError("Unknown site in binary patches")
+                sites.append(site_table[idx])
+            delta, offset = self.__read_varint(data, offset)
+            prev_clock += self.__unzigzag(delta)
+            length, offset = self.__read_varint(data, offset)
+            if offset + length > len(data):
+                raise ValueError("Binary patches are truncated")
+            char = data[offset:offset + length].decode("utf-8")
+            offset += length
+            patches.append(Patch(self.OPS[header & 1], Character(
+                char, CharPosition(position, sites), prev_clock),
+                epoch=epoch))
+
+        if offset != len(data):
+            raise ValueError("Trailing data after binary patches")
+        return patches
+
+    @staticmethod
+    def __zigzag(value) -> int:
+        return value << 1 if value >= 0 else (-value << 1) - 1
+
+    @staticmethod
+    def __unzigzag(value) -> int:
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    @staticmethod
+    def __write_varint(out, value) -> None:
+        while value > 0x7F:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def __read_varint(data, offset) -> Tuple[int, int]:
+        result = 0
+        shift = 0
+        while True:
+            if offset >= len(data):
+                raise ValueError("Binary patches are truncated")
+            byte = data[offset]
+            offset += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, offset
+            shift += 7
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), BinaryCodec())}
@@ -1,28 +1,57 @@
-import json
-from typing import List
-
-from sortedcontainers import SortedList
+from itertools import groupby
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
 
 from .allocator import Allocator
+from .causal_buffer import CausalBuffer
 from .character import Character
 from .char_position import CharPosition
+from . import snapshot
+from .snapshot import SnapshotView
+from .patch import Patch
+from .mapped_storage import MappedStorage
+from .site_table import SiteTable
+from .storage import SortedListStorage
+from .text_buffer import TextBuffer
+from .translation import Translation
 
 
 class Doc:
-    def __init__(self, site=0) -> None:
+    def __init__(self, site=0, storage=None, policy=None) -> None:
         """
         Create a new document
         :param site: author id
+        :param storage: empty storage backend for document characters,
+        SortedListStorage by default
+        :param policy: allocation policy of new positions, see
+        allocation_policy module
         :type site: int
+        :type storage: SortedListStorage or BlockStorage or TrieStorage or
+        MappedStorage
+        :type policy: RandomBoundaryPolicy or AppendBiasedPolicy or
+        AdaptivePolicy
         """
-        self.__site: int = site
-        self._alloc = Allocator(self.site)
+        # author ids shared by keys of all positions
+        self.__sites = SiteTable()
+        self.__site: int = self.__sites.intern(site)
+        self._alloc = Allocator(self.site, policy)
         self.__clock: int = 0
-        self.__doc: SortedList[Character] = SortedList()
-        self.__doc.add(Character("", CharPosition([0], [-1]), self.__clock))
+        # identifier epoch, changed by rebalance
+        self.__epoch: int = 0
+        # translation of previous epoch characters
+        self.__translation: Optional[Translation] = None
+        self.__doc = storage if storage is not None else SortedListStorage()
+        # materialized text, kept in sync with self.__doc
+        self.__text = TextBuffer()
+        # deletes received before inserts of their characters
+        self.__held = CausalBuffer()
+        # sites of positions made by the first Allocator, by identifier,
+        # exported with deletes so older clients match their characters
+        self.__legacy_sites: Dict[Tuple, List[int]] = {}
+        self.__add(Character("", CharPosition([0], [-1]), self.__clock))
         base_bits = CharPosition.BASE_BITS
-        self.__doc.add(Character("", CharPosition([2 ** base_bits - 1], [-1]),
-                                 self.__clock))
+        self.__add(Character("", CharPosition([2 ** base_bits - 1], [-1]),
+                             self.__clock))
 
     def insert(self, position, char) -> str:
         """
@@ -37,10 +66,37 @@ class Doc:
         p, q = self.__doc[position].position, self.__doc[position + 1].position
 
         new_char = Character(char, self._alloc(p, q), self.__clock)
-        self.__doc.add(new_char)
+        self.__add(new_char)
+        self.__text.insert(position, char)
 
         return self.__export("i", new_char)
 
+    def insert_text(self, position, text) -> List[str]:
+        """
+        Insert text at specified document pos. Positions for the whole
+        run are allocated in one pass between its neighbours.
+        :param position: flat pos index in document text
+        :type position: int
+        :param text: text to insert
+        :type text: str
+        :return: patches with insert operation for every char
+        """
+        if not text:
+            return []
+
+        p, q = self.__doc[position].position, self.__doc[position + 1].position
+
+        patches = []
+        for char, char_pos in zip(text, self._alloc.allocate_run(p, q,
+                                                                 len(text))):
+            self.__clock += 1
+            new_char = Character(char, char_pos, self.__clock)
+            self.__add(new_char)
+            patches.append(self.__export("i", new_char))
+        self.__text.insert(position, text)
+
+        return patches
+
     def delete(self, position) -> str:
         """
         Delete char from specified document pos
@@ -48,32 +104,227 @@ class Doc:
         :type position: int
         :return: patch with specified delete operation
         """
-        self.__clock += 1
+        # deletes take no clock, so clocks of inserts of a site are
+        # consecutive and version vectors of peers stay compact
         old_char = self.__doc[position + 1]
-        self.__doc.remove(old_char)
+        self.__remove(old_char)
+        self.__text.delete(position, 1)
         return self.__export("d", old_char)
 
-    def apply_patch(self, raw_patch) -> None:
+    def delete_range(self, start, end) -> List[str]:
+        """
+        Delete contiguous range of chars from document
+        :param start: flat pos index of first char to delete
+        :param end: flat pos index after last char to delete
+        :type start: int
+        :type end: int
+        :return: patches with delete operation for every char
+        """
+        if end <= start:
+            return []
+
+        old_chars = self.__doc.delete_range(start + 1, end + 1)
+        self.__text.delete(start, end - start)
+        return [self.__export("d", old_char) for old_char in old_chars]
+
+    def apply_patch(self, patch) -> bool:
+        """
+        Apply existing patch to internal document. Delete of a character
+        which is not in the document is held until its insert arrives,
+        then neither is applied. Repeated deletes of removed characters
+        cannot be told from early ones and are held as well, until they
+        are dropped by the bounded buffer; callers which know inserts
+        applied before should skip them.
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: whether document has changed
+        """
+        patch = Patch.parse(patch)
+        if patch.op == Patch.INSERT:
+            self.__advance_clock(patch.character)
+            if self.__held.release(patch) is not None:
+                # deleted before it arrived
+                return False
+            new_char = self.__parse(patch).character
+            if self.__find(new_char) is not None:
+                # already applied, e.g. own insert of previous epoch
+                return False
+            self.__add(new_char)
+            self.__keep_sites(patch, new_char)
+            self.__text.insert(self.__doc.index(new_char) - 1, new_char.char)
+        elif patch.op == Patch.DELETE:
+            old_char = self.__find_deleted(patch)
+            if old_char is None:
+                self.__held.hold(patch)
+                return False
+            self.__text.delete(self.__doc.index(old_char) - 1, 1)
+            self.__remove(old_char)
+        return True
+
+    def apply_patches(self, patches) -> None:
+        """
+        Apply batch of existing patches to internal document, e.g. on
+        initial file load. All inserts are merged into the sorted sequence
+        with a single sort and the text is rebuilt once. Patches may come
+        in any order, deletes of characters inserted neither in the batch
+        nor before are held like in apply_patch.
+        :param patches: raw patches or Patch objects
+        :type patches: List[str or Patch]
+        """
+        inserted: Dict[Tuple, Character] = {}
+        deleted = []
+        for patch in map(Patch.parse, patches):
+            if patch.op == Patch.INSERT:
+                self.__advance_clock(patch.character)
+                if self.__held.release(patch) is not None:
+                    continue
+                char = self.__parse(patch).character
+                if self.__find(char) is None:
+                    inserted[char.identifier] = char
+                    self.__keep_sites(patch, char)
+            elif patch.op == Patch.DELETE:
+                deleted.append(patch)
+
+        remaining = []
+        for patch in deleted:
+            try:
+                char = self.__parse(patch).character
+            except KeyError:
+                # unknown character of previous epoch
+                self.__held.hold(patch)
+                continue
+            if char.identifier in inserted:
+                del inserted[char.identifier]
+            else:
+                remaining.append(patch)
+
+        self.__update(inserted.values())
+        for patch in remaining:
+            old_char = self.__find_deleted(patch)
+            if old_char is None:
+                self.__held.hold(patch)
+            else:
+                self.__remove(old_char)
+
+        self.__text.reset("".join([c.char for c in self.__doc]))
+
+    def snapshot(self) -> bytes:
+        """
+        Serialize document into compact columnar snapshot
+        :return: snapshot bytes
+        """
+        return snapshot.dump(self.__doc.islice(1, len(self.__doc) - 1),
+                             self.__clock, self.__epoch)
+
+    @classmethod
+    def from_snapshot(cls, data, site=0) -> 'Doc':
+        """
+        Create document from snapshot. Clock of snapshot is continued only
+        by an author of its chars, others number inserts from 1 as their
+        peers expect.
+        :param data: snapshot bytes
+        :param site: author id
+        :type data: bytes
+        :type site: int
+        :return: hydrated document
+        """
+        doc = cls(site)
+        header = snapshot.read_header(data)
+        clock = header.clock if site in snapshot.read_sites(data) else 0
+        doc.__load(snapshot.load(data, doc.__sites.intern), clock)
+        doc.__epoch = header.epoch
+        return doc
+
+    @classmethod
+    def open_snapshot(cls, path, site=0) -> 'Doc':
+        """
+        Open snapshot file lazily. The file is memory-mapped and characters
+        are materialized only when an edit or a query touches them. Clock
+        is continued as in from_snapshot.
+        :param path: snapshot file path
+        :param site: author id
+        :type path: str
+        :type site: int
+        :return: document over the mapped snapshot
+        """
+        view = SnapshotView.open(path)
+        doc = cls(site, storage=MappedStorage(view))
+        if site in view.sites:
+            doc.__clock = max(doc.__clock, view.header.clock)
+        doc.__epoch = view.header.epoch
+        doc.__text.reset(view.text)
+        return doc
+
+    def __load(self, chars, clock) -> None:
         """
-        Apply existing patch to internal document
-        :param raw_patch: raw patch
-        :type raw_patch: str
+        Fill empty document with ordered characters
+        :param chars: document characters in order, without sentinels,
+        with keys referencing interned site ids
+        :param clock: document clock
+        :type chars: List[Character]
+        :type clock: int
         """
-        patch = json.loads(raw_patch)
-        if patch["op"] == "i":
-            patch = Character(patch["char"], CharPosition(
-                patch["pos"], patch["sites"]), patch["clock"])
-            self.__doc.add(patch)
-        elif patch["op"] == "d":
-            patch = next(c for c in self.__doc if
-                         c.position.position == patch["pos"] and
-                         c.position.sites == patch["sites"] and
-                         c.clock == patch["clock"]
-                         )
-            self.__doc.remove(patch)
+        self.__doc.update(chars)
+        self.__clock = max(self.__clock, clock)
+        self.__text.reset("".join([c.char for c in self.__doc]))
 
-    @staticmethod
-    def __export(op, char) -> str:
+    def __advance_clock(self, char) -> None:
+        """
+        Continue clock after own inserted character, e.g. when document is
+        built again from history, so clocks of own inserts are not reused
+        :type char: Character
+        """
+        if char.author == self.__site:
+            self.__clock = max(self.__clock, char.clock)
+
+    def __add(self, char) -> None:
+        """
+        Add character to the sorted sequence
+        :type char: Character
+        """
+        self.__sites.intern_char(char)
+        self.__doc.add(char)
+
+    def __update(self, chars) -> None:
+        """
+        Add batch of characters to the sorted sequence
+        :type chars: Iterable[Character]
+        """
+        chars = list(chars)
+        for char in chars:
+            self.__sites.intern_char(char)
+        self.__doc.update(chars)
+
+    def __remove(self, char) -> None:
+        """
+        Remove character from the sorted sequence
+        :type char: Character
+        """
+        self.__doc.remove(char)
+
+    def __find(self, char):
+        """
+        Look up a character of the document by CRDT identifier
+        :param char: character with the same identifier
+        :type char: Character
+        :return: matching Character or None
+        """
+        return self.__doc.find(char)
+
+    def __find_deleted(self, patch) -> Optional[Character]:
+        """
+        Look up character of delete patch
+        :param patch: delete patch as received
+        :type patch: Patch
+        :return: matching Character or None if it is not in the document
+        """
+        try:
+            return self.__find(self.__parse(patch).character)
+        except KeyError:
+            # unknown character of previous epoch
+            return None
+
+    def __export(self, op, char) -> str:
         """
         Export serialized operation on specified character.
         :param op: operation (insert/delete)
@@ -82,23 +333,135 @@ class Doc:
         :type char: Character
         :return: operation serialized as json
         """
-        patch = {
-            "op": op,
-            "char": char.char,
-            "pos": char.position.position,
-            "sites": char.position.sites,
-            "clock": char.clock,
-        }
-        return json.dumps(patch, sort_keys=True)
+        sites = self.__legacy_sites.get(char.identifier) \
+            if self.__legacy_sites else None
+        return Patch(op, char, epoch=self.__epoch, sites=sites).to_json()
+
+    def __keep_sites(self, patch, char) -> None:
+        """
+        Remember sites of inserted pos made by the first Allocator
+        :param patch: insert patch as received
+        :param char: inserted character
+        :type patch: Patch
+        :type char: Character
+        """
+        if patch.sites is not None and patch.epoch == self.__epoch:
+            self.__legacy_sites[char.identifier] = patch.sites
+
+    def rebalance(self, pending=()) -> List[str]:
+        """
+        Replace positions of all characters with compact evenly spread
+        ones and start a new identifier epoch. Positions depend only on
+        document content, so sites which rebalance the same content agree
+        on them. Patches of the previous epoch are translated on apply.
+        :param pending: own patches of current epoch not applied by other
+        sites yet; rebalanced content is the one without them, and they
+        are translated like remote patches of previous epoch
+        :type pending: List[str or Patch]
+        :return: pending patches translated to the new epoch
+        """
+        pending = [Patch.parse(patch) for patch in pending]
+        inserted = {patch.character.identifier for patch in pending
+                    if patch.op == Patch.INSERT}
+        chars = list(self.__doc.islice(1, len(self.__doc) - 1))
+        agreed = [char for char in chars if char.identifier not in inserted]
+        deleted = [patch.character for patch in pending
+                   if patch.op == Patch.DELETE and
+                   patch.character.identifier not in inserted]
+        if deleted:
+            agreed = sorted(agreed + deleted)
+
+        first, last = self.__doc[0], self.__doc[len(self.__doc) - 1]
+        layout = self._alloc.spread(first.position, last.position,
+                                    len(agreed))
+        self.__translation = Translation(agreed, layout, first)
+        # new positions have a site per tree level
+        self.__legacy_sites.clear()
+
+        new_chars = []
+        idx = 0
+        for char in chars:
+            if char.identifier in inserted:
+                new_chars.append(self.__translation.place(char))
+                continue
+            # agreed chars also hold chars of pending deletes
+            while agreed[idx] is not char:
+                idx += 1
+            new_chars.append(self.__translation.at(idx, char))
+        self.__doc.delete_range(1, len(self.__doc) - 1)
+        self.__update(new_chars)
+        self.__text.reset("".join([c.char for c in self.__doc]))
+        self.__epoch += 1
+        return [Patch(patch.op, self.__translate(patch.character, True),
+                      epoch=self.__epoch).to_json() for patch in pending]
+
+    def accepts(self, patch) -> bool:
+        """
+        Check if patch can be applied at current epoch. Patches of the
+        previous epoch are accepted while its translation is known, i.e.
+        not after document was loaded from snapshot.
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: whether patch can be applied
+        """
+        epoch = Patch.parse(patch).epoch
+        return epoch == self.__epoch or epoch == self.__epoch - 1 and \
+            self.__translation is not None
+
+    def __parse(self, patch) -> Patch:
+        """
+        Get Patch object at current epoch
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: Patch object, translated if it is of previous epoch
+        """
+        patch = Patch.parse(patch)
+        if patch.epoch == self.__epoch:
+            return patch
+        if patch.epoch != self.__epoch - 1 or self.__translation is None:
+            raise ValueError(f"Patch of epoch {patch.epoch} cannot be "
+                             f"applied at epoch {self.__epoch}")
+
+        return Patch(patch.op, self.__translate(
+            patch.character, patch.op == Patch.INSERT), epoch=self.__epoch)
+
+    def __translate(self, char, insert) -> Character:
+        """
+        Get character of previous epoch at current epoch
+        :param char: character of previous epoch
+        :param insert: whether char may be unknown, i.e. is inserted
+        :type char: Character
+        :type insert: bool
+        :return: translated character
+        """
+        new_char = self.__translation.find(char)
+        if new_char is not None:
+            return new_char
+        if not insert:
+            raise KeyError("Deleted character is not in the document")
+        # char inserted concurrently with rebalance
+        return self.__translation.place(char)
 
     def get_real_position(self, patch):
-        json_char = json.loads(patch)
-        idx = next((i for i, c in enumerate(self.__doc) if
-                    c.position.position == json_char["pos"] and
-                    c.position.sites == json_char["sites"] and
-                    c.clock == json_char["clock"]
-                    ), None)
-        return idx
+        """
+        Resolve flat index of the character referenced by patch.
+        Uses bisect over the sorted sequence, so costs O(log n).
+        For delete patches must be called before the patch is applied.
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: index of the character in sequence or None if not present
+        """
+        try:
+            probe = self.__parse(patch).character
+        except KeyError:
+            # deleted character of previous epoch which is not known
+            return None
+        idx = self.__doc.bisect_left(probe)
+        if idx < len(self.__doc):
+            char = self.__doc[idx]
+            if char.identifier == probe.identifier:
+                return idx
+        return None
 
     @property
     def site(self) -> int:
@@ -111,12 +474,113 @@ class Doc:
         :param value: author site id
         :type value: int
         """
-        self.__site = value
-        self._alloc = Allocator(value)
+        self.__site = self.__sites.intern(value)
+        self._alloc = Allocator(self.__site, self._alloc.policy)
 
     @property
     def text(self) -> str:
-        return "".join([c.char for c in self.__doc])
+        return str(self.__text)
+
+    def text_range(self, start, end) -> str:
+        """
+        Get fragment of document text without building the whole text
+        :param start: flat pos index of first char
+        :param end: flat pos index after last char
+        :type start: int
+        :type end: int
+        :return: text fragment
+        """
+        return self.__text.slice(start, end)
+
+    @property
+    def version(self) -> int:
+        """
+        Version of document text, increased by every local or remote edit
+        """
+        return self.__text.version
+
+    def changes_since(self, version) -> Optional[List[Tuple[int, int, int]]]:
+        """
+        Get lines changed after version, in order. Every change replaces
+        lines from line to line + removed inclusive with inserted + 1 new
+        lines.
+        :param version: document version seen by caller
+        :type version: int
+        :return: list of (line, removed, inserted) or None if all lines
+        must be treated as changed
+        """
+        return self.__text.changes_since(version)
+
+    @property
+    def line_count(self) -> int:
+        return self.__text.line_count
+
+    def line_range(self, line) -> Tuple[int, int]:
+        """
+        Get flat offsets of line, found by the newline index in
+        O(log n) instead of splitting the whole text
+        :param line: line number, starting from 0
+        :type line: int
+        :return: offset of the first char and offset after the last char
+        of line, without its newline
+        """
+        return self.__text.line_start(line), self.__text.line_end(line)
+
+    def get_line(self, line) -> str:
+        """
+        :param line: line number, starting from 0
+        :type line: int
+        :return: text of line without newline
+        """
+        return self.__text.slice(*self.line_range(line))
+
+    def line_of(self, position) -> int:
+        """
+        :param position: flat pos index in text
+        :type position: int
+        :return: number of line containing position
+        """
+        return self.__text.line_of(position)
+
+    def authors_range(self, start, end) -> List[int]:
+        """
+        Get authors of document chars between flat offsets
+        :param start: flat pos index of first char
+        :param end: flat pos index after last char
+        :type start: int
+        :type end: int
+        :return: site ids of chars
+        """
+        return [c.author for c in self.__doc.islice(start + 1, end + 1)]
+
+    def author_spans(self, start, end) -> List[Tuple[int, int, int]]:
+        """
+        Get runs of adjacent document chars written by the same author
+        :param start: flat pos index of first char
+        :param end: flat pos index after last char
+        :type start: int
+        :type end: int
+        :return: list of (start, end, site) with flat offsets of run
+        """
+        spans = []
+        offset = max(start, 0)
+        for site, chars in groupby(self.__doc.islice(offset + 1, end + 1),
+                                   key=attrgetter("author")):
+            length = sum(1 for _ in chars)
+            spans.append((offset, offset + length, site))
+            offset += length
+        return spans
+
+    @property
+    def held(self) -> List[Patch]:
+        """
+        Deletes waiting for inserts of their characters
+        """
+        return list(self.__held)
+
+    @property
+    def epoch(self) -> int:
+        return self.__epoch
 
     @property
     def authors(self) -> List[int]:
@@ -124,4 +588,5 @@ class Doc:
 
     @property
     def patch_set(self) -> set:
-        return {self.__export("i", c) for c in self.__doc[1:-1]}
+        return {self.__export("i", c)
+                for c in self.__doc.islice(1, len(self.__doc) - 1)}
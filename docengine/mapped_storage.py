@@ -0,0 +1,238 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from .character import Character
+from .snapshot import SnapshotView
+from .storage import SortedListStorage
+
+
+class MappedStorage:
+    """
+    Storage backend of Doc over a snapshot view, e.g. of a memory-mapped
+    file. Characters of the snapshot are materialized only when they are
+    accessed; edits are kept as an overlay of added characters and
+    removed snapshot indexes. Flat index lookups merge both sequences in
+    O(log^2 n).
+    """
+    def __init__(self, view) -> None:
+        """
+        :param view: snapshot to start from
+        :type view: SnapshotView
+        """
+        self.__base = view
+        self.__added = SortedListStorage()
+        # indexes of removed snapshot characters
+        self.__removed: SortedList = SortedList()
+        # materialized snapshot characters by snapshot index
+        self.__materialized: Dict[int, Character] = {}
+
+    @property
+    def materialized(self) -> int:
+        """
+        Number of materialized snapshot characters
+        """
+        return len(self.__materialized)
+
+    def add(self, char) -> None:
+        """
+        Add character to the overlay
+        :type char: Character
+        """
+        self.__added.add(char)
+
+    def update(self, chars) -> None:
+        """
+        Add batch of characters to the overlay
+        :type chars: Iterable[Character]
+        """
+        self.__added.update(chars)
+
+    def remove(self, char) -> None:
+        """
+        Remove character, added or from snapshot
+        :type char: Character
+        """
+        if self.__added.find(char) is char:
+            self.__added.remove(char)
+            return
+
+        idx = self.__find_base(char)
+        if idx is None:
+            raise ValueError(f"{char} is not in storage")
+        self.__removed.add(idx)
+        self.__materialized.pop(idx, None)
+
+    def delete_range(self, start, stop) -> List[Character]:
+        """
+        Remove characters between indexes
+        :param start: index of first character
+        :param stop: index after last character
+        :type start: int
+        :type stop: int
+        :return: removed characters
+        """
+        old_chars = [self[idx] for idx in range(start, stop)]
+        for old_char in old_chars:
+            self.remove(old_char)
+        return old_chars
+
+    def find(self, char) -> Optional[Character]:
+        """
+        Look up character with the same identifier, materializing it if
+        it is in snapshot
+        :type char: Character
+        :return: stored Character or None
+        """
+        added = self.__added.find(char)
+        if added is not None:
+            return added
+        idx = self.__find_base(char)
+        return None if idx is None else self.__materialize(idx)
+
+    def bisect_left(self, char) -> int:
+        """
+        :type char: Character
+        :return: index to insert char to keep order
+        """
+        base_idx = self.__bisect_base(char)
+        return base_idx - self.__removed.bisect_left(base_idx) + \
+            self.__added.bisect_left(char)
+
+    def index(self, char) -> int:
+        """
+        :type char: Character
+        :return: index of stored char
+        """
+        idx = self.bisect_left(char)
+        if idx >= len(self) or self[idx] is not char:
+            raise ValueError(f"{char} is not in storage")
+        return idx
+
+    def islice(self, start, stop) -> Iterator[Character]:
+        """
+        Iterate over characters between indexes by merging snapshot and
+        added characters. Characters which were not accessed before are
+        created for iteration only.
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+
+        added_idx, live_before = self.__locate(start)
+        base_idx = self.__select_base(live_before)
+        removed_idx = self.__removed.bisect_left(base_idx)
+        base_len = len(self.__base)
+        for _ in range(start, stop):
+            while removed_idx < len(self.__removed) and \
+                    self.__removed[removed_idx] == base_idx:
+                base_idx += 1
+                removed_idx += 1
+            if base_idx < base_len and (
+                    added_idx == len(self.__added) or
+                    self.__base_less(base_idx, self.__added[added_idx])):
+                char = self.__materialized.get(base_idx)
+                yield char if char is not None else \
+                    self.__base.character(base_idx)
+                base_idx += 1
+            else:
+                yield self.__added[added_idx]
+                added_idx += 1
+
+    def __getitem__(self, idx) -> Character:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("storage index out of range")
+
+        added_idx, live_before = self.__locate(idx)
+        if added_idx < len(self.__added) and \
+                self.__rank(added_idx) == idx:
+            return self.__added[added_idx]
+        return self.__materialize(self.__select_base(live_before))
+
+    def __len__(self) -> int:
+        return len(self.__base) - len(self.__removed) + len(self.__added)
+
+    def __iter__(self) -> Iterator[Character]:
+        return self.islice(0, len(self))
+
+    def __locate(self, idx) -> Tuple[int, int]:
+        """
+        Split flat index between added and snapshot characters
+        :param idx: flat index
+        :type idx: int
+        :return: number of added chars and number of live snapshot chars
+        ordered before idx
+        """
+        low, high = 0, len(self.__added)
+        while low < high:
+            mid = (low + high) // 2
+            if self.__rank(mid) < idx:
+                low = mid + 1
+            else:
+                high = mid
+        return low, idx - low
+
+    def __rank(self, added_idx) -> int:
+        """
+        Flat index of added character
+        """
+        char = self.__added[added_idx]
+        base_idx = self.__bisect_base(char)
+        return added_idx + base_idx - self.__removed.bisect_left(base_idx)
+
+    def __select_base(self, live_idx) -> int:
+        """
+        Snapshot index of live_idx-th not removed snapshot character
+        """
+        low, high = live_idx, len(self.__base)
+        while low < high:
+            mid = (low + high) // 2
+            if mid + 1 - self.__removed.bisect_right(mid) <= live_idx:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def __bisect_base(self, char) -> int:
+        """
+        Number of snapshot characters ordered before char
+        """
+        low, high = 0, len(self.__base)
+        while low < high:
+            mid = (low + high) // 2
+            if self.__base_less(mid, char):
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def __base_less(self, idx, char) -> bool:
+        """
+        Check if snapshot character at idx is ordered before char
+        """
+        key = self.__base.key(idx)
+        if key == char.key:
+            return self.__base.clock(idx) < char.clock
+        return key < char.key
+
+    def __find_base(self, char) -> Optional[int]:
+        """
+        Snapshot index of live character with the same identifier
+        """
+        idx = self.__bisect_base(char)
+        if idx < len(self.__base) and self.__base.key(idx) == char.key and \
+                self.__base.clock(idx) == char.clock and \
+                idx not in self.__removed:
+            return idx
+        return None
+
+    def __materialize(self, idx) -> Character:
+        """
+        Get snapshot character, creating it on first access
+        """
+        char = self.__materialized.get(idx)
+        if char is None:
+            char = self.__materialized[idx] = self.__base.character(idx)
+        return char
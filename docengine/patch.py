@@ -0,0 +1,94 @@
+import json
+
+from .char_position import CharPosition
+from .character import Character
+
+
+class Patch:
+    """
+    Operation on a single character of CRDT document.
+    Created once from its serialized form and passed through the
+    receive pipeline as is.
+    """
+    __slots__ = ("op", "character", "raw", "epoch", "sites")
+
+    INSERT = "i"
+    DELETE = "d"
+
+    def __init__(self, op, character, raw=None, epoch=0,
+                 sites=None) -> None:
+        """
+        :param op: operation (insert/delete)
+        :param character: character the operation applies to
+        :param raw: serialized patch, if patch was received from network
+        :param epoch: identifier epoch of document the patch was made at
+        :param sites: author ids of pos as made by the first Allocator, if
+        there are more of them than tree levels, see CharPosition.make_key
+        :type op: str
+        :type character: Character
+        :type raw: str
+        :type epoch: int
+        :type sites: List[int]
+        """
+        self.op = op
+        self.character = character
+        self.raw = raw
+        self.epoch = epoch
+        self.sites = sites
+
+    @classmethod
+    def from_json(cls, raw) -> 'Patch':
+        """
+        Deserialize patch
+        :param raw: patch serialized as json
+        :type raw: str
+        :return: Patch object
+        """
+        patch = json.loads(raw)
+        sites = patch["sites"]
+        return cls(patch["op"], Character(patch["char"], CharPosition(
+            patch["pos"], sites), patch["clock"]), raw,
+            patch.get("epoch", 0),
+            sites if len(sites) > len(patch["pos"]) else None)
+
+    @classmethod
+    def parse(cls, patch) -> 'Patch':
+        """
+        Get Patch object from raw patch or return provided one
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: Patch object
+        """
+        if isinstance(patch, cls):
+            return patch
+        return cls.from_json(patch)
+
+    def to_json(self) -> str:
+        """
+        Serialize patch
+        :return: patch serialized as json
+        """
+        if self.raw is None:
+            char = self.character
+            patch = {
+                "op": self.op,
+                "char": char.char,
+                "pos": char.position.position,
+                "sites": self.sites if self.sites is not None
+                else char.position.sites,
+                "clock": char.clock,
+            }
+            # patches of the initial epoch keep their original form
+            if self.epoch:
+                patch["epoch"] = self.epoch
+            self.raw = json.dumps(patch, sort_keys=True)
+        return self.raw
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Patch):
+            return NotImplemented
+        return self.op == other.op and \
+            self.character.identifier == other.character.identifier
+
+    def __hash__(self) -> int:
+        return hash((self.op, self.character.identifier))
@@ -0,0 +1,57 @@
+from typing import Dict, Iterator, Tuple
+
+from .char_position import CharPosition
+
+
+class SiteTable:
+    """
+    Per-document table of author ids. Site ids of positions decoded from
+    patches or snapshots are separate int objects; the table replaces them
+    with shared ones, so keys of all positions reference a single object
+    per author.
+    """
+    def __init__(self) -> None:
+        self.__sites: Dict[int, int] = {}
+
+    def intern(self, site) -> int:
+        """
+        :param site: author id
+        :type site: int
+        :return: shared int object equal to site
+        """
+        return self.__sites.setdefault(site, site)
+
+    def intern_key(self, key) -> Tuple[int, ...]:
+        """
+        :param key: comparison key of pos
+        :type key: Tuple[int, ...]
+        :return: equal key referencing shared site ids, key itself if it
+        already does
+        """
+        sites = self.__sites
+        if all(sites.get(site) is site for site in key[1::2]):
+            return key
+        result = list(key)
+        result[1::2] = [sites.setdefault(site, site) for site in key[1::2]]
+        return tuple(result)
+
+    def intern_char(self, char) -> None:
+        """
+        Make key of char reference shared site ids. Positions are
+        immutable, so char gets a new position with interned key.
+        :type char: Character
+        """
+        key = self.intern_key(char.key)
+        if key is not char.key:
+            char.position = CharPosition.from_key(key,
+                                                  char.position.base_bits)
+            char.key = key
+
+    def __contains__(self, site) -> bool:
+        return site in self.__sites
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.__sites)
+
+    def __len__(self) -> int:
+        return len(self.__sites)
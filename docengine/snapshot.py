@@ -0,0 +1,304 @@
+"""
+Columnar snapshot of document characters.
+
+Layout, all integers little-endian:
+    header      magic, version, flags, base bits, char count,
+                digit count, site table size, text size, clock, epoch
+    sites       site table, int64 per distinct site id
+    clocks      uint64 per char
+    digits      uint32 per tree level of every char
+    site refs   uint32 index into site table per tree level of every char
+    lengths     uint32 char length per char, only with FLAG_LENGTHS
+    depths      uint8 per char
+    text        utf-8 text of all chars
+Columns are ordered by item size, so every column is aligned and can be
+used in place as a memoryview.
+Sentinel characters of the document are not stored.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate, chain
+from typing import Iterable, List, NamedTuple, Tuple
+
+from .char_position import CharPosition
+from .character import Character
+
+MAGIC = b"MTSN"
+VERSION = 2
+FLAG_LENGTHS = 1
+HEADER = struct.Struct("<4sBBBxIIIIQQ")
+
+
+class SnapshotHeader(NamedTuple):
+    """
+    Decoded snapshot header
+    """
+    flags: int
+    base_bits: int
+    count: int
+    digits: int
+    sites: int
+    text_size: int
+    clock: int
+    epoch: int
+    size: int = HEADER.size
+
+
+def dump(chars, clock, epoch=0) -> bytes:
+    """
+    Serialize characters into snapshot
+    :param chars: document characters in order, without sentinels
+    :param clock: document clock
+    :param epoch: identifier epoch of document
+    :type chars: Iterable[Character]
+    :type clock: int
+    :type epoch: int
+    :return: snapshot bytes
+    """
+    site_table = {}
+    depths = array("B")
+    clocks = array("Q")
+    digits = array("I")
+    site_refs = array("I")
+    lengths = array("I")
+    text = []
+    base_bits = CharPosition.BASE_BITS
+
+    for char in chars:
+        key = char.key
+        depths.append(len(key) // 2)
+        clocks.append(char.clock)
+        digits.extend(key[0::2])
+        for site in key[1::2]:
+            site_refs.append(site_table.setdefault(site, len(site_table)))
+        lengths.append(len(char.char))
+        text.append(char.char)
+        base_bits = char.position.base_bits
+
+    flags = FLAG_LENGTHS if any(length != 1 for length in lengths) else 0
+    encoded_text = "".join(text).encode("utf-8")
+    header = HEADER.pack(MAGIC, VERSION, flags, base_bits, len(depths),
+                         len(digits), len(site_table), len(encoded_text),
+                         clock, epoch)
+    columns = [array("q", site_table), clocks, digits, site_refs]
+    if flags & FLAG_LENGTHS:
+        columns.append(lengths)
+    columns.append(depths)
+
+    return b"".join([header] + [_to_bytes(column) for column in columns] +
+                    [encoded_text])
+
+
+def read_header(data) -> SnapshotHeader:
+    """
+    Read and validate snapshot header
+    :param data: snapshot bytes
+    :type data: bytes or memoryview
+    :return: decoded header
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Snapshot is truncated")
+    magic, version = struct.unpack_from("<4sB", data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unsupported snapshot format")
+    return SnapshotHeader(*HEADER.unpack_from(data)[2:])
+
+
+def read_sites(data) -> List[int]:
+    """
+    Read site table of snapshot
+    :param data: snapshot bytes
+    :type data: bytes or memoryview
+    :return: author ids of all char positions
+    """
+    header = read_header(data)
+    return list(_read_column(data, header.size, "q", header.sites)[0])
+
+
+def load(data, intern=None) -> List[Character]:
+    """
+    Deserialize characters from snapshot in a single linear pass
+    :param data: snapshot bytes
+    :param intern: function returning shared object of site id, applied
+    once per author, e.g. SiteTable.intern of the target document
+    :type data: bytes or memoryview
+    :type intern: Callable[[int], int]
+    :return: document characters in order, without sentinels
+    """
+    header = read_header(data)
+    offset = header.size
+    sites, offset = _read_column(data, offset, "q", header.sites)
+    clocks, offset = _read_column(data, offset, "Q", header.count)
+    digits, offset = _read_column(data, offset, "I", header.digits)
+    site_refs, offset = _read_column(data, offset, "I", header.digits)
+    if header.flags & FLAG_LENGTHS:
+        lengths, offset = _read_column(data, offset, "I", header.count)
+    else:
+        lengths = None
+    depths, offset = _read_column(data, offset, "B", header.count)
+    if offset + header.text_size != len(data):
+        raise ValueError("Snapshot size does not match header")
+    text = bytes(data[offset:]).decode("utf-8")
+
+    # interleave digits and sites of all tree levels into keys column,
+    # sites reference one int object per author
+    sites = list(sites) if intern is None else [intern(site)
+                                                for site in sites]
+    keys = [0] * (2 * header.digits)
+    keys[0::2] = digits
+    keys[1::2] = [sites[ref] for ref in site_refs]
+
+    chars = []
+    level = 0
+    text_pos = 0
+    base_bits = header.base_bits
+    from_key = CharPosition.from_key
+    for idx, depth in enumerate(depths):
+        end = level + 2 * depth
+        length = lengths[idx] if lengths is not None else 1
+        chars.append(Character(text[text_pos:text_pos + length],
+                               from_key(tuple(keys[level:end]), base_bits),
+                               clocks[idx]))
+        level = end
+        text_pos += length
+
+    return chars
+
+
+class SnapshotView:
+    """
+    Random access to characters of a snapshot without loading it.
+    On little-endian platforms columns are zero-copy views into the
+    snapshot buffer, so only the decoded text and per-char offsets into
+    the digit columns are allocated on open.
+    """
+    def __init__(self, data) -> None:
+        """
+        :param data: snapshot bytes or buffer, e.g. mmap
+        :type data: bytes or mmap.mmap
+        """
+        self.header = read_header(data)
+        view = memoryview(data)
+        offset = self.header.size
+        sites, offset = self.__column(view, offset, "q", self.header.sites)
+        # one int object per author, shared by materialized keys
+        self.__sites = list(sites)
+        self.__clocks, offset = self.__column(view, offset, "Q",
+                                              self.header.count)
+        self.__digits, offset = self.__column(view, offset, "I",
+                                              self.header.digits)
+        self.__site_refs, offset = self.__column(view, offset, "I",
+                                                 self.header.digits)
+        if self.header.flags & FLAG_LENGTHS:
+            lengths, offset = self.__column(view, offset, "I",
+                                            self.header.count)
+            self.__text_offsets = array(
+                "Q", chain([0], accumulate(lengths)))
+        else:
+            self.__text_offsets = None
+        depths, offset = self.__column(view, offset, "B", self.header.count)
+        if offset + self.header.text_size != len(view):
+            raise ValueError("Snapshot size does not match header")
+        self.text = str(view[offset:], "utf-8")
+        # offset of first tree level of every char in digits column
+        self.__levels = array("Q", chain([0], accumulate(depths)))
+
+    @classmethod
+    def open(cls, path) -> 'SnapshotView':
+        """
+        Map snapshot file into memory
+        :param path: snapshot file path
+        :type path: str
+        :return: view of mapped snapshot
+        """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # empty file cannot be mapped, it is rejected as truncated
+                return cls(b"")
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def key(self, idx) -> Tuple[int, ...]:
+        """
+        :param idx: char index in snapshot
+        :type idx: int
+        :return: comparison key of char pos
+        """
+        start, end = self.__levels[idx], self.__levels[idx + 1]
+        key = [0] * (2 * (end - start))
+        key[0::2] = self.__digits[start:end]
+        key[1::2] = [self.__sites[ref] for ref in self.__site_refs[start:end]]
+        return tuple(key)
+
+    def clock(self, idx) -> int:
+        """
+        :param idx: char index in snapshot
+        :type idx: int
+        :return: clock of char
+        """
+        return self.__clocks[idx]
+
+    def character(self, idx) -> Character:
+        """
+        Materialize char
+        :param idx: char index in snapshot
+        :type idx: int
+        :return: new Character object
+        """
+        if self.__text_offsets is None:
+            char = self.text[idx]
+        else:
+            char = self.text[self.__text_offsets[idx]:
+                             self.__text_offsets[idx + 1]]
+        return Character(char, CharPosition.from_key(
+            self.key(idx), self.header.base_bits), self.__clocks[idx])
+
+    @property
+    def sites(self) -> List[int]:
+        """
+        :return: author ids of all char positions
+        """
+        return self.__sites
+
+    def __len__(self) -> int:
+        return self.header.count
+
+    @staticmethod
+    def __column(view, offset, typecode, count):
+        """
+        Column of count items, in place if byte order allows it
+        :return: column and offset after it
+        """
+        if sys.byteorder != "little":
+            return _read_column(view, offset, typecode, count)
+        end = offset + struct.calcsize(typecode) * count
+        if end > len(view):
+            raise ValueError("Snapshot is truncated")
+        return view[offset:end].cast(typecode), end
+
+
+def _to_bytes(column) -> bytes:
+    """
+    Column bytes in little-endian order
+    """
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(data, offset, typecode, count):
+    """
+    Read little-endian column of count items
+    :return: column and offset after it
+    """
+    column = array(typecode)
+    end = offset + column.itemsize * count
+    if end > len(data):
+        raise ValueError("Snapshot is truncated")
+    column.frombytes(data[offset:end])
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column, end
@@ -0,0 +1,97 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from .character import Character
+
+
+class SortedListStorage:
+    """
+    Ordered storage of document characters backed by SortedList, with
+    identifier -> Character index kept in sync with the list.
+
+    Every storage backend of Doc provides the same methods.
+    """
+    def __init__(self) -> None:
+        self.__chars: SortedList = SortedList()
+        self.__index: Dict[Tuple, Character] = {}
+
+    def add(self, char) -> None:
+        """
+        Add character
+        :type char: Character
+        """
+        self.__chars.add(char)
+        self.__index[char.identifier] = char
+
+    def update(self, chars) -> None:
+        """
+        Add batch of characters, sorting them at once
+        :type chars: Iterable[Character]
+        """
+        chars = list(chars)
+        self.__chars.update(chars)
+        self.__index.update((char.identifier, char) for char in chars)
+
+    def remove(self, char) -> None:
+        """
+        Remove character, which must be an object of this storage
+        :type char: Character
+        """
+        self.__chars.remove(char)
+        del self.__index[char.identifier]
+
+    def delete_range(self, start, stop) -> List[Character]:
+        """
+        Remove characters between indexes
+        :param start: index of first character
+        :param stop: index after last character
+        :type start: int
+        :type stop: int
+        :return: removed characters
+        """
+        old_chars = self.__chars[start:stop]
+        del self.__chars[start:stop]
+        for old_char in old_chars:
+            del self.__index[old_char.identifier]
+        return old_chars
+
+    def find(self, char) -> Optional[Character]:
+        """
+        Look up character with the same identifier in O(1)
+        :type char: Character
+        :return: stored Character or None
+        """
+        return self.__index.get(char.identifier)
+
+    def bisect_left(self, char) -> int:
+        """
+        :type char: Character
+        :return: index to insert char to keep order
+        """
+        return self.__chars.bisect_left(char)
+
+    def index(self, char) -> int:
+        """
+        :param char: character stored in storage
+        :type char: Character
+        :return: index of char
+        """
+        return self.__chars.index(char)
+
+    def islice(self, start, stop) -> Iterator[Character]:
+        """
+        Iterate over characters between indexes
+        :type start: int
+        :type stop: int
+        """
+        return self.__chars.islice(start, stop)
+
+    def __getitem__(self, idx) -> Character:
+        return self.__chars[idx]
+
+    def __len__(self) -> int:
+        return len(self.__chars)
+
+    def __iter__(self) -> Iterator[Character]:
+        return iter(self.__chars)
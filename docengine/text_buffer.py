@@ -0,0 +1,299 @@
+from collections import deque
+from itertools import islice
+from typing import Deque, List, Optional, Tuple
+
+
+class TextBuffer:
+    """
+    Materialized document text stored as a list of string chunks.
+    Chunk lengths and newline counts are kept in Fenwick trees, so
+    locating an offset or a line costs O(log chunks) and every edit
+    rewrites only one chunk. Every edit bumps version and is logged as
+    a change of lines, so views of the text can update only the lines
+    touched since the version they have seen.
+    """
+    LOAD = 512
+    MAX_CHANGES = 1024
+
+    def __init__(self, text="") -> None:
+        """
+        :param text: initial text
+        :type text: str
+        """
+        self.__chunks: List[str] = []
+        self.__tree: List[int] = []
+        # Fenwick tree of newline counts of chunks
+        self.__line_tree: List[int] = []
+        self.__len = 0
+        self.__newlines = 0
+        self.__cache = None
+        self.__version = 0
+        # (line, removed newlines, inserted newlines) of latest edits
+        self.__changes: Deque[Tuple[int, int, int]] = \
+            deque(maxlen=self.MAX_CHANGES)
+        self.reset(text)
+
+    def reset(self, text) -> None:
+        """
+        Replace whole buffer content
+        :param text: new text
+        :type text: str
+        """
+        self.__chunks = [text[i:i + self.LOAD]
+                         for i in range(0, len(text), self.LOAD)] or [""]
+        self.__len = len(text)
+        self.__newlines = text.count("\n")
+        self.__cache = text
+        self.__rebuild()
+        # lines changed by earlier edits are meaningless now
+        self.__version += 1
+        self.__changes.clear()
+
+    def insert(self, offset, text) -> None:
+        """
+        Insert text at offset
+        :param offset: flat offset in text
+        :param text: text to insert
+        :type offset: int
+        :type text: str
+        """
+        if not text:
+            return
+
+        line = self.line_of(offset)
+        idx, inner = self.__locate(offset)
+        chunk = self.__chunks[idx]
+        chunk = chunk[:inner] + text + chunk[inner:]
+        newlines = text.count("\n")
+        self.__len += len(text)
+        self.__newlines += newlines
+        self.__cache = None
+
+        if len(chunk) > 2 * self.LOAD:
+            self.__chunks[idx:idx + 1] = [
+                chunk[i:i + self.LOAD]
+                for i in range(0, len(chunk), self.LOAD)]
+            self.__rebuild()
+        else:
+            self.__chunks[idx] = chunk
+            self.__update(idx, len(text), newlines)
+        self.__log(line, 0, newlines)
+
+    def delete(self, offset, length) -> None:
+        """
+        Delete length chars starting at offset
+        :param offset: flat offset in text
+        :param length: number of chars to delete
+        :type offset: int
+        :type length: int
+        """
+        length = min(length, self.__len - offset)
+        if length <= 0:
+            return
+
+        line = self.line_of(offset)
+        self.__len -= length
+        self.__cache = None
+        idx, inner = self.__locate(offset)
+        rebuild = False
+        removed_lines = 0
+        while length:
+            chunk = self.__chunks[idx]
+            removed = min(length, len(chunk) - inner)
+            if removed == 0:
+                idx, inner = idx + 1, 0
+                continue
+
+            newlines = chunk.count("\n", inner, inner + removed)
+            self.__newlines -= newlines
+            removed_lines += newlines
+            chunk = chunk[:inner] + chunk[inner + removed:]
+            length -= removed
+            if chunk or len(self.__chunks) == 1:
+                self.__chunks[idx] = chunk
+                self.__update(idx, -removed, -newlines)
+                idx, inner = idx + 1, 0
+            else:
+                del self.__chunks[idx]
+                rebuild = True
+                inner = 0
+
+        if rebuild:
+            self.__rebuild()
+        self.__log(line, removed_lines, 0)
+
+    def slice(self, start, end) -> str:
+        """
+        Get text between offsets without materializing whole buffer
+        :param start: first offset
+        :param end: offset after last char
+        :type start: int
+        :type end: int
+        :return: text fragment
+        """
+        start, end = max(start, 0), min(end, self.__len)
+        if end <= start:
+            return ""
+        if self.__cache is not None:
+            return self.__cache[start:end]
+
+        idx, inner = self.__locate(start)
+        parts = []
+        length = end - start
+        while length:
+            part = self.__chunks[idx][inner:inner + length]
+            parts.append(part)
+            length -= len(part)
+            idx, inner = idx + 1, 0
+        return "".join(parts)
+
+    @property
+    def line_count(self) -> int:
+        """
+        Number of lines, text after the last newline is a line even if it
+        is empty
+        """
+        return self.__newlines + 1
+
+    def line_start(self, line) -> int:
+        """
+        Get offset of the first char of line
+        :param line: line number, starting from 0
+        :type line: int
+        :return: flat offset in text
+        """
+        if not 0 <= line < self.line_count:
+            raise IndexError("line number out of range")
+        if not line:
+            return 0
+
+        # find chunk holding newline which ends the previous line
+        size = len(self.__chunks)
+        pos = 0
+        offset = 0
+        rest = line
+        mask = 1 << size.bit_length()
+        while mask:
+            nxt = pos + mask
+            if nxt <= size and self.__line_tree[nxt] < rest:
+                pos = nxt
+                rest -= self.__line_tree[nxt]
+                offset += self.__tree[nxt]
+            mask >>= 1
+
+        chunk = self.__chunks[pos]
+        inner = -1
+        for _ in range(rest):
+            inner = chunk.index("\n", inner + 1)
+        return offset + inner + 1
+
+    def line_end(self, line) -> int:
+        """
+        Get offset after the last char of line, without its newline
+        :param line: line number, starting from 0
+        :type line: int
+        :return: flat offset in text
+        """
+        if line + 1 < self.line_count:
+            return self.line_start(line + 1) - 1
+        if line + 1 == self.line_count:
+            return self.__len
+        raise IndexError("line number out of range")
+
+    def line_of(self, offset) -> int:
+        """
+        Get number of line containing offset
+        :param offset: flat offset in text
+        :type offset: int
+        :return: line number, starting from 0
+        """
+        offset = max(0, min(offset, self.__len))
+        idx, inner = self.__locate(offset)
+        result = self.__chunks[idx].count("\n", 0, inner)
+        while idx:
+            result += self.__line_tree[idx]
+            idx -= idx & -idx
+        return result
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    def changes_since(self, version) \
+            -> Optional[List[Tuple[int, int, int]]]:
+        """
+        Get line changes of edits made after version, in order. Every
+        change replaces lines from line to line + removed newlines
+        inclusive with inserted newlines + 1 new lines.
+        :param version: version of buffer seen by caller
+        :type version: int
+        :return: list of (line, removed newlines, inserted newlines) or
+        None if the changes are not known any more and every line must be
+        treated as changed
+        """
+        base = self.__version - len(self.__changes)
+        if not base <= version <= self.__version:
+            return None
+        return list(islice(self.__changes, version - base, None))
+
+    def __log(self, line, removed, inserted) -> None:
+        """
+        Bump version and record change of lines made by edit
+        """
+        self.__version += 1
+        self.__changes.append((line, removed, inserted))
+
+    def __locate(self, offset) -> Tuple[int, int]:
+        """
+        Find chunk containing offset
+        :param offset: flat offset in text
+        :type offset: int
+        :return: chunk index and offset inside of chunk
+        """
+        size = len(self.__chunks)
+        pos = 0
+        mask = 1 << size.bit_length()
+        while mask:
+            nxt = pos + mask
+            if nxt <= size and self.__tree[nxt] <= offset:
+                pos = nxt
+                offset -= self.__tree[nxt]
+            mask >>= 1
+
+        if pos == size:
+            return size - 1, len(self.__chunks[-1]) + offset
+        return pos, offset
+
+    def __update(self, idx, delta, newlines) -> None:
+        """
+        Add delta to length and newlines to newline count of chunk at idx
+        """
+        idx += 1
+        size = len(self.__chunks)
+        while idx <= size:
+            self.__tree[idx] += delta
+            self.__line_tree[idx] += newlines
+            idx += idx & -idx
+
+    def __rebuild(self) -> None:
+        """
+        Rebuild Fenwick trees of chunk lengths and newline counts
+        """
+        size = len(self.__chunks)
+        tree = [0] + [len(chunk) for chunk in self.__chunks]
+        line_tree = [0] + [chunk.count("\n") for chunk in self.__chunks]
+        for idx in range(1, size + 1):
+            parent = idx + (idx & -idx)
+            if parent <= size:
+                tree[parent] += tree[idx]
+                line_tree[parent] += line_tree[idx]
+        self.__tree = tree
+        self.__line_tree = line_tree
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __str__(self) -> str:
+        if self.__cache is None:
+            self.__cache = "".join(self.__chunks)
+        return self.__cache
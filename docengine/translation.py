@@ -0,0 +1,107 @@
+from typing import Dict, Optional, Tuple
+
+from . import snapshot
+from .allocator import Allocator
+from .char_position import CharPosition
+from .character import Character
+from .snapshot import SnapshotView
+
+
+class Translation:
+    """
+    Translation of characters of the previous identifier epoch to the
+    current one, see Doc.rebalance. Rebalanced characters are kept only
+    as a packed snapshot of their old identifiers; position of a found
+    one is computed from the spread layout, so the table takes about as
+    much memory as a snapshot of the document. Inserts unknown to
+    rebalance go under translated character preceding them in the
+    previous epoch and are remembered, so every patch of a character
+    gets the same translation.
+    """
+    def __init__(self, chars, layout, first) -> None:
+        """
+        :param chars: rebalanced characters of previous epoch in order
+        :param layout: layout of their new positions, see Allocator.spread
+        :param first: first sentinel character of document
+        :type chars: List[Character]
+        :type layout: Tuple[int, int, int]
+        :type first: Character
+        """
+        self.__old = SnapshotView(snapshot.dump(chars, 0))
+        self.__layout = layout
+        self.__first = first
+        # translated inserts unknown to rebalance
+        self.__placed: Dict[Tuple, Character] = {}
+
+    def find(self, char) -> Optional[Character]:
+        """
+        Translate character known to rebalance
+        :param char: character of previous epoch
+        :type char: Character
+        :return: new Character object or None if char is unknown
+        """
+        placed = self.__placed.get(char.identifier)
+        if placed is not None:
+            return placed
+        idx = self.__bisect(char)
+        if idx == len(self.__old) or self.__old.key(idx) != char.key or \
+                self.__old.clock(idx) != char.clock:
+            return None
+        return self.at(idx, char)
+
+    def at(self, idx, char) -> Character:
+        """
+        Translate character known to rebalance by its index
+        :param idx: index of char among rebalanced characters
+        :param char: character of previous epoch
+        :type idx: int
+        :type char: Character
+        :return: new Character object
+        """
+        return Character(char.char, self.__position(idx, char.author),
+                         char.clock)
+
+    def place(self, char) -> Character:
+        """
+        Translate insert unknown to rebalance, e.g. made concurrently
+        with it
+        :param char: inserted character of previous epoch
+        :type char: Character
+        :return: new Character object
+        """
+        idx = self.__bisect(char)
+        prev = self.__position(idx - 1, self.__old.key(idx - 1)[-1]) \
+            if idx else self.__first.position
+        new_char = self.__placed[char.identifier] = Character(
+            char.char, CharPosition(
+                prev.position + char.position.position,
+                prev.sites + char.position.sites,
+                base_bits=char.position.base_bits), char.clock)
+        return new_char
+
+    def __position(self, idx, author) -> CharPosition:
+        """
+        New position of rebalanced character
+        :param idx: index of character among rebalanced characters
+        :param author: author id of character
+        :type idx: int
+        :type author: int
+        """
+        return Allocator.spread_position(self.__layout, idx, author,
+                                         self.__first.position.base_bits)
+
+    def __bisect(self, char) -> int:
+        """
+        Number of rebalanced characters ordered before char
+        """
+        old = self.__old
+        low, high = 0, len(old)
+        while low < high:
+            mid = (low + high) // 2
+            key = old.key(mid)
+            if key < char.key or key == char.key and \
+                    old.clock(mid) < char.clock:
+                low = mid + 1
+            else:
+                high = mid
+        return low
@@ -0,0 +1,337 @@
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .char_position import CharPosition
+from .character import Character
+
+
+class TrieNode:
+    """
+    Node of LSEQ tree. Children are labeled by (digit, site) of the next
+    tree level and kept in label order, with number of characters in
+    every child subtree. Nodes with more than FENWICK_MIN children also
+    sum these numbers by digit in a sparse Fenwick tree, so characters
+    under preceding children are counted in O(log digits); its capacity
+    is doubled when a larger digit comes, which only takes a new root
+    node. Characters whose path ends at node are stored as (clock,
+    symbol, base bits) ordered by clock and precede all children.
+    """
+    __slots__ = ("labels", "children", "sizes", "counts", "capacity",
+                 "chars")
+
+    # fewer children are counted by a builtin sum
+    FENWICK_MIN = 64
+
+    def __init__(self) -> None:
+        # lists are created on first use, most nodes are leaves
+        self.labels: Optional[List[Tuple[int, int]]] = None
+        self.children: Optional[List['TrieNode']] = None
+        self.sizes: Optional[List[int]] = None
+        # Fenwick tree over digit + 1, only non-zero nodes are stored
+        self.counts: Optional[Dict[int, int]] = None
+        self.capacity = 1
+        self.chars: Optional[List[Tuple[int, str, int]]] = None
+
+    def child_idx(self, label) -> Tuple[int, bool]:
+        """
+        :param label: (digit, site) of tree level
+        :type label: Tuple[int, int]
+        :return: index of the first child not ordered before label and
+        whether it has the label
+        """
+        if self.labels is None:
+            return 0, False
+        idx = bisect_left(self.labels, label)
+        return idx, idx < len(self.labels) and self.labels[idx] == label
+
+    def insert_child(self, idx, label) -> 'TrieNode':
+        """
+        Add empty child
+        :param idx: index of child, as returned by child_idx
+        :param label: (digit, site) of tree level
+        :type idx: int
+        :type label: Tuple[int, int]
+        :return: new child
+        """
+        if self.labels is None:
+            self.labels, self.children, self.sizes = [], [], []
+        child = TrieNode()
+        self.labels.insert(idx, label)
+        self.children.insert(idx, child)
+        self.sizes.insert(idx, 0)
+        if self.counts is None and len(self.labels) > self.FENWICK_MIN:
+            self.counts = {}
+            for (digit, _), size in zip(self.labels, self.sizes):
+                if size:
+                    self.__add_count(digit, size)
+        return child
+
+    def resize(self, idx, delta) -> None:
+        """
+        Change number of characters in subtree of child, child is removed
+        when its subtree is empty
+        :type idx: int
+        :type delta: int
+        """
+        self.sizes[idx] += delta
+        if self.counts is not None:
+            self.__add_count(self.labels[idx][0], delta)
+        if not self.sizes[idx]:
+            del self.labels[idx]
+            del self.children[idx]
+            del self.sizes[idx]
+
+    def count_before(self, idx) -> int:
+        """
+        :param idx: index of child
+        :type idx: int
+        :return: number of characters in subtrees of preceding children
+        """
+        if self.counts is None or idx == len(self.labels):
+            return sum(self.sizes[:idx])
+        digit = self.labels[idx][0]
+        # preceding children with the same digit and smaller site
+        first = bisect_left(self.labels, (digit,), 0, idx)
+        result = sum(self.sizes[first:idx])
+        fenwick_idx = min(digit, self.capacity)
+        while fenwick_idx:
+            result += self.counts.get(fenwick_idx, 0)
+            fenwick_idx &= fenwick_idx - 1
+        return result
+
+    def find_child(self, rank) -> Tuple[int, int]:
+        """
+        :param rank: index of character among characters under children
+        :type rank: int
+        :return: index of child holding character and index of character
+        in child subtree
+        """
+        idx = 0
+        if self.counts is not None:
+            digit = 0
+            step = self.capacity
+            while step:
+                count = self.counts.get(digit + step, 0)
+                if count <= rank:
+                    digit += step
+                    rank -= count
+                step >>= 1
+            idx = bisect_left(self.labels, (digit,))
+        while rank >= self.sizes[idx]:
+            rank -= self.sizes[idx]
+            idx += 1
+        return idx, rank
+
+    def __add_count(self, digit, delta) -> None:
+        """
+        Change number of characters under children with digit in Fenwick
+        tree
+        """
+        counts = self.counts
+        idx = digit + 1
+        while idx > self.capacity:
+            # root of doubled tree covers the whole old one
+            total = counts.get(self.capacity)
+            self.capacity *= 2
+            if total:
+                counts[self.capacity] = total
+        while idx <= self.capacity:
+            count = counts.get(idx, 0) + delta
+            if count:
+                counts[idx] = count
+            else:
+                del counts[idx]
+            idx += idx & -idx
+
+    def clock_idx(self, clock) -> int:
+        """
+        :type clock: int
+        :return: index of the first character of node with clock not less
+        than clock
+        """
+        if self.chars is None:
+            return 0
+        return bisect_left(self.chars, (clock,))
+
+    def has_clock(self, idx, clock) -> bool:
+        """
+        Check if character at idx has clock
+        """
+        return self.chars is not None and idx < len(self.chars) and \
+            self.chars[idx][0] == clock
+
+    def character(self, idx, key) -> Character:
+        """
+        :param idx: index of character in node
+        :param key: comparison key of node path
+        :type idx: int
+        :type key: Tuple[int, ...]
+        :return: new Character object
+        """
+        clock, symbol, base_bits = self.chars[idx]
+        return Character(symbol, CharPosition.from_key(key, base_bits), clock)
+
+    def own(self) -> int:
+        """
+        Number of characters whose path ends at node
+        """
+        return len(self.chars) if self.chars is not None else 0
+
+
+class TrieStorage:
+    """
+    Storage backend of Doc built on the LSEQ tree itself. Shared prefixes
+    of positions are stored once, as path from the root, and characters
+    keep only clock and symbol, so they are created on access and matched
+    by identifier, not by object identity. Every node knows the number of
+    characters in its child subtrees, so flat index and identifier lookups
+    walk a single path: on every level child is found by bisect over
+    labels and preceding siblings are counted by Fenwick tree of a wide
+    node, in O(depth * log digits) in total.
+    """
+    def __init__(self) -> None:
+        self.__root = TrieNode()
+        self.__len = 0
+
+    def add(self, char) -> None:
+        key = char.key
+        node = self.__root
+        path = []
+        for level in range(0, len(key), 2):
+            label = key[level:level + 2]
+            idx, found = node.child_idx(label)
+            path.append((node, idx))
+            node = node.children[idx] if found else \
+                node.insert_child(idx, label)
+
+        entry = (char.clock, char.char, char.position.base_bits)
+        if node.chars is None:
+            node.chars = [entry]
+        else:
+            idx = node.clock_idx(char.clock)
+            if node.has_clock(idx, char.clock):
+                return
+            node.chars.insert(idx, entry)
+        for parent, idx in path:
+            parent.resize(idx, 1)
+        self.__len += 1
+
+    def update(self, chars) -> None:
+        for char in sorted(chars):
+            self.add(char)
+
+    def remove(self, char) -> None:
+        node, path = self.__walk(char.key)
+        idx = node.clock_idx(char.clock) if node is not None else 0
+        if node is None or not node.has_clock(idx, char.clock):
+            raise ValueError(f"{char} is not in storage")
+
+        del node.chars[idx]
+        if not node.chars:
+            node.chars = None
+        for parent, idx in path:
+            emptied = parent.sizes[idx] == 1
+            parent.resize(idx, -1)
+            if emptied:
+                # whole subtree is removed
+                break
+        self.__len -= 1
+
+    def delete_range(self, start, stop) -> List[Character]:
+        old_chars = list(self.islice(start, stop))
+        for old_char in old_chars:
+            self.remove(old_char)
+        return old_chars
+
+    def find(self, char) -> Optional[Character]:
+        node, _ = self.__walk(char.key)
+        if node is None:
+            return None
+        idx = node.clock_idx(char.clock)
+        return node.character(idx, char.key) \
+            if node.has_clock(idx, char.clock) else None
+
+    def bisect_left(self, char) -> int:
+        key = char.key
+        node = self.__root
+        result = 0
+        for level in range(0, len(key), 2):
+            result += node.own()
+            idx, found = node.child_idx(key[level:level + 2])
+            if idx:
+                result += node.count_before(idx)
+            if not found:
+                return result
+            node = node.children[idx]
+        return result + node.clock_idx(char.clock)
+
+    def index(self, char) -> int:
+        if self.find(char) is None:
+            raise ValueError(f"{char} is not in storage")
+        return self.bisect_left(char)
+
+    def islice(self, start, stop) -> Iterator[Character]:
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+
+        # stack of nodes with their keys and index of next child to visit
+        stack = []
+        node, key, idx = self.__root, (), start
+        while True:
+            own = node.own()
+            if idx < own:
+                break
+            child_idx, idx = node.find_child(idx - own)
+            stack.append([node, key, child_idx + 1])
+            node, key = node.children[child_idx], \
+                key + node.labels[child_idx]
+
+        count = stop - start
+        while True:
+            for char_idx in range(idx, min(node.own(), idx + count)):
+                yield node.character(char_idx, key)
+                count -= 1
+            if not count:
+                return
+            idx = 0
+            if node.children:
+                stack.append([node, key, 0])
+            while True:
+                parent, parent_key, child_idx = stack[-1]
+                if child_idx < len(parent.children):
+                    stack[-1][2] += 1
+                    node, key = parent.children[child_idx], \
+                        parent_key + parent.labels[child_idx]
+                    break
+                stack.pop()
+
+    def __getitem__(self, idx) -> Character:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("storage index out of range")
+        return next(self.islice(idx, idx + 1))
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __iter__(self) -> Iterator[Character]:
+        return self.islice(0, len(self))
+
+    def __walk(self, key) -> Tuple[Optional[TrieNode], List]:
+        """
+        Follow path of key
+        :type key: Tuple[int, ...]
+        :return: node of key or None if there is no such node, and parent
+        nodes on the path with index of the followed child
+        """
+        node = self.__root
+        path = []
+        for level in range(0, len(key), 2):
+            idx, found = node.child_idx(key[level:level + 2])
+            if not found:
+                return None, path
+            path.append((node, idx))
+            node = node.children[idx]
+        return node, path
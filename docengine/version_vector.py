@@ -0,0 +1,139 @@
+from typing import Dict, Iterator, List, Set
+
+from .patch import Patch
+
+
+class VersionVector:
+    """
+    Per-site record of applied operations. Operations of a site are
+    numbered by its clock; for every site the vector keeps the clock up to
+    which all operations were seen and a set of clocks seen out of order
+    above it. Memory is proportional to the number of authors and to the
+    number of operations in flight, not to the history length.
+    """
+    def __init__(self) -> None:
+        # site -> clock up to which all operations were seen
+        self.__clocks: Dict[int, int] = {}
+        # site -> clocks seen after a gap, above clock of site
+        self.__exceptions: Dict[int, Set[int]] = {}
+
+    def add(self, site, clock) -> bool:
+        """
+        Record operation. Clocks of a site start at 1, operations seen
+        ahead of a missing one are kept as exceptions until it arrives.
+        :param site: author id
+        :param clock: clock of operation
+        :type site: int
+        :type clock: int
+        :return: False if operation was seen before
+        """
+        if (site, clock) in self:
+            return False
+        current = self.__clocks.setdefault(site, 0)
+        if clock != current + 1:
+            self.__exceptions.setdefault(site, set()).add(clock)
+            return True
+
+        exceptions = self.__exceptions.get(site)
+        while exceptions and clock + 1 in exceptions:
+            clock += 1
+            exceptions.remove(clock)
+        if exceptions is not None and not exceptions:
+            del self.__exceptions[site]
+        self.__clocks[site] = clock
+        return True
+
+    def advance(self, site, clock) -> None:
+        """
+        Mark all operations of site up to clock as seen, e.g. after full
+        history of document was loaded
+        :param site: author id
+        :param clock: clock of the latest operation
+        :type site: int
+        :type clock: int
+        """
+        if site in self.__clocks and clock <= self.__clocks[site]:
+            return
+        self.__clocks[site] = clock
+        exceptions = self.__exceptions.pop(site, set())
+        for exception in sorted(exceptions):
+            if exception > clock:
+                self.add(site, exception)
+
+    def missing(self, patches) -> List[Patch]:
+        """
+        Select patches of history which a peer with this vector has not
+        applied, standing in for a server which cannot do it. Deletes
+        carry no clock of their own: deletes of inserts seen by peer are
+        all selected, and peer skips the ones it applied. Inserts deleted
+        in history are left out together with their deletes.
+        :param patches: full history as raw patches or Patch objects
+        :type patches: List[str or Patch]
+        :return: Patch objects in history order
+        """
+        patches = [Patch.parse(patch) for patch in patches]
+        deleted = {patch.character.identifier for patch in patches
+                   if patch.op == Patch.DELETE}
+        result = []
+        for patch in patches:
+            char = patch.character
+            seen = (char.author, char.clock) in self
+            if patch.op == Patch.DELETE:
+                if seen:
+                    result.append(patch)
+            elif not seen and char.identifier not in deleted:
+                result.append(patch)
+        return result
+
+    def to_dict(self) -> dict:
+        """
+        Serialize vector for json message
+        :return: dict with clocks and exceptions by site
+        """
+        return {"clocks": {str(site): clock
+                           for site, clock in self.__clocks.items()},
+                "exceptions": {str(site): sorted(clocks)
+                               for site, clocks in self.__exceptions.items()}}
+
+    @classmethod
+    def from_dict(cls, data) -> 'VersionVector':
+        """
+        Deserialize vector
+        :param data: result of to_dict
+        :type data: dict
+        :return: VersionVector object
+        """
+        versions = cls()
+        for site, clock in data.get("clocks", {}).items():
+            versions.advance(int(site), clock)
+        for site, clocks in data.get("exceptions", {}).items():
+            for clock in clocks:
+                versions.add(int(site), clock)
+        return versions
+
+    def __contains__(self, operation) -> bool:
+        """
+        :param operation: (site, clock) of operation
+        :type operation: Tuple[int, int]
+        """
+        site, clock = operation
+        return clock <= self.__clocks.get(site, 0) or \
+            clock in self.__exceptions.get(site, ())
+
+    def __getitem__(self, site) -> int:
+        """
+        :param site: author id
+        :type site: int
+        :return: clock up to which all operations of site were seen
+        """
+        return self.__clocks.get(site, 0)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.__clocks)
+
+    def __len__(self) -> int:
+        return len(self.__clocks)
+
+    def __repr__(self) -> str:
+        return f"VersionVector(clocks={self.__clocks}, " \
+               f"exceptions={self.__exceptions})"
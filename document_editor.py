@@ -1,6 +1,6 @@
-import json
 import random
-from typing import Tuple
+from itertools import chain
+from typing import List, Tuple
 
 from prompt_toolkit.application import get_app
 from prompt_toolkit.clipboard import ClipboardData
@@ -11,7 +11,8 @@ from prompt_toolkit.keys import Keys
 from prompt_toolkit.widgets import SearchToolbar
 
 from author_lexer import AuthorLexer
-from docengine import Doc
+from docengine import Doc, Patch
+from docengine.version_vector import VersionVector
 from message_service import MessageService
 from text_editor import TextEditor
 
@@ -25,11 +26,14 @@ class DocumentEditor:
     WINDOWS_LINE_ENDING = '\r\n'
     UNIX_LINE_ENDING = '\n'
     CR_CHAR = '\r'
+    # own insert deeper than this asks server to rebalance document
+    REBALANCE_DEPTH = 12
 
     def __init__(self, msg_service: MessageService):
         self.doc = Doc()
         self.doc.site = int(random.getrandbits(32))
-        self.patch_set = []
+        # inserts applied to doc, to skip patches received twice
+        self.versions = VersionVector()
         self.msg_service = msg_service
         self.text_field = TextEditor(
             scrollbar=True,
@@ -41,14 +45,17 @@ class DocumentEditor:
 
     def __register_patch(self, patch) -> None:
         """
-        Put provided patch to internal patch set and send patch to
-        the server using Message Service
+        Record provided patch as applied and send patch to the server
+        using Message Service
         :type patch: str
         """
-        self.patch_set.append(patch)
-        message = self.msg_service.prepare_send_request({"type": "patch",
-                                                         "content": patch})
-        self.msg_service.put_message(message)
+        patch = Patch.parse(patch)
+        if patch.op == Patch.INSERT:
+            self.versions.add(patch.character.author, patch.character.clock)
+        self.msg_service.put_patch(patch)
+        if patch.op == Patch.INSERT and \
+                len(patch.character.key) // 2 > self.REBALANCE_DEPTH:
+            self.msg_service.request_rebalance(self.doc.epoch)
 
     def do_cut(self) -> None:
         """
@@ -81,9 +88,7 @@ class DocumentEditor:
                                         self.UNIX_LINE_ENDING)
         paste_text = paste_text.replace(self.CR_CHAR, self.UNIX_LINE_ENDING)
         cursor_pos = self.text_field.buffer.cursor_position
-        for idx, char in enumerate(paste_text):
-            self.text_field.buffer.text += str(idx)
-            patch = self.doc.insert(cursor_pos + idx, char)
+        for patch in self.doc.insert_text(cursor_pos, paste_text):
             self.__register_patch(patch)
 
         self.text_field.buffer.text = self.doc.text
@@ -103,14 +108,17 @@ class DocumentEditor:
             remaining_parts = []
             new_cursor_position = self.text_field.document.cursor_position
 
-            last_end = 0
-            for start, end in self.text_field.document.selection_ranges():
-                if cut:
-                    # remove from internal doc
-                    for pos in range(end, start, -1):
-                        patch = self.doc.delete(pos - 1)
+            selection_ranges = list(
+                self.text_field.document.selection_ranges())
+            if cut:
+                # remove from internal doc, last range first to keep
+                # offsets of preceding ranges valid
+                for start, end in reversed(selection_ranges):
+                    for patch in self.doc.delete_range(start, end):
                         self.__register_patch(patch)
 
+            last_end = 0
+            for start, end in selection_ranges:
                 if last_end == 0:
                     new_cursor_position = start
 
@@ -227,29 +235,165 @@ class DocumentEditor:
 
         return bindings
 
+    def load_patches(self, patches) -> None:
+        """
+        Apply batch of patches to internal document and render
+        TextEdit window buffer once.
+        :param patches: raw patches
+        :type patches: List[str]
+        """
+        patches = [Patch.parse(patch) for patch in patches]
+        self.doc.apply_patches(patches)
+        # loaded history holds every earlier operation of its authors
+        clocks = {}
+        for patch in patches:
+            char = patch.character
+            clocks[char.author] = max(clocks.get(char.author, 0), char.clock)
+        for site, clock in clocks.items():
+            self.versions.advance(site, clock)
+        self.text_field.buffer.text = self.doc.text
+
+    def load_history(self, epochs, pending=()) -> List[str]:
+        """
+        Replace internal document with the one built from full history of
+        file and render TextEdit window buffer once. Document is
+        rebalanced between epochs of history, as every site did. Own
+        patches which server has not acknowledged are applied at the end
+        of their epoch, server orders them after it.
+        :param epochs: patches of every epoch of history, see
+        MessageService.decode_history
+        :param pending: own raw patches of the same epoch not in history
+        :type epochs: List[List[Patch]]
+        :type pending: List[str]
+        :return: pending patches translated to the last epoch
+        """
+        pending = [Patch.parse(patch) for patch in pending]
+        pending_epoch = pending[0].epoch if pending else None
+        doc = Doc(self.doc.site)
+        own: List[str] = []
+        for epoch, patches in enumerate(epochs):
+            if epoch:
+                own = doc.rebalance(own)
+            # patches older than the previous epoch are dropped by every
+            # site
+            doc.apply_patches([patch for patch in patches
+                               if doc.accepts(patch)])
+            if epoch == pending_epoch:
+                doc.apply_patches(pending)
+                own = [patch.to_json() for patch in pending]
+
+        # history holds every earlier operation of its authors
+        versions = VersionVector()
+        clocks = {}
+        for patch in chain(chain.from_iterable(epochs), pending):
+            char = patch.character
+            clocks[char.author] = max(clocks.get(char.author, 0), char.clock)
+        for site, clock in clocks.items():
+            versions.advance(site, clock)
+
+        old_pos = self.text_field.buffer.cursor_position
+        self.doc = doc
+        self.versions = versions
+        self.text_field.lexer = AuthorLexer(self.doc)
+        self.text_field.buffer.text = self.doc.text
+        self.text_field.buffer.cursor_position = min(old_pos,
+                                                     len(self.doc.text))
+        return own
+
+    def rebalance(self, pending) -> List[str]:
+        """
+        Switch internal document to the next identifier epoch, see
+        Doc.rebalance. Text does not change, so buffer is kept.
+        :param pending: own raw patches not echoed by server yet
+        :type pending: List[str]
+        :return: pending patches translated to the new epoch
+        """
+        return self.doc.rebalance(pending)
+
+    def load_snapshot(self, data, versions) -> None:
+        """
+        Replace internal document with snapshot of it and render TextEdit
+        window buffer.
+        :param data: document snapshot
+        :param versions: version vector of snapshot as dict
+        :type data: bytes
+        :type versions: dict
+        """
+        self.doc = Doc.from_snapshot(data, self.doc.site)
+        self.versions = VersionVector.from_dict(versions)
+        self.text_field.lexer = AuthorLexer(self.doc)
+        self.text_field.buffer.text = self.doc.text
+
+    def merge_patches(self, patches) -> None:
+        """
+        Apply batch of patches missed by document, in any order, and
+        render TextEdit window buffer once. Patches applied before are
+        skipped.
+        :param patches: raw patches or Patch objects
+        :type patches: List[str or Patch]
+        """
+        patches = [Patch.parse(patch) for patch in patches]
+        # deletes are checked against inserts seen before the batch
+        missing = [patch for patch in patches if patch.op == Patch.DELETE
+                   and (self.doc.get_real_position(patch) is not None or
+                        (patch.character.author, patch.character.clock)
+                        not in self.versions)]
+        missing += [patch for patch in patches if patch.op == Patch.INSERT
+                    and self.versions.add(patch.character.author,
+                                          patch.character.clock)]
+        if not missing:
+            return
+
+        self.doc.apply_patches(missing)
+        old_pos = self.text_field.buffer.cursor_position
+        self.text_field.buffer.text = self.doc.text
+        self.text_field.buffer.cursor_position = min(old_pos,
+                                                     len(self.doc.text))
+
     def update_text(self, patch) -> None:
         """
         Apply patch to internal document and update
-        TextEdit window buffer.
-        :param patch: raw patch
-        :type patch: str
+        TextEdit window buffer. Patches applied before, e.g. own patches
+        echoed by server, are skipped.
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
         """
-        json_patch = json.loads(patch)
-        operation = json_patch["op"]
+        patch = Patch.parse(patch)
+        operation = patch.op
 
-        if operation == "d":
+        char = patch.character
+        if operation == Patch.DELETE:
             patch_pos = self.doc.get_real_position(patch)
-            self.doc.apply_patch(patch)
+            inserted = (char.author, char.clock) in self.versions
+            if patch_pos is None and inserted:
+                # already deleted
+                return
+            if not self.doc.apply_patch(patch):
+                # held by doc until insert arrives
+                return
         else:
-            self.doc.apply_patch(patch)
+            if not self.versions.add(char.author, char.clock):
+                return
+            if not self.doc.apply_patch(patch):
+                # deleted before it arrived
+                return
             patch_pos = self.doc.get_real_position(patch)
 
-        old_pos = self.text_field.buffer.cursor_position
-        self.text_field.buffer.text = self.doc.text
-        if patch_pos == -1 or patch_pos > old_pos + 1:
-            self.text_field.buffer.cursor_position = old_pos
+        # buffer mirrors document text, only the changed char is spliced
+        buffer = self.text_field.buffer
+        old_pos = buffer.cursor_position
+        text = buffer.text
+        start = patch_pos - 1 if patch_pos is not None else -1
+        if start < 0:
+            buffer.text = self.doc.text
+        elif operation == Patch.INSERT:
+            buffer.text = text[:start] + char.char + text[start:]
+        else:
+            buffer.text = text[:start] + text[start + len(char.char):]
+        if start < 0 or patch_pos > old_pos + 1:
+            buffer.cursor_position = old_pos
         else:
-            if operation == "i":
-                self.text_field.buffer.cursor_right()
-            if operation == "d":
-                self.text_field.buffer.cursor_left()
+            if operation == Patch.INSERT:
+                buffer.cursor_right()
+            if operation == Patch.DELETE:
+                buffer.cursor_left()
@@ -11,6 +11,8 @@ from application_builder import ApplicationBuilder
 from application_state import ApplicationState
 from document_editor import DocumentEditor
 from message_service import MessageService
+from patch_journal import PatchJournal
+from snapshot_cache import SnapshotCache
 
 
 class ClientLauncher:
@@ -19,10 +21,17 @@ class ClientLauncher:
     """
     server_ip = "localhost"
     server_port = 8080
+    # delay before the first reconnect attempt, doubled after every
+    # failed one up to MAX_RECONNECT_DELAY, in seconds
+    RECONNECT_DELAY = 0.5
+    MAX_RECONNECT_DELAY = 30
     style = Style.from_dict({"status": "reverse", "shadow": "bg:#440044", })
 
     def __init__(self):
         self.app_state = ApplicationState()
+        self.snapshot_cache = SnapshotCache()
+        # document and its version last saved to or loaded from cache
+        self.__cached = None
         parser = argparse.ArgumentParser(
             description='Multi text editor client launcher')
 
@@ -55,9 +64,13 @@ class ClientLauncher:
         try:
             async with websockets.connect(uri, max_size=None,
                                           ping_timeout=100) as websocket:
-                self.msg_service = MessageService(self.app_state, websocket)
+                self.msg_service = MessageService(
+                    self.app_state, websocket,
+                    (websockets.exceptions.ConnectionClosed, OSError))
                 self.doc_editor = DocumentEditor(self.msg_service)
                 await self.__run()
+                if self.msg_service.websocket is not websocket:
+                    await self.msg_service.websocket.close()
 
         except OSError as e:
             print(f"Failed to connect to {self.server_ip}:{self.server_port}")
@@ -136,9 +149,52 @@ class ClientLauncher:
         self.app_state.current_filename = result["file"]
         if result["owner"]:
             self.app_state.current_file_owner = result["owner"]
+
+        # cached file is only of use if server can tell newer operations
+        cached = None
+        if self.msg_service.sync_supported:
+            file_id = self.snapshot_cache.find(*self.__cache_key())
+            cached = self.snapshot_cache.load(file_id) if file_id else None
+        if cached is not None:
+            data, versions = cached
+            return {"file_id": file_id, "snapshot": data,
+                    "versions": versions}
         await self.msg_service.send_request({"type": "file_request"})
         return await self.msg_service.get_response()
 
+    def __cache_key(self) -> tuple:
+        """
+        :return: (username, owner, filename) of opened file
+        """
+        return (self.app_state.username, self.app_state.current_file_owner,
+                self.app_state.current_filename)
+
+    def __replay_journal(self) -> None:
+        """
+        Send again own patches from journal which loaded file showed
+        server does not have
+        """
+        self.doc_editor.merge_patches(self.msg_service.requeue_unacked())
+
+    def __save_snapshot(self) -> None:
+        """
+        Cache opened file on disk unless cached snapshot is up to date.
+        Snapshot with own patches which server has not acknowledged would
+        hide them from the next sync, so such snapshot is dropped instead.
+        """
+        file_id = self.app_state.current_file_id
+        doc = self.doc_editor.doc
+        if self.msg_service.unacked or not self.msg_service.send_queue.empty():
+            self.snapshot_cache.remove(file_id)
+            self.__cached = None
+            return
+        if self.__cached == (doc, doc.version):
+            return
+        self.snapshot_cache.save(file_id, self.__cache_key(),
+                                 doc.snapshot(),
+                                 self.doc_editor.versions.to_dict())
+        self.__cached = (doc, doc.version)
+
     async def __do_register(self) -> None:
         """
         Show user register dialog
@@ -163,8 +219,13 @@ class ClientLauncher:
             if not self.app_state.password:
                 self.__exit_app()
 
-            await self.msg_service.send_request({"type": "user_register"})
+            await self.msg_service.send_request({
+                "type": "user_register",
+                "encodings": self.msg_service.ENCODINGS,
+                "batching": True, "sync": True,
+                self.msg_service.REBALANCE: True})
             response = await self.msg_service.get_response()
+            self.msg_service.negotiate_encoding(response)
 
             if response["success"]:
                 await message_dialog(
@@ -202,8 +263,13 @@ class ClientLauncher:
             if self.app_state.password is None:
                 self.__exit_app()
 
-            await self.msg_service.send_request({"type": "user_login"})
+            await self.msg_service.send_request({
+                "type": "user_login",
+                "encodings": self.msg_service.ENCODINGS,
+                "batching": True, "sync": True,
+                self.msg_service.REBALANCE: True})
             response = await self.msg_service.get_response()
+            self.msg_service.negotiate_encoding(response)
 
             if not response["success"]:
                 try_again = await yes_no_dialog(
@@ -239,9 +305,20 @@ class ClientLauncher:
         file_result = await self.__do_file_dialog()
 
         self.app_state.current_file_id = file_result["file_id"]
-        for patch in file_result["content"]:
-            self.doc_editor.update_text(patch)
-            self.doc_editor.patch_set.append(patch)
+        self.msg_service.open_journal(
+            PatchJournal.for_file(self.app_state.current_file_id))
+        if "snapshot" in file_result:
+            # cached file, only newer operations are requested
+            self.doc_editor.load_snapshot(file_result["snapshot"],
+                                          file_result["versions"])
+            doc = self.doc_editor.doc
+            self.__cached = (doc, doc.version)
+            await self.msg_service.sync(self.doc_editor)
+        else:
+            self.msg_service.load_history(self.doc_editor,
+                                          file_result["content"])
+        self.__replay_journal()
+        self.__save_snapshot()
 
         # send updates to server
         producer_task = asyncio.create_task(
@@ -254,14 +331,47 @@ class ClientLauncher:
         application = app_builder.build_app()
         # listen server for updaters
         consumer_task = asyncio.create_task(
-            self.msg_service.receive_worker(application.show_message,
-                                            self.doc_editor))
+            self.__keep_connected(application.show_message))
 
         await application.run_async()
 
         # cancel tasks after app exit
         consumer_task.cancel()
         producer_task.cancel()
+        self.__save_snapshot()
+        self.msg_service.journal.close()
+
+    async def __keep_connected(self, notify) -> None:
+        """
+        Receive updates from server. When connection drops, reconnect
+        with exponential backoff and resume the session.
+        :param notify: application notification function
+        :type notify: function
+        """
+        while True:
+            await self.msg_service.receive_worker(notify, self.doc_editor)
+            self.msg_service.connected.clear()
+            await self.msg_service.websocket.close()
+            delay = self.RECONNECT_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                websocket = None
+                try:
+                    websocket = await websockets.connect(
+                        self.uri, max_size=None, ping_timeout=100)
+                    logged_in = await self.msg_service.reconnect(
+                        websocket, self.doc_editor)
+                    break
+                except (OSError, asyncio.TimeoutError,
+                        websockets.exceptions.WebSocketException):
+                    if websocket is not None:
+                        await websocket.close()
+                    delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+            if not logged_in:
+                # edits stay in journal and are sent on the next start
+                notify("Connection lost",
+                       "Failed to log in again, please restart.")
+                return
 
 
 if __name__ == "__main__":
@@ -1,17 +1,179 @@
 import asyncio
 import json
+import time
+from typing import Dict, List, Optional, Tuple
 
 from prompt_toolkit.application import get_app
 
+from docengine import Patch
+from docengine.codec import CODECS, JsonCodec
+from docengine.version_vector import VersionVector
+
+
+class FrameStats:
+    """
+    Counters of websocket frames and patches carried by them
+    """
+    def __init__(self) -> None:
+        self.frames = 0
+        self.patches = 0
+        self.started = time.monotonic()
+
+    def record(self, patches=0) -> None:
+        """
+        Record frame
+        :param patches: number of patches in frame
+        :type patches: int
+        """
+        self.frames += 1
+        self.patches += patches
+
+    @property
+    def frames_per_sec(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def patches_per_frame(self) -> float:
+        return self.patches / self.frames if self.frames else 0.0
+
+    def __repr__(self) -> str:
+        return f"FrameStats(frames={self.frames}, patches={self.patches}, " \
+               f"frames_per_sec={self.frames_per_sec:.1f}, " \
+               f"patches_per_frame={self.patches_per_frame:.1f})"
+
 
 class MessageService:
     """
     Service to exchange data with server using websocket.
+
+    Servers with rebalance support take rebalance request for the current
+    identifier epoch of file, see Doc.rebalance, put rebalance message of
+    the next epoch into patch history and broadcast it like patches. All
+    sites rebalance at this message, so the content is the same for all
+    of them; own patches which server orders after it are left out and
+    translated. Patches of a later epoch than the one of the document
+    show that a rebalance was missed, document is loaded again from
+    history then.
     """
-    def __init__(self, app_state, websocket):
+    # patch encodings offered to server, in order of preference
+    ENCODINGS = [name for name in CODECS if name != JsonCodec.name] + \
+        [JsonCodec.name]
+    # queued patches are coalesced into one message for at most
+    # BATCH_WINDOW seconds or until BATCH_SIZE bytes of patches
+    BATCH_WINDOW = 0.01
+    BATCH_SIZE = 64 * 1024
+    # seconds to wait for reply to sync request before falling back to
+    # full history
+    SYNC_TIMEOUT = 5
+    # seconds to wait for other replies while reconnecting
+    REPLY_TIMEOUT = 30
+    REBALANCE = "rebalance"
+
+    def __init__(self, app_state, websocket, connection_errors=(OSError,)):
+        """
+        :param app_state: application state with credentials
+        :param websocket: connected websocket
+        :param connection_errors: exceptions raised by websocket when
+        connection is lost
+        :type app_state: ApplicationState
+        :type connection_errors: Tuple[type, ...]
+        """
         self.app_state = app_state
         self.send_queue = asyncio.Queue()
         self.websocket = websocket
+        self.connection_errors = connection_errors
+        # cleared while connection is lost, send_worker waits for it
+        self.connected = asyncio.Event()
+        self.connected.set()
+        # sent own patches not echoed by server yet, in send order
+        self.unacked: Dict[str, Patch] = {}
+        # raw own patches queued or sent and not echoed by server yet ->
+        # None, in queue order
+        self.outgoing: Dict[str, None] = {}
+        # own patches translated by rebalance after they were queued,
+        # their echo acknowledges the translated patch
+        self.__renamed: Dict[str, str] = {}
+        # journal of own patches of opened file, see PatchJournal
+        self.journal = None
+        self.patch_codec = CODECS[JsonCodec.name]
+        # whether server accepts patch batches
+        self.batching = False
+        # whether server answers sync requests
+        self.sync_supported = False
+        # whether server agrees on rebalance of documents
+        self.rebalance_supported = False
+        # epoch which rebalance was requested for
+        self.__rebalance_requested: Optional[int] = None
+        # received patches of old epochs which could not be applied
+        self.dropped = 0
+        self.sent = FrameStats()
+        self.received = FrameStats()
+
+    def negotiate_encoding(self, response) -> None:
+        """
+        Switch patch encoding, batching, sync and rebalance to the ones
+        accepted by server. Falls back to json single patch messages and
+        full history requests if server did not pick any.
+        :param response: server response to login or register request
+        :type response: dict
+        """
+        self.patch_codec = CODECS.get(response.get("encoding"),
+                                      CODECS[JsonCodec.name])
+        self.batching = bool(response.get("batching"))
+        self.sync_supported = bool(response.get("sync"))
+        self.rebalance_supported = bool(response.get(self.REBALANCE))
+
+    def prepare_patch_request(self, patch) -> bytes:
+        """
+        Encode patch with negotiated encoding and prepare send request.
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        :return: bytes of encoded message
+        """
+        message = {"type": "patch",
+                   "content": self.patch_codec.encode(patch)}
+        if self.patch_codec.name != JsonCodec.name:
+            message["encoding"] = self.patch_codec.name
+        return self.prepare_send_request(message)
+
+    def prepare_batch_request(self, patches) -> bytes:
+        """
+        Encode patches with negotiated encoding and prepare single send
+        request for all of them.
+        :param patches: raw patches or Patch objects
+        :type patches: List[str or Patch]
+        :return: bytes of encoded message
+        """
+        message = {"type": "patch_batch",
+                   "content": self.patch_codec.encode_batch(patches)}
+        if self.patch_codec.name != JsonCodec.name:
+            message["encoding"] = self.patch_codec.name
+        return self.prepare_send_request(message)
+
+    @staticmethod
+    def decode_patch(packet) -> Patch:
+        """
+        Decode patch from received packet
+        :param packet: received message
+        :type packet: dict
+        :return: Patch object
+        """
+        codec = CODECS[packet.get("encoding", JsonCodec.name)]
+        return codec.decode(packet["content"])
+
+    @staticmethod
+    def decode_patches(packet) -> List[Patch]:
+        """
+        Decode patches from received patch or patch batch packet
+        :param packet: received message
+        :type packet: dict
+        :return: Patch objects in order
+        """
+        codec = CODECS[packet.get("encoding", JsonCodec.name)]
+        if packet["type"] == "patch_batch":
+            return codec.decode_batch(packet["content"])
+        return [codec.decode(packet["content"])]
 
     def prepare_send_request(self, message) -> bytes:
         """
@@ -46,6 +208,66 @@ class MessageService:
         """
         self.send_queue.put_nowait(message)
 
+    def put_patch(self, patch) -> None:
+        """
+        Put patch to send queue, it is encoded on send, together with
+        patches queued next to it if batching is on
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        """
+        raw = patch if isinstance(patch, str) else patch.to_json()
+        self.outgoing[raw] = None
+        if self.journal is not None:
+            self.journal.append(patch)
+        self.send_queue.put_nowait(patch)
+
+    def request_rebalance(self, epoch) -> None:
+        """
+        Ask server to rebalance document, once per epoch
+        :param epoch: current epoch of document
+        :type epoch: int
+        """
+        if not self.rebalance_supported or \
+                self.__rebalance_requested == epoch:
+            return
+        self.__rebalance_requested = epoch
+        self.put_message(self.prepare_send_request(
+            {"type": "rebalance_request", "epoch": epoch}))
+
+    def open_journal(self, journal) -> None:
+        """
+        Journal own patches of opened file. Patches left in journal by
+        previous session count as sent and not acknowledged, until
+        history or sync shows that server has them.
+        :param journal: journal of opened file
+        :type journal: PatchJournal
+        """
+        self.journal = journal
+        for raw in journal.pending:
+            self.unacked[raw] = Patch.parse(raw)
+            self.outgoing[raw] = None
+
+    def acknowledge_history(self, history) -> None:
+        """
+        Forget own patches found in history of file
+        :param history: raw patches
+        :type history: List[str]
+        """
+        for raw in set(history) & (set(self.outgoing) | set(self.__renamed)):
+            self.__acknowledge(raw)
+
+    def requeue_unacked(self) -> List[str]:
+        """
+        Put sent patches which server has not acknowledged to send queue
+        again, e.g. ones restored from journal
+        :return: raw patches put to queue
+        """
+        pending = list(self.unacked)
+        self.unacked.clear()
+        for raw in pending:
+            self.put_patch(raw)
+        return pending
+
     async def get_response(self) -> dict:
         """
         Wait for closest message on websocket, deserialize and return it.
@@ -66,10 +288,13 @@ class MessageService:
         try:
             async for message in self.websocket:
                 packet = json.loads(message.decode("utf-8"))
-                if packet["type"] == "patch" and packet["content"] not in \
-                        doc_editor.patch_set:
-                    doc_editor.update_text(packet["content"])
-                    doc_editor.patch_set.append(packet["content"])
+                dropped = self.dropped
+                self.received.record(
+                    await self.__apply_broadcast(packet, doc_editor) or 0)
+                if self.dropped > dropped:
+                    notify("Edits lost", "Edits made before the document "
+                                         "was rebalanced were dropped.")
+                    get_app().invalidate()
                 if packet["type"] == "save_file_response":
                     self.app_state.is_saving = False
                     if packet["success"]:
@@ -87,17 +312,355 @@ class MessageService:
                                              "another username?")
                     get_app().invalidate()
 
-        finally:
+        except (*self.connection_errors, asyncio.TimeoutError):
+            # connection is lost or server does not reply, see reconnect
             return
 
+    async def reconnect(self, websocket, doc_editor) -> bool:
+        """
+        Resume session on new websocket: log in again, get operations
+        missed while connection was lost and replay sent patches which
+        server has not acknowledged. Queued messages are sent after it.
+        Raises asyncio.TimeoutError if server does not reply.
+        :param websocket: connected websocket
+        :param doc_editor: document editor
+        :type doc_editor: DocumentEditor
+        :return: False if server rejected credentials
+        """
+        self.websocket = websocket
+        await self.send_request({"type": "user_login",
+                                 "encodings": self.ENCODINGS,
+                                 "batching": True, "sync": True,
+                                 self.REBALANCE: True})
+        response = await asyncio.wait_for(self.get_response(),
+                                          self.REPLY_TIMEOUT)
+        if not response["success"]:
+            return False
+        self.negotiate_encoding(response)
+
+        await self.sync(doc_editor)
+        for raw in list(self.unacked):
+            await self.websocket.send(self.prepare_patch_request(raw))
+            self.sent.record(1)
+        self.connected.set()
+        return True
+
+    async def sync(self, doc_editor) -> None:
+        """
+        Tell server version vector of document and apply operations it
+        misses. Without server support for sync whole history is
+        requested and missing operations are selected locally.
+        :param doc_editor: document editor
+        :type doc_editor: DocumentEditor
+        """
+        versions = doc_editor.versions
+        response = {}
+        if self.sync_supported:
+            await self.send_request({"type": "sync_request",
+                                     "versions": versions.to_dict()})
+            try:
+                response = await asyncio.wait_for(
+                    self.__get_reply(doc_editor), self.SYNC_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        if response.get("type") == "sync_response" and response["success"]:
+            codec = CODECS[response.get("encoding", JsonCodec.name)]
+            patches = codec.decode_batch(response["content"])
+            epoch = doc_editor.doc.epoch
+            if any(patch.epoch >= epoch - 1 and
+                   not doc_editor.doc.accepts(patch) for patch in patches):
+                # rebalance was missed
+                await self.resync(doc_editor)
+                return
+            # own patches known to server need no replay
+            self.acknowledge_history([patch.to_json() for patch in patches])
+            server_versions = VersionVector.from_dict(
+                response.get("versions", {}))
+            for raw, patch in list(self.unacked.items()):
+                char = patch.character
+                if patch.op == Patch.INSERT and \
+                        (char.author, char.clock) in server_versions:
+                    self.__acknowledge(raw)
+            accepted = [patch for patch in patches
+                        if doc_editor.doc.accepts(patch)]
+            self.dropped += len(patches) - len(accepted)
+            patches = accepted
+        else:
+            await self.send_request({"type": "file_request"})
+            # late reply to sync request is dropped
+            response = await asyncio.wait_for(
+                self.__get_reply(doc_editor, skip=("sync_response",)),
+                self.REPLY_TIMEOUT)
+            history = response["content"]
+            if self.rebalance_supported:
+                # history may be of other epochs
+                self.load_history(doc_editor, history)
+                return
+            self.acknowledge_history(history)
+            patches = versions.missing(history)
+        doc_editor.merge_patches(patches)
+
+        first = next(iter(self.outgoing), None)
+        if first is not None and \
+                Patch.parse(first).epoch != doc_editor.doc.epoch:
+            # own patches from journal are of a rebalance which was missed
+            await self.resync(doc_editor)
+
+    async def resync(self, doc_editor) -> None:
+        """
+        Load document again from full history of file, e.g. when a
+        rebalance was missed. Broadcasts received before the reply are in
+        history already and are skipped.
+        Raises asyncio.TimeoutError if server does not reply.
+        :param doc_editor: document editor
+        :type doc_editor: DocumentEditor
+        """
+        await self.send_request({"type": "file_request"})
+        response = await asyncio.wait_for(
+            self.__get_reply(doc_editor, skip=(
+                "patch", "patch_batch", self.REBALANCE, "sync_response")),
+            self.REPLY_TIMEOUT)
+        self.load_history(doc_editor, response["content"])
+
+    def load_history(self, doc_editor, history) -> None:
+        """
+        Load document from full history of file. Own patches which server
+        has not acknowledged are translated to the last epoch of history.
+        :param doc_editor: document editor
+        :param history: raw patches and rebalance messages
+        :type doc_editor: DocumentEditor
+        :type history: List[str]
+        """
+        self.acknowledge_history(history)
+        pending = list(self.outgoing)
+        translated = doc_editor.load_history(self.decode_history(history),
+                                             pending)
+        self.__rename({raw: new_raw for raw, new_raw
+                       in zip(pending, translated) if raw != new_raw})
+
+    @classmethod
+    def decode_history(cls, history) -> List[List[Patch]]:
+        """
+        Split history of file into identifier epochs
+        :param history: raw patches and rebalance messages
+        :type history: List[str]
+        :return: Patch objects of every epoch, in history order. Patches
+        which follow rebalance message belong to the epoch it starts, even
+        if they were made before it.
+        """
+        epochs: List[List[Patch]] = [[]]
+        for raw in history:
+            try:
+                epochs[-1].append(Patch.from_json(raw))
+            except KeyError:
+                if json.loads(raw).get("type") != cls.REBALANCE:
+                    raise
+                epochs.append([])
+        return epochs
+
     async def send_worker(self) -> None:
         """
-        Sends messages from send_queue to websocket.
+        Sends messages from send_queue to websocket. With batching on,
+        patches queued within a batch window are sent as one message.
         """
         while True:
             next_message = await self.send_queue.get()
-
-            await self.websocket.send(next_message)
+            if isinstance(next_message, bytes):
+                await self.__send(next_message)
+            elif not self.batching:
+                await self.__send(self.prepare_patch_request(next_message),
+                                  [next_message])
+            else:
+                patches, next_message = await self.__collect_batch(
+                    next_message)
+                if len(patches) == 1:
+                    await self.__send(self.prepare_patch_request(patches[0]),
+                                      patches)
+                else:
+                    await self.__send(self.prepare_batch_request(patches),
+                                      patches)
+                # message which closed the batch goes after its patches
+                if next_message is not None:
+                    await self.__send(next_message)
 
             # Notify the queue that the item has been processed.
             self.send_queue.task_done()
+
+    async def __collect_batch(self, patch) -> Tuple[List, Optional[bytes]]:
+        """
+        Take patches queued after patch until batch window or batch size
+        is exceeded or other message is queued
+        :param patch: first patch of batch
+        :type patch: str or Patch
+        :return: patches of batch and message which closed it, if any
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.BATCH_WINDOW
+        patches = [patch]
+        size = len(CODECS[JsonCodec.name].encode(patch))
+        while size < self.BATCH_SIZE:
+            if self.send_queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.send_queue.get(),
+                                                  timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.send_queue.get_nowait()
+            # every taken item is processed with the first one
+            self.send_queue.task_done()
+            if isinstance(item, bytes):
+                return patches, item
+            patches.append(item)
+            size += len(CODECS[JsonCodec.name].encode(item))
+        return patches, None
+
+    async def __get_reply(self, doc_editor, skip=()) -> dict:
+        """
+        Wait for reply to request, applying patches broadcast by server
+        before it
+        :param doc_editor: document editor
+        :param skip: types of messages to drop, e.g. late replies to
+        earlier requests
+        :type doc_editor: DocumentEditor
+        :type skip: Tuple[str, ...]
+        :return: message object as dict
+        """
+        while True:
+            packet = await self.get_response()
+            if packet.get("type") in skip:
+                continue
+            if await self.__apply_broadcast(packet, doc_editor) is None:
+                return packet
+
+    async def __apply_broadcast(self, packet, doc_editor) -> Optional[int]:
+        """
+        Apply patches or rebalance broadcast by server. Patches older than
+        the previous epoch are dropped, like by every other site; own ones
+        are sent again as translated by rebalance.
+        :param packet: received message
+        :param doc_editor: document editor
+        :type packet: dict
+        :type doc_editor: DocumentEditor
+        :return: number of patches in packet, None if it is not broadcast
+        """
+        if packet.get("type") == self.REBALANCE:
+            await self.__rebalance(doc_editor, packet["epoch"])
+            return 0
+        if packet.get("type") not in ("patch", "patch_batch"):
+            return None
+
+        patches = self.decode_patches(packet)
+        for patch in patches:
+            raw = patch.to_json()
+            if doc_editor.doc.accepts(patch):
+                # echo of own patch acknowledges it
+                self.__acknowledge(raw)
+                doc_editor.update_text(patch)
+            elif patch.epoch >= doc_editor.doc.epoch - 1:
+                # rebalance was missed or document does not know its
+                # translation, the rest of packet is in history
+                await self.resync(doc_editor)
+                break
+            elif raw in self.__renamed:
+                self.send_queue.put_nowait(self.__renamed[raw])
+            else:
+                self.dropped += 1
+        return len(patches)
+
+    async def __rebalance(self, doc_editor, epoch) -> None:
+        """
+        Rebalance document at rebalance message of server. Own patches
+        which are not echoed yet are ordered after it, so they are left
+        out of rebalanced content and translated.
+        :param doc_editor: document editor
+        :param epoch: epoch started by rebalance
+        :type doc_editor: DocumentEditor
+        :type epoch: int
+        """
+        if epoch <= doc_editor.doc.epoch:
+            # loaded from history already
+            return
+        if epoch > doc_editor.doc.epoch + 1:
+            await self.resync(doc_editor)
+            return
+        pending = list(self.outgoing)
+        self.__rename(dict(zip(pending, doc_editor.rebalance(pending))))
+
+    def __rename(self, renamed) -> None:
+        """
+        Replace own patches which are not echoed yet with their
+        translation to a new epoch, in queue, journal and patches to send
+        again on reconnect. Echo of the original patch acknowledges the
+        translated one.
+        :param renamed: raw patch -> translated raw patch
+        :type renamed: Dict[str, str]
+        """
+        if not renamed:
+            return
+        self.outgoing = {renamed.get(raw, raw): None for raw in self.outgoing}
+        self.unacked = {
+            renamed[raw]: Patch.parse(renamed[raw]) if raw in renamed
+            else patch for raw, patch in self.unacked.items()}
+        if self.journal is not None:
+            for raw, new_raw in renamed.items():
+                self.journal.append(new_raw)
+                self.journal.acknowledge(raw)
+        for raw, new_raw in self.__renamed.items():
+            self.__renamed[raw] = renamed.get(new_raw, new_raw)
+        self.__renamed.update(renamed)
+
+        queued = []
+        while not self.send_queue.empty():
+            queued.append(self.send_queue.get_nowait())
+            self.send_queue.task_done()
+        for item in queued:
+            if not isinstance(item, bytes):
+                raw = item if isinstance(item, str) else item.to_json()
+                item = renamed.get(raw, item)
+            self.send_queue.put_nowait(item)
+
+    def __acknowledge(self, raw) -> None:
+        """
+        Forget own patch received by server
+        :param raw: raw patch
+        :type raw: str
+        """
+        raw = self.__renamed.pop(raw, raw)
+        self.unacked.pop(raw, None)
+        if raw not in self.outgoing:
+            return
+        del self.outgoing[raw]
+        if not self.outgoing:
+            self.__renamed.clear()
+        if self.journal is not None:
+            self.journal.acknowledge(raw)
+
+    async def __send(self, message, patches=()) -> None:
+        """
+        Send message to websocket and count frame. While connection is
+        lost, waits for reconnect.
+        :param message: encoded message
+        :param patches: patches in message
+        :type message: bytes
+        :type patches: List[str or Patch]
+        """
+        while True:
+            await self.connected.wait()
+            try:
+                await self.websocket.send(message)
+                break
+            except self.connection_errors:
+                self.connected.clear()
+        self.sent.record(len(patches))
+        for patch in patches:
+            patch = Patch.parse(patch)
+            raw = patch.to_json()
+            if raw in self.__renamed:
+                # translated by rebalance while it was sent
+                raw = self.__renamed[raw]
+                patch = Patch.parse(raw)
+            self.unacked[raw] = patch
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import re
+from typing import Dict, List
+
+from docengine import Patch
+
+
+class PatchJournal:
+    """
+    Append-only journal of own patches of a file which server has not
+    acknowledged yet, one raw patch per line. Appends are written to the
+    file at once, so they survive crash of the process, but synced to
+    disk with group commit: one fsync per COMMIT_WINDOW for all patches
+    appended in it. Acknowledged patches
+    are dropped from the journal by truncation when nothing is pending,
+    or by rewriting pending patches when acknowledged ones pile up.
+    Patches left in journal are replayed on the next start.
+    """
+    DIRECTORY = "multitext"
+    COMMIT_WINDOW = 0.05
+    # acknowledged entries kept in file before it is compacted
+    COMPACT_SIZE = 1024
+
+    def __init__(self, path):
+        """
+        :param path: journal file path
+        :type path: str
+        """
+        self.path = path
+        # raw patch -> None, in append order
+        self.__pending: Dict[str, None] = {}
+        # number of entries in file
+        self.__written = 0
+        self.__dirty = False
+        self.__commit_scheduled = False
+        self.commits = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        damaged = False
+        if os.path.exists(path):
+            with open(path, "rb") as journal:
+                lines = journal.read().decode("utf-8", "replace").split("\n")
+            # last line is empty unless append was torn by crash
+            damaged = bool(lines[-1])
+            for raw in lines[:-1]:
+                try:
+                    Patch.from_json(raw)
+                except (ValueError, KeyError, TypeError):
+                    damaged = True
+                    continue
+                self.__pending[raw] = None
+            self.__written = len(lines) - 1
+        self.__file = open(path, "ab")
+        if damaged:
+            self.__rewrite()
+
+    @classmethod
+    def for_file(cls, file_id, directory=None) -> 'PatchJournal':
+        """
+        Open journal of file
+        :param file_id: id of file
+        :param directory: journal directory, by default under user state
+        directory ($XDG_STATE_HOME or ~/.local/state)
+        :type file_id: str
+        :type directory: str
+        :return: PatchJournal object
+        """
+        if directory is None:
+            base = os.environ.get("XDG_STATE_HOME") or \
+                os.path.join(os.path.expanduser("~"), ".local", "state")
+            directory = os.path.join(base, cls.DIRECTORY)
+        name = re.sub(r"[^\w.-]", "_", str(file_id))
+        return cls(os.path.join(directory, f"{name}.journal"))
+
+    @property
+    def pending(self) -> List[str]:
+        """
+        Patches not acknowledged by server, in append order
+        """
+        return list(self.__pending)
+
+    def append(self, patch) -> None:
+        """
+        Write patch to journal, it is synced to disk by the next commit
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        """
+        raw = patch if isinstance(patch, str) else patch.to_json()
+        if raw in self.__pending:
+            return
+        self.__pending[raw] = None
+        self.__file.write(raw.encode("utf-8") + b"\n")
+        self.__file.flush()
+        self.__written += 1
+        self.__dirty = True
+        self.__schedule_commit()
+
+    def acknowledge(self, patch) -> None:
+        """
+        Drop patch received by server from journal
+        :param patch: raw patch or Patch object
+        :type patch: str or Patch
+        """
+        raw = patch if isinstance(patch, str) else patch.to_json()
+        if raw in self.__pending:
+            del self.__pending[raw]
+            self.__schedule_commit()
+
+    def commit(self) -> None:
+        """
+        Sync appended patches to disk and drop acknowledged ones
+        """
+        self.__commit_scheduled = False
+        if self.__file.closed:
+            return
+        if not self.__pending and self.__written:
+            self.__file.truncate(0)
+            self.__written = 0
+            self.__dirty = True
+        elif self.__written - len(self.__pending) >= self.COMPACT_SIZE:
+            self.__rewrite()
+        if self.__dirty:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__dirty = False
+            self.commits += 1
+
+    def close(self) -> None:
+        """
+        Commit and close journal
+        """
+        self.commit()
+        self.__file.close()
+
+    def __schedule_commit(self) -> None:
+        """
+        Commit at the end of commit window, or now if there is no event
+        loop to wait in
+        """
+        if self.__commit_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.commit()
+            return
+        self.__commit_scheduled = True
+        loop.call_later(self.COMMIT_WINDOW, self.commit)
+
+    def __rewrite(self) -> None:
+        """
+        Replace journal with pending patches only
+        """
+        self.__file.close()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as journal:
+            journal.write(b"".join(raw.encode("utf-8") + b"\n"
+                                   for raw in self.__pending))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.path)
+        self.__file = open(self.path, "ab")
+        self.__written = len(self.__pending)
+        self.__dirty = False
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+from typing import Optional, Tuple
+
+from docengine import snapshot
+
+
+class SnapshotCache:
+    """
+    On-disk cache of opened files. For every file id it keeps document
+    snapshot and a marker with version vector of the snapshot and the
+    file it belongs to, so reopened file is loaded from disk and only
+    newer operations are requested from server.
+    """
+    DIRECTORY = "multitext"
+
+    def __init__(self, directory=None):
+        """
+        :param directory: cache directory, by default under user cache
+        directory ($XDG_CACHE_HOME or ~/.cache)
+        :type directory: str
+        """
+        if directory is None:
+            base = os.environ.get("XDG_CACHE_HOME") or \
+                os.path.join(os.path.expanduser("~"), ".cache")
+            directory = os.path.join(base, self.DIRECTORY)
+        self.directory = directory
+
+    def find(self, username, owner, filename) -> Optional[str]:
+        """
+        Find id of cached file
+        :param username: logged in user name
+        :param owner: owner of shared file or None for own file
+        :param filename: name of file
+        :type username: str
+        :type owner: str or None
+        :type filename: str
+        :return: file id or None if file is not cached
+        """
+        if not os.path.isdir(self.directory):
+            return None
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            marker = self.__read_marker(os.path.join(self.directory, name))
+            if marker is not None and marker.get("file") == \
+                    [username, owner, filename]:
+                return marker["file_id"]
+        return None
+
+    def load(self, file_id) -> Optional[Tuple[bytes, dict]]:
+        """
+        Load cached file
+        :param file_id: id of file
+        :type file_id: str
+        :return: snapshot bytes and version vector as dict, or None if
+        file is not cached or cache is damaged
+        """
+        snapshot_path, marker_path = self.__paths(file_id)
+        marker = self.__read_marker(marker_path)
+        if marker is None:
+            return None
+        try:
+            with open(snapshot_path, "rb") as snapshot_file:
+                data = snapshot_file.read()
+            snapshot.read_header(data)
+        except (OSError, ValueError):
+            return None
+        return data, marker["versions"]
+
+    def save(self, file_id, file, data, versions) -> None:
+        """
+        Store file snapshot, replacing the cached one
+        :param file_id: id of file
+        :param file: (username, owner, filename) of file
+        :param data: snapshot bytes
+        :param versions: version vector of snapshot as dict
+        :type file_id: str
+        :type file: Tuple[str, str or None, str]
+        :type data: bytes
+        :type versions: dict
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_path, marker_path = self.__paths(file_id)
+        # marker makes the entry valid, it is replaced after snapshot
+        if os.path.exists(marker_path):
+            os.remove(marker_path)
+        self.__write(snapshot_path, data)
+        self.__write(marker_path, json.dumps({
+            "file_id": file_id, "file": list(file),
+            "versions": versions}).encode("utf-8"))
+
+    def remove(self, file_id) -> None:
+        """
+        Drop cached file
+        :param file_id: id of file
+        :type file_id: str
+        """
+        for path in reversed(self.__paths(file_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __paths(self, file_id) -> Tuple[str, str]:
+        """
+        :return: paths of snapshot and of marker of file
+        """
+        name = re.sub(r"[^\w.-]", "_", str(file_id))
+        return (os.path.join(self.directory, f"{name}.snapshot"),
+                os.path.join(self.directory, f"{name}.json"))
+
+    @staticmethod
+    def __read_marker(path) -> Optional[dict]:
+        try:
+            with open(path, "rb") as marker_file:
+                return json.loads(marker_file.read().decode("utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __write(path, data) -> None:
+        """
+        Replace file atomically
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
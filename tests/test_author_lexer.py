@@ -42,3 +42,49 @@ def test_author_lexer_multiple_authors():
     colors = [item[0] for item in lex_func(0)]
 
     assert len(set(colors)) == 3
+    assert [text for _, text in lex_func(0)] == ["third", "second", "first"]
+
+
+def test_author_lexer_lines():
+    """
+    Test that lexer returns chars of requested line only and empty
+    tokens for lines out of range
+    """
+    doc = Doc()
+    doc.site = 0
+    doc.insert_text(0, "first\nsecond\n")
+
+    lexer = AuthorLexer(doc)
+    lex_func = lexer.lex_document(None)
+
+    assert "".join(c for _, c in lex_func(1)) == "second"
+    assert lex_func(2) == []
+    assert lex_func(3) == []
+
+
+def test_author_lexer_cached_lines():
+    """
+    Test that lexer reuses lines lexed before and relexes lines changed
+    by local and remote edits
+    """
+    doc = Doc()
+    doc.site = 1
+    doc.insert_text(0, "first\nsecond\nthird\nfourth")
+    remote = Doc()
+    remote.site = 2
+    remote.apply_patches(doc.patch_set)
+
+    lexer = AuthorLexer(doc)
+    lex_func = lexer.lex_document(None)
+    lines = [lex_func(line) for line in range(4)]
+    assert lexer.lex_document(None)(3) is lines[3]
+
+    for patch in remote.insert_text(8, "\nnew"):
+        doc.apply_patch(patch)
+    doc.delete_range(0, 3)
+    lex_func = lexer.lex_document(None)
+
+    expected = AuthorLexer(doc).lex_document(None)
+    for line in range(doc.line_count + 1):
+        assert lex_func(line) == expected(line)
+    assert lex_func(4) is lines[3]
@@ -0,0 +1,95 @@
+import pytest
+
+from docengine import Doc, Patch
+from docengine.codec import BinaryCodec, JsonCodec
+
+
+def get_patches():
+    """
+    Generate inserts and deletes of several authors with deep positions
+    """
+    doc = Doc()
+    patches = []
+    for site in (0, 2 ** 32 - 1, 7):
+        doc.site = site
+        for idx, c in enumerate("Привет, world!\n"):
+            patches.append(doc.insert(min(idx * 2, len(doc.text)), c))
+    patches.extend(doc.delete_range(3, 9))
+    return patches
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_codec_roundtrip_single(codec):
+    """
+    Test that every patch survives encode/decode of single patch
+    """
+    for raw_patch in get_patches():
+        decoded = codec.decode(codec.encode(raw_patch))
+        assert decoded.to_json() == raw_patch
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_codec_roundtrip_batch(codec):
+    """
+    Test that batch keeps order, ops, chars and identifiers
+    """
+    patches = [Patch.from_json(raw) for raw in get_patches()]
+    decoded = codec.decode_batch(codec.encode_batch(patches))
+
+    assert [p.to_json() for p in decoded] == [p.to_json() for p in patches]
+    assert decoded == patches
+
+
+def test_codec_binary_empty_batch():
+    """
+    Test that empty batch is encoded
+    """
+    codec = BinaryCodec()
+    assert codec.decode_batch(codec.encode_batch([])) == []
+
+
+def test_codec_binary_smaller_than_json():
+    """
+    Test that binary batch is smaller than json one
+    """
+    patches = get_patches()
+    binary_size = len(BinaryCodec().pack(patches))
+    json_size = sum(len(raw.encode("utf-8")) for raw in patches)
+
+    assert binary_size * 4 < json_size
+
+
+def test_codec_binary_rejects_corrupted():
+    """
+    Test that unknown version, trailing bytes and truncated or corrupt
+    payload are rejected
+    """
+    codec = BinaryCodec()
+    data = codec.pack(get_patches()[:1])
+
+    with pytest.raises(ValueError):
+        codec.unpack(b"\x00" + data[1:])
+    with pytest.raises(ValueError):
+        codec.unpack(data + b"\x00")
+    for end in range(1, len(data)):
+        with pytest.raises(ValueError):
+            codec.unpack(data[:end])
+    with pytest.raises(ValueError):
+        codec.unpack(data[:4] + b"\x05" + data[5:])
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_codec_roundtrip_epoch(codec):
+    """
+    Test that identifier epoch of patches is kept
+    """
+    doc = Doc()
+    patches = [Patch.from_json(raw) for raw in get_patches()[:5]]
+    doc.apply_patches(patches)
+    doc.rebalance()
+    patches += [Patch.from_json(doc.insert(1, "e")), Patch.from_json(
+        doc.delete(0))]
+    decoded = codec.decode_batch(codec.encode_batch(patches))
+
+    assert [p.epoch for p in decoded] == [0] * 5 + [1, 1]
+    assert [p.to_json() for p in decoded] == [p.to_json() for p in patches]
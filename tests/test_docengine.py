@@ -1,6 +1,22 @@
-from docengine import Doc
+import json
+import random
+from unittest import mock
+
+import pytest
+
+from docengine import Doc, Patch
+from docengine.allocation_policy import POLICIES, AppendBiasedPolicy, \
+    RandomBoundaryPolicy
 from docengine.allocator import Allocator
 from docengine.char_position import CharPosition
+from docengine.character import Character
+from docengine.block_storage import BlockStorage
+from docengine.causal_buffer import CausalBuffer
+from docengine.site_table import SiteTable
+from docengine.storage import SortedListStorage
+from docengine.trie_storage import TrieStorage
+from docengine.version_vector import VersionVector
+from docengine.text_buffer import TextBuffer
 
 
 def test_docengine_allocator():
@@ -82,3 +98,719 @@ def test_docengine_comparator():
                                   base_bits=base_bits)
 
     assert left_char_pos < right_char_pos
+
+
+def test_docengine_apply_remote_delete():
+    """
+    Test that remote delete patch removes matching character
+    """
+    doc = Doc()
+    doc.site = 0
+    patches = [doc.insert(idx, c) for idx, c in enumerate("abc")]
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    for patch in patches:
+        remote_doc.apply_patch(patch)
+
+    remote_doc.apply_patch(doc.delete(1))
+
+    assert remote_doc.text == doc.text == "ac"
+
+
+def test_docengine_apply_unknown_delete():
+    """
+    Test that delete of unknown character is held until its insert
+    arrives and then neither is applied
+    """
+    doc = Doc()
+    doc.site = 0
+    insert = doc.insert(0, "a")
+    doc.insert(1, "b")
+    patch = doc.delete(0)
+
+    remote_doc = Doc()
+    assert not remote_doc.apply_patch(patch)
+    assert [held.to_json() for held in remote_doc.held] == [patch]
+    assert remote_doc.get_real_position(patch) is None
+    assert not remote_doc.apply_patch(insert)
+    assert remote_doc.text == "" and not remote_doc.held
+
+    # deletes whose inserts never come are dropped oldest first
+    deletes = doc.delete_range(0, 1) + [patch]
+    with mock.patch.object(CausalBuffer, "MAX_SIZE", 1):
+        for held in deletes:
+            remote_doc.apply_patch(held)
+    assert [held.to_json() for held in remote_doc.held] == [patch]
+
+
+def test_docengine_apply_any_order():
+    """
+    Test that patches applied in any order, one by one or in batches,
+    give the same document
+    """
+    doc = Doc(site=1)
+    patches = doc.insert_text(0, "Hello, world!")
+    patches += doc.delete_range(2, 6)
+    patches += doc.insert_text(3, "there")
+    patches += doc.delete_range(0, 2)
+    rnd = random.Random(4)
+    for _ in range(10):
+        shuffled = patches[:]
+        rnd.shuffle(shuffled)
+        remote_doc = Doc(site=2)
+        for patch in shuffled:
+            remote_doc.apply_patch(patch)
+        assert remote_doc.text == doc.text and not remote_doc.held
+
+        remote_doc = Doc(site=2)
+        middle = rnd.randrange(len(shuffled))
+        remote_doc.apply_patches(shuffled[:middle])
+        remote_doc.apply_patches(shuffled[middle:])
+        assert remote_doc.text == doc.text and not remote_doc.held
+
+
+def test_docengine_get_real_position():
+    """
+    Test resolving patch to flat index for inserts and deletes
+    """
+    doc = Doc()
+    doc.site = 0
+    patches = [doc.insert(idx, c) for idx, c in enumerate("abcd")]
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    for idx, patch in enumerate(patches):
+        remote_doc.apply_patch(patch)
+        assert remote_doc.get_real_position(patch) == idx + 1
+
+    delete_patch = doc.delete(2)
+    assert remote_doc.get_real_position(delete_patch) == 3
+    remote_doc.apply_patch(delete_patch)
+    assert remote_doc.get_real_position(delete_patch) is None
+
+
+def test_docengine_position_key():
+    """
+    Test that precomputed key keeps tree path and pair ordering
+    """
+    position = CharPosition([3, 7], [-1, 5])
+    prefix = CharPosition([3], [-1])
+    same_digits = CharPosition([3, 7], [-1, 6])
+
+    assert position.position == [3, 7]
+    assert position.sites == [-1, 5]
+    assert position.author == 5
+    assert prefix < position < same_digits
+    assert not hasattr(position, "__dict__")
+
+
+def test_docengine_legacy_sites():
+    """
+    Test that path of the first Allocator with more sites than digits
+    keeps its author and that its delete is exported as received
+    """
+    legacy = json.dumps({"op": "i", "char": "x", "pos": [5],
+                         "sites": [5, 7], "clock": 3}, sort_keys=True)
+    assert CharPosition([5, 9], [5, 3, 7]).sites == [5, 7]
+
+    doc = Doc(site=1)
+    assert doc.apply_patch(legacy)
+    assert doc.authors[1:-1] == [7]
+    assert doc.patch_set == {legacy}
+    versions = VersionVector()
+    assert versions.add(Patch.from_json(legacy).character.author, 3)
+    assert versions.add(5, 3)
+
+    delete = json.loads(doc.delete(0))
+    assert delete["pos"] == [5] and delete["sites"] == [5, 7]
+    replica = Doc(site=2)
+    replica.apply_patches([legacy])
+    assert replica.apply_patch(json.dumps(delete))
+    assert replica.text == doc.text == ""
+
+
+def test_docengine_allocator_run():
+    """
+    Test that run allocation spreads ordered positions at single depth
+    """
+    test_allocator = Allocator(0)
+    left_char_pos = CharPosition([0], [-1])
+    right_char_pos = CharPosition([1], [-1])
+
+    positions = test_allocator.allocate_run(left_char_pos, right_char_pos,
+                                            100)
+
+    assert len(positions) == 100
+    assert all(len(pos.position) == 3 for pos in positions)
+    assert sorted(positions) == positions
+    assert left_char_pos < positions[0] and positions[-1] < right_char_pos
+
+
+def test_docengine_allocator_append_runs():
+    """
+    Test that text appended in runs leaves room for following runs
+    """
+    # boundary strategies of depths are random
+    doc = Doc(site=1, policy=RandomBoundaryPolicy(rng=random.Random(13)))
+    for _ in range(2000):
+        doc.insert_text(len(doc.text), "appended")
+
+    assert len(doc.text) == 16000
+    assert doc._alloc.stats.total == 16000
+    assert doc._alloc.stats.max_depth < Allocator.MAX_DEPTH // 2
+
+
+@pytest.mark.parametrize("policy", POLICIES.values())
+def test_docengine_allocation_policy(policy):
+    """
+    Test that every policy keeps order of typed text and records depths
+    """
+    rnd = random.Random(5)
+    doc = Doc(site=1, policy=policy())
+    expected = ""
+    for idx in range(1000):
+        position = rnd.randint(0, len(expected)) if idx % 50 == 0 \
+            else position + 1
+        doc.insert(position, "abc"[idx % 3])
+        expected = expected[:position] + "abc"[idx % 3] + \
+            expected[position:]
+
+    assert doc.text == expected
+    assert isinstance(doc._alloc.policy, policy)
+    assert sum(doc._alloc.stats.depths.values()) == 1000
+    assert 1 <= doc._alloc.stats.mean_depth <= doc._alloc.stats.max_depth
+    doc.site = 2
+    assert isinstance(doc._alloc.policy, policy)
+
+
+def test_docengine_append_biased_policy():
+    """
+    Test that append-biased policy allocates right after left neighbour
+    """
+    test_allocator = Allocator(0, AppendBiasedPolicy())
+    left_char_pos = CharPosition([0], [-1])
+    right_char_pos = CharPosition([31], [-1])
+
+    for _ in range(10):
+        pos = test_allocator(left_char_pos, right_char_pos)
+        assert 0 < pos.position[0] <= Allocator.BOUNDARY
+        assert test_allocator.get_strategy(1)
+
+
+def test_docengine_allocator_site_tie():
+    """
+    Test allocation between positions whose paths differ by site only, or
+    continue on a digit of the other neighbour
+    """
+    test_allocator = Allocator(1)
+    neighbours = [
+        (CharPosition([4, 9, 60], [-1, 1, 2]),
+         CharPosition([4, 9, 2], [-1, 3, 1])),
+        (CharPosition([14, 3], [2, 3]),
+         CharPosition([14, 4, 100], [2, 2, 2])),
+    ]
+    for left_char_pos, right_char_pos in neighbours:
+        for _ in range(20):
+            pos = test_allocator(left_char_pos, right_char_pos)
+            assert left_char_pos < pos < right_char_pos
+        for pos in test_allocator.allocate_run(left_char_pos,
+                                               right_char_pos, 10):
+            assert left_char_pos < pos < right_char_pos
+
+
+def test_docengine_insert_text():
+    """
+    Test that bulk insert matches text and replicates through patches
+    """
+    doc = Doc()
+    doc.site = 0
+    doc.insert_text(0, "held")
+    patches = doc.insert_text(2, "llo wor" * 1000)
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    for patch in doc.patch_set:
+        remote_doc.apply_patch(patch)
+
+    assert len(patches) == 7000
+    assert doc.text == "he" + "llo wor" * 1000 + "ld"
+    assert remote_doc.text == doc.text
+
+
+def test_docengine_delete_range():
+    """
+    Test that range deletion removes slice and replicates through patches
+    """
+    doc = Doc()
+    doc.site = 0
+    insert_patches = doc.insert_text(0, "Test string")
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    for patch in insert_patches:
+        remote_doc.apply_patch(patch)
+
+    delete_patches = doc.delete_range(4, 11)
+    for patch in delete_patches:
+        remote_doc.apply_patch(patch)
+
+    assert len(delete_patches) == 7
+    assert doc.text == remote_doc.text == "Test"
+    assert doc.delete_range(2, 2) == []
+
+
+def test_docengine_text_buffer():
+    """
+    Test chunked text buffer against plain string edits
+    """
+    class SmallTextBuffer(TextBuffer):
+        LOAD = 4
+
+    rnd = random.Random(0)
+    expected = "initial text"
+    buffer = SmallTextBuffer(expected)
+    for _ in range(500):
+        offset = rnd.randint(0, len(expected))
+        if rnd.random() < 0.6:
+            text = "abc\n"[:rnd.randint(1, 4)] * rnd.randint(1, 5)
+            buffer.insert(offset, text)
+            expected = expected[:offset] + text + expected[offset:]
+        else:
+            length = rnd.randint(1, 12)
+            buffer.delete(offset, length)
+            expected = expected[:offset] + expected[offset + length:]
+        start = rnd.randint(0, len(expected))
+        assert buffer.slice(start, start + 7) == expected[start:start + 7]
+        assert len(buffer) == len(expected)
+
+    assert str(buffer) == expected
+
+
+def test_docengine_text_sync():
+    """
+    Test that document text follows local and remote edits
+    """
+    doc = Doc()
+    doc.site = 0
+    patches = doc.insert_text(0, "hello world")
+    patches.append(doc.delete(0))
+    patches.extend(doc.delete_range(3, 5))
+    patches.append(doc.insert(0, "H"))
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    for patch in patches:
+        remote_doc.apply_patch(patch)
+
+    assert doc.text == remote_doc.text == "Hellworld"
+    assert doc.text_range(1, 4) == "ell"
+
+
+def test_docengine_apply_patches():
+    """
+    Test that batch patch application matches one-by-one application
+    """
+    doc = Doc()
+    doc.site = 0
+    patches = doc.insert_text(0, "batch of patches")
+    patches.extend(doc.delete_range(0, 6))
+    patches.append(doc.insert(0, "A"))
+
+    remote_doc = Doc()
+    remote_doc.site = 1
+    remote_doc.apply_patches(patches[:3])
+    remote_doc.apply_patches(patches[3:])
+
+    assert remote_doc.text == doc.text == "Aof patches"
+    assert remote_doc.get_real_position(patches[-1]) == 1
+
+
+def test_docengine_patch_roundtrip():
+    """
+    Test that typed patch keeps serialized form and identity
+    """
+    doc = Doc()
+    doc.site = 0
+    raw_patch = doc.insert(0, "a")
+    patch = Patch.from_json(raw_patch)
+
+    assert patch.op == Patch.INSERT
+    assert patch.character.char == "a"
+    assert Patch(patch.op, patch.character).to_json() == raw_patch
+    assert Patch.parse(patch) is patch
+    assert patch == Patch.parse(raw_patch)
+
+    remote_doc = Doc()
+    remote_doc.apply_patch(patch)
+    assert remote_doc.get_real_position(patch) == 1
+
+
+def test_docengine_snapshot_roundtrip():
+    """
+    Test that snapshot hydrates the same document as patch replay
+    """
+    doc = Doc()
+    for site in (0, 3, 2 ** 32 - 1):
+        doc.site = site
+        doc.insert_text(len(doc.text) // 2, "Snapshot ✓\n")
+    doc.delete_range(2, 6)
+
+    from_patches = Doc()
+    from_patches.apply_patches(doc.patch_set)
+    from_snapshot = Doc.from_snapshot(doc.snapshot(), site=5)
+
+    assert from_snapshot.text == from_patches.text == doc.text
+    assert from_snapshot.authors == doc.authors
+    assert from_snapshot.patch_set == from_patches.patch_set == doc.patch_set
+    assert Doc.from_snapshot(Doc().snapshot()).text == ""
+
+    patch = from_snapshot.delete(0)
+    doc.apply_patch(patch)
+    assert doc.text == from_snapshot.text
+
+    # new author numbers its inserts from 1, author of chars continues
+    assert Patch.from_json(from_snapshot.insert(0, "a")).character.clock == 1
+    from_snapshot = Doc.from_snapshot(doc.snapshot(), site=3)
+    assert Patch.from_json(from_snapshot.insert(0, "a")).character.clock > 1
+
+
+def test_docengine_snapshot_multichar():
+    """
+    Test snapshot of characters holding more than one symbol
+    """
+    doc = Doc()
+    doc.insert(0, "ab")
+    doc.insert(0, "c")
+
+    assert Doc.from_snapshot(doc.snapshot()).patch_set == doc.patch_set
+
+
+def test_docengine_snapshot_corrupted():
+    """
+    Test that truncated or foreign data is rejected
+    """
+    doc = Doc()
+    doc.insert_text(0, "text")
+    data = doc.snapshot()
+
+    for corrupted in (b"XXXX" + data[4:], data[:-1], data[:10]):
+        with pytest.raises(ValueError):
+            Doc.from_snapshot(corrupted)
+
+
+def test_docengine_open_snapshot(tmp_path):
+    """
+    Test that lazily opened snapshot behaves as fully loaded document
+    and materializes only touched characters
+    """
+    source = Doc()
+    for site in (2, 1):
+        source.site = site
+        source.insert_text(len(source.text) // 2, "lazy snapshot\n" * 20)
+    path = tmp_path / "doc.snapshot"
+    path.write_bytes(source.snapshot())
+
+    doc = Doc.open_snapshot(str(path), site=3)
+    loaded = Doc.from_snapshot(source.snapshot(), site=4)
+    storage = doc._Doc__doc
+    assert doc.text == loaded.text
+    assert storage.materialized == 0
+
+    rnd = random.Random(1)
+    for _ in range(100):
+        position = rnd.randint(0, len(loaded.text) - 1)
+        if rnd.random() < 0.5:
+            patch = doc.insert(position, "+")
+            loaded.apply_patch(patch)
+            assert loaded.get_real_position(patch) == \
+                doc.get_real_position(patch) == position + 1
+        else:
+            patch = doc.delete(position)
+            assert loaded.get_real_position(patch) == position + 1
+            loaded.apply_patch(patch)
+    doc.apply_patches(loaded.delete_range(5, 15))
+
+    assert doc.text == loaded.text
+    assert doc.patch_set == loaded.patch_set
+    assert doc.authors == loaded.authors
+    assert storage.materialized < len(source.text) // 2
+
+    path.write_bytes(b"")
+    with pytest.raises(ValueError, match="truncated"):
+        Doc.open_snapshot(str(path))
+
+
+@pytest.mark.parametrize("storage", [SortedListStorage, BlockStorage,
+                                     TrieStorage])
+def test_docengine_storage_equivalence(storage):
+    """
+    Test that storage backend receiving local and remote edits keeps the
+    same document as reference replica
+    """
+    rnd = random.Random(7)
+    doc = Doc(site=1, storage=storage())
+    remote = Doc(site=2)
+    reference = Doc(site=3)
+    for _ in range(300):
+        author, other = (doc, remote) if rnd.random() < 0.6 \
+            else (remote, doc)
+        action = rnd.random()
+        if action < 0.5 or not author.text:
+            position = rnd.randint(0, len(author.text))
+            patches = author.insert_text(position, "run\n" *
+                                         rnd.randint(1, 5))
+        elif action < 0.8:
+            position = rnd.randint(0, len(author.text) - 1)
+            patches = [author.delete(position)]
+        else:
+            start = rnd.randint(0, len(author.text) - 1)
+            patches = author.delete_range(start,
+                                          start + rnd.randint(1, 10))
+
+        for patch in patches:
+            assert other.get_real_position(patch) == \
+                reference.get_real_position(patch)
+            other.apply_patch(patch)
+            reference.apply_patch(patch)
+
+    assert doc.text == reference.text == remote.text
+    assert doc.authors == reference.authors
+    assert doc.patch_set == reference.patch_set
+    assert Doc.from_snapshot(doc.snapshot()).text == doc.text
+
+
+def test_docengine_block_storage_runs():
+    """
+    Test that inserted runs are stored as few blocks
+    """
+    rnd = random.Random(3)
+    storage = BlockStorage()
+    doc = Doc(site=1, storage=storage)
+    for _ in range(100):
+        doc.insert_text(rnd.randint(0, len(doc.text)), "typed run " * 5)
+
+    assert storage.blocks * 10 < len(doc.text)
+
+
+def test_docengine_rebalance():
+    """
+    Test that rebalance shortens positions and translates patches made
+    concurrently at the previous epoch
+    """
+    rnd = random.Random(11)
+    source = Doc(site=1)
+    for _ in range(200):
+        source.site = rnd.randint(1, 3)
+        source.insert(rnd.randint(0, len(source.text)), rnd.choice("ab\n"))
+    replicas = [Doc(site=site) for site in (1, 2, 3)]
+    for replica in replicas:
+        replica.apply_patches(source.patch_set)
+    first, second, third = replicas
+
+    # third edits while first switches epoch
+    pending = third.insert_text(5, "late") + [third.delete(0)] + \
+        [third.insert(len(third.text), "!")]
+    pending.append(third.delete(len(third.text) - 1))
+    depth = max(len(c.key) for c in first._Doc__doc)
+    first.rebalance()
+    assert first.epoch == 1
+    assert max(len(c.key) for c in first._Doc__doc) < depth
+    new_patches = [first.insert(3, "x"), first.delete(10)]
+
+    translated = third.rebalance(pending)
+    assert third.epoch == 1 and len(translated) == len(pending)
+    for patch in pending:
+        first.apply_patch(patch)
+    second.rebalance()
+    for patch in pending + new_patches:
+        second.apply_patch(patch)
+    for patch in new_patches:
+        third.apply_patch(patch)
+
+    assert first.text == second.text == third.text
+    assert first.patch_set == second.patch_set == third.patch_set
+    assert Doc.from_snapshot(first.snapshot()).epoch == 1
+
+    first.rebalance()
+    with pytest.raises(ValueError):
+        first.apply_patch(pending[0])
+
+
+def test_docengine_site_table():
+    """
+    Test that positions of received and loaded characters share site ids
+    """
+    source = Doc()
+    for site in (2 ** 32 - 1, 2 ** 31 + 5, 1000):
+        source.site = site
+        source.insert_text(len(source.text) // 2, "shared sites")
+
+    doc = Doc(site=7)
+    doc.apply_patches(source.patch_set)
+    doc.apply_patch(source.insert(0, "!"))
+    loaded = Doc.from_snapshot(doc.snapshot())
+    for replica in (doc, loaded):
+        site_objects = {id(site) for char in replica._Doc__doc
+                        for site in char.key[1::2]}
+        assert len(site_objects) == 4
+        assert all(char.position.key is char.key
+                   for char in replica._Doc__doc)
+    assert doc.text == loaded.text == source.text
+
+    # interning does not change positions, which are immutable
+    position = CharPosition([3], [1000])
+    key = position.key
+    char = Character("x", position, 1)
+    SiteTable().intern_char(char)
+    assert position.key is key and char.key == key
+
+
+@pytest.mark.parametrize("max_digit", [3, 5000])
+def test_docengine_trie_storage(max_digit):
+    """
+    Test that trie storage keeps the order and ranks of sorted storage for
+    prefix positions, positions shared by several clocks and wide nodes
+    """
+    rnd = random.Random(9)
+    trie, reference = TrieStorage(), SortedListStorage()
+    chars = []
+    for clock in range(500):
+        depth = rnd.randint(1, 4)
+        position = CharPosition([rnd.randint(0, max_digit)
+                                 for _ in range(depth)],
+                                [rnd.randint(0, 1) for _ in range(depth)])
+        chars.append(Character("x", position, clock % 50))
+    for char in chars:
+        if reference.find(char) is None:
+            trie.add(char)
+            reference.add(char)
+    for char in rnd.sample(list(reference), 100):
+        trie.remove(char)
+        reference.remove(char)
+
+    def identifiers(chars):
+        return [char.identifier for char in chars]
+
+    assert identifiers(trie) == identifiers(reference)
+    assert len(trie) == len(reference)
+    for idx, char in enumerate(reference):
+        assert trie[idx].identifier == char.identifier
+        assert trie[idx].char == char.char
+        assert trie.index(char) == idx
+    for char in chars:
+        assert trie.bisect_left(char) == reference.bisect_left(char)
+        assert (trie.find(char) is None) == (reference.find(char) is None)
+    assert identifiers(trie.islice(37, 120)) == \
+        identifiers(reference.islice(37, 120))
+
+
+def test_docengine_line_index():
+    """
+    Test that line index of document follows inserts and deletes of
+    newlines across text chunks
+    """
+    rnd = random.Random(5)
+    doc = Doc(site=1)
+    for _ in range(300):
+        position = rnd.randint(0, len(doc.text))
+        if doc.text and rnd.random() < 0.3:
+            end = min(position + rnd.randint(1, 40), len(doc.text))
+            doc.delete_range(min(position, len(doc.text) - 1), end)
+        else:
+            doc.insert_text(position, rnd.choice(["\n", "ab\nc", "x" * 30]))
+
+        lines = doc.text.split("\n")
+        assert doc.line_count == len(lines)
+        line = rnd.randrange(len(lines))
+        assert doc.get_line(line) == lines[line]
+        start, end = doc.line_range(line)
+        assert doc.text[start:end] == lines[line]
+        assert doc.line_of(start) == doc.line_of(end) == line
+        assert len(doc.authors_range(start, end)) == end - start
+    assert [doc.get_line(line) for line in range(doc.line_count)] == \
+        doc.text.split("\n")
+    with pytest.raises(IndexError):
+        doc.line_range(doc.line_count)
+
+
+def test_docengine_author_spans():
+    """
+    Test that author spans cover the requested range with runs of chars
+    of the same author
+    """
+    doc = Doc(site=1)
+    doc.insert_text(0, "first")
+    doc.site = 2
+    doc.insert_text(2, "second")
+    doc.insert_text(0, "x")
+    authors = doc.authors[1:-1]
+
+    assert doc.author_spans(0, len(doc.text)) == \
+        [(0, 1, 2), (1, 3, 1), (3, 9, 2), (9, 12, 1)]
+    for start in range(len(doc.text)):
+        for end in range(start, len(doc.text) + 1):
+            spans = doc.author_spans(start, end)
+            assert [site for span_start, span_end, site in spans
+                    for _ in range(span_start, span_end)] == \
+                authors[start:end]
+
+
+def test_docengine_version_vector():
+    """
+    Test that version vector detects repeated operations delivered out of
+    order and keeps only clocks seen after gaps
+    """
+    versions = VersionVector()
+    clocks = list(range(1, 101))
+    random.Random(3).shuffle(clocks[10:])
+    for clock in clocks:
+        assert versions.add(7, clock)
+        assert (7, clock) in versions
+    assert versions[7] == 100
+    assert not any(versions.add(7, clock) for clock in clocks)
+    assert repr(versions) == "VersionVector(clocks={7: 100}, exceptions={})"
+
+    # earlier operations of an unknown site are not taken as seen
+    assert versions.add(8, 50)
+    assert (8, 49) not in versions and versions[8] == 0
+    assert versions.add(8, 52)
+    versions.advance(8, 51)
+    assert versions[8] == 52 and len(versions) == 2
+
+
+def test_docengine_delete_takes_no_clock():
+    """
+    Test that clocks of inserts of a site are consecutive with deletes
+    in between
+    """
+    doc = Doc(site=1)
+    patches = doc.insert_text(0, "abc")
+    doc.delete(1)
+    doc.delete_range(0, 1)
+    patches.append(doc.insert(0, "d"))
+    assert [Patch.from_json(patch).character.clock
+            for patch in patches] == [1, 2, 3, 4]
+
+
+def test_docengine_version_vector_missing():
+    """
+    Test that version vector survives serialization and selects history
+    patches missed by its peer
+    """
+    doc = Doc(site=1)
+    seen = doc.insert_text(0, "abc")
+    versions = VersionVector()
+    for patch in map(Patch.from_json, seen):
+        versions.add(patch.character.author, patch.character.clock)
+    versions.add(1, 7)
+    versions = VersionVector.from_dict(json.loads(
+        json.dumps(versions.to_dict())))
+    assert versions[1] == 3 and (1, 7) in versions and (1, 5) not in versions
+
+    deleted = doc.delete(0)
+    missed = doc.insert_text(2, "de")
+    cancelled = [doc.insert(4, "x"), doc.delete(4)]
+    history = seen + [deleted] + missed + cancelled
+    assert [patch.to_json() for patch in versions.missing(history)] == \
+        [deleted] + missed
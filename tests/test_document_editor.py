@@ -1,3 +1,4 @@
+import random
 import unittest
 from unittest import mock
 from unittest.mock import PropertyMock
@@ -120,3 +121,80 @@ def test_document_editor_do_paste(mock_msg_service, mock_get_app):
     # assert that document remains unchanged
     assert document_editor.doc.text == "Test string, quite a long one!" \
                                        " Yeah, sure...TEST"
+
+
+@unittest.mock.patch("document_editor.get_app")
+@unittest.mock.patch("document_editor.MessageService")
+def test_document_editor_skip_applied(mock_msg_service, mock_get_app):
+    """
+    Test that patches received twice and echoes of own patches are
+    applied once
+    """
+    doc = Doc()
+    doc.site = 1
+    loaded = doc.insert_text(0, "Test")
+    patches = doc.insert_text(4, " string") + doc.delete_range(0, 1)
+    msg_srv_instance = mock_msg_service.return_value()
+
+    document_editor = DocumentEditor(msg_srv_instance)
+    document_editor.load_patches(loaded)
+    for patch in loaded + patches + patches[::-1]:
+        document_editor.update_text(patch)
+    assert document_editor.doc.text == "est string"
+
+    mock_get_app.return_value.clipboard.get_data.return_value = \
+        ClipboardData("T")
+    document_editor.do_paste()
+    own_patches = [call[0][0]
+                   for call in msg_srv_instance.put_patch.call_args_list]
+    for patch in own_patches:
+        document_editor.update_text(patch)
+    assert document_editor.doc.text == "Test string"
+
+
+@unittest.mock.patch("document_editor.MessageService")
+def test_document_editor_delete_before_insert(mock_msg_service):
+    """
+    Test that delete received before its insert is applied with it
+    """
+    doc = Doc()
+    doc.site = 1
+    inserts = doc.insert_text(0, "Test")
+    deletes = doc.delete_range(1, 3)
+    msg_srv_instance = mock_msg_service.return_value()
+
+    document_editor = DocumentEditor(msg_srv_instance)
+    for patch in deletes + inserts + deletes:
+        document_editor.update_text(patch)
+    assert document_editor.doc.text == "Tt"
+    assert document_editor.text_field.buffer.text == "Tt"
+    assert not document_editor.doc.held
+
+
+@unittest.mock.patch("document_editor.MessageService")
+def test_document_editor_any_order(mock_msg_service):
+    """
+    Test that patches of a site delivered out of order are all applied,
+    either one by one or as a batch
+    """
+    doc = Doc()
+    doc.site = 1
+    patches = doc.insert_text(0, "hello")
+    patches += doc.insert_text(5, " world") + doc.delete_range(0, 1)
+    shuffled = patches[:]
+    random.Random(21).shuffle(shuffled)
+    msg_srv_instance = mock_msg_service.return_value()
+
+    for order in ([patches[1], patches[0]] + patches[2:], shuffled):
+        document_editor = DocumentEditor(msg_srv_instance)
+        for patch in order:
+            document_editor.update_text(patch)
+            assert document_editor.text_field.buffer.text == \
+                document_editor.doc.text
+        assert document_editor.doc.text == "ello world"
+
+        document_editor = DocumentEditor(msg_srv_instance)
+        document_editor.merge_patches(order[:3])
+        document_editor.merge_patches(order)
+        assert document_editor.doc.text == "ello world"
+        assert not document_editor.doc.held
@@ -0,0 +1,309 @@
+import asyncio
+import json
+from unittest import mock
+
+import pytest
+from prompt_toolkit.clipboard import ClipboardData
+
+from application_state import ApplicationState
+from docengine import Doc
+from document_editor import DocumentEditor
+from message_service import MessageService
+
+
+class FakeWebsocket:
+    """
+    Websocket which keeps sent messages and replies with prepared
+    responses
+    """
+    def __init__(self, responses=(), closed=False):
+        self.sent = []
+        self.responses = [json.dumps(response).encode("utf-8")
+                          for response in responses]
+        self.closed = closed
+
+    async def send(self, message):
+        if self.closed:
+            raise OSError("connection is closed")
+        self.sent.append(message)
+
+    async def recv(self):
+        if not self.responses:
+            # server which never replies
+            await asyncio.sleep(3600)
+        return self.responses.pop(0)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise OSError("connection is closed")
+        if not self.responses:
+            raise StopAsyncIteration
+        return self.responses.pop(0)
+
+    def sent_packets(self):
+        return [json.loads(message.decode("utf-8"))
+                for message in self.sent]
+
+
+def get_patches():
+    doc = Doc()
+    doc.site = 1
+    return doc.insert_text(0, "Hello, world!")
+
+
+async def run_send_worker(msg_service):
+    """
+    Run send worker until send queue is empty
+    """
+    task = asyncio.create_task(msg_service.send_worker())
+    await msg_service.send_queue.join()
+    task.cancel()
+
+
+@pytest.mark.parametrize("encoding", ["json", "binary"])
+def test_message_service_batching(encoding):
+    """
+    Test that patches queued together are sent as one batch message and
+    messages queued after them keep their order
+    """
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    msg_service.negotiate_encoding({"encoding": encoding, "batching": True})
+    patches = get_patches()
+    for patch in patches:
+        msg_service.put_patch(patch)
+    msg_service.put_message(b"save")
+    msg_service.put_patch(patches[0])
+    asyncio.run(run_send_worker(msg_service))
+
+    batch, save, single = msg_service.websocket.sent
+    assert save == b"save"
+    batch_packet = json.loads(batch.decode("utf-8"))
+    assert batch_packet["type"] == "patch_batch"
+    assert [patch.to_json() for patch
+            in MessageService.decode_patches(batch_packet)] == patches
+    single_packet = json.loads(single.decode("utf-8"))
+    assert single_packet["type"] == "patch"
+    assert [patch.to_json() for patch
+            in MessageService.decode_patches(single_packet)] == patches[:1]
+    assert msg_service.sent.frames == 3
+    assert msg_service.sent.patches == len(patches) + 1
+
+
+def test_message_service_batch_size():
+    """
+    Test that batch is closed when it exceeds batch size and that no
+    batches are sent unless server accepts them
+    """
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    msg_service.negotiate_encoding({"batching": True})
+    msg_service.BATCH_SIZE = 1
+    patches = get_patches()
+    for patch in patches:
+        msg_service.put_patch(patch)
+    asyncio.run(run_send_worker(msg_service))
+    assert msg_service.sent.frames == len(patches)
+    assert msg_service.sent.patches_per_frame == 1
+
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    msg_service.negotiate_encoding({})
+    for patch in patches:
+        msg_service.put_patch(patch)
+    asyncio.run(run_send_worker(msg_service))
+    assert [json.loads(message.decode("utf-8"))["type"]
+            for message in msg_service.websocket.sent] == \
+        ["patch"] * len(patches)
+
+
+@pytest.mark.parametrize("server_sync", [True, False, None])
+@mock.patch("document_editor.get_app")
+def test_message_service_reconnect(mock_get_app, server_sync):
+    """
+    Test that after reconnect missed operations are applied, sent own
+    patches unknown to server are replayed and queued ones are sent.
+    Server sync may succeed, fail or be not supported (None).
+    """
+    remote = Doc(site=2)
+    history = remote.insert_text(0, "Hello")
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    doc_editor = DocumentEditor(msg_service)
+    doc_editor.doc.site = 1
+    doc_editor.load_patches(history)
+
+    def type_text(text):
+        mock_get_app.return_value.clipboard.get_data.return_value = \
+            ClipboardData(text)
+        doc_editor.do_paste()
+
+    missed = remote.insert_text(5, " world")
+    websocket = FakeWebsocket([{"success": True,
+                                "sync": server_sync is not None}])
+
+    async def run():
+        worker = asyncio.create_task(msg_service.send_worker())
+        type_text("ab")
+        await msg_service.send_queue.join()
+        acked, sent = msg_service.unacked
+
+        msg_service.websocket.closed = True
+        type_text("c")
+        await asyncio.sleep(0.01)
+        assert not msg_service.connected.is_set()
+
+        if server_sync:
+            responses = [{"type": "sync_response", "success": True,
+                          "content": missed,
+                          "versions": {"clocks": {"1": 1, "2": 5}}}]
+        else:
+            responses = [{"type": "file_response",
+                          "content": history + missed + [acked]}]
+            if server_sync is not None:
+                responses.insert(0, {"type": "sync_response",
+                                     "success": False})
+        websocket.responses += [json.dumps(response).encode("utf-8")
+                                for response in responses]
+        await msg_service.reconnect(websocket, doc_editor)
+        await msg_service.send_queue.join()
+        worker.cancel()
+        return sent
+
+    sent = asyncio.run(run())
+
+    assert doc_editor.doc.text == "abcHello world"
+    packets = websocket.sent_packets()
+    assert packets[0]["type"] == "user_login"
+    if server_sync is not None:
+        assert packets[1]["type"] == "sync_request"
+        assert packets[1]["versions"]["clocks"] == {"1": 3, "2": 5}
+        del packets[1]
+    requests = [packet["type"] for packet in packets[1:]]
+    assert requests == (["patch"] * 2 if server_sync
+                        else ["file_request", "patch", "patch"])
+    assert packets[-2]["content"] == sent
+    assert list(msg_service.unacked)[0] == sent
+    assert len(msg_service.unacked) == 2
+
+
+def test_message_service_connection_errors():
+    """
+    Test that only lost connection ends receive worker, that failed login
+    is reported and that silent server fails reconnect by timeout
+    """
+    doc_editor = mock.Mock()
+    msg_service = MessageService(ApplicationState(),
+                                 FakeWebsocket(closed=True))
+    asyncio.run(msg_service.receive_worker(None, doc_editor))
+
+    msg_service.websocket = FakeWebsocket([{"type": "patch",
+                                            "content": "junk"}])
+    with pytest.raises(ValueError):
+        asyncio.run(msg_service.receive_worker(None, doc_editor))
+
+    websocket = FakeWebsocket([{"success": False}])
+    assert not asyncio.run(msg_service.reconnect(websocket, doc_editor))
+    msg_service.REPLY_TIMEOUT = 0.01
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(msg_service.reconnect(FakeWebsocket(), doc_editor))
+
+
+@mock.patch("document_editor.get_app")
+def test_message_service_rebalance(mock_get_app):
+    """
+    Test that sites rebalance at rebalance message of server, translate
+    own patches ordered after it and agree with site loading history
+    """
+    history = Doc(site=3).insert_text(0, "Hello, world!")
+    editors = []
+    for site in (1, 2):
+        msg_service = MessageService(ApplicationState(), FakeWebsocket())
+        msg_service.negotiate_encoding({"rebalance": True})
+        doc_editor = DocumentEditor(msg_service)
+        doc_editor.doc.site = site
+        msg_service.load_history(doc_editor, history)
+        editors.append(doc_editor)
+    first, second = editors
+
+    def type_text(doc_editor, position, text):
+        mock_get_app.return_value.clipboard.get_data.return_value = \
+            ClipboardData(text)
+        doc_editor.text_field.buffer.cursor_position = position
+        doc_editor.do_paste()
+
+    async def run():
+        # second sends before it gets rebalance message, first after it
+        type_text(second, 5, "!")
+        await run_send_worker(second.msg_service)
+        late, = second.msg_service.websocket.sent_packets()
+        type_text(first, 0, ">> ")
+        first.msg_service.request_rebalance(first.doc.epoch)
+        marker = {"type": "rebalance", "epoch": 1}
+
+        first.msg_service.websocket.responses = [
+            json.dumps(packet).encode("utf-8") for packet in (marker, late)]
+        await first.msg_service.receive_worker(None, first)
+        await run_send_worker(first.msg_service)
+        *translated, request = first.msg_service.websocket.sent_packets()
+        assert request["type"] == "rebalance_request"
+
+        second.msg_service.websocket.responses = [
+            json.dumps(packet).encode("utf-8")
+            for packet in [marker, late] + translated]
+        await second.msg_service.receive_worker(None, second)
+        return [late] + translated
+
+    packets = asyncio.run(run())
+    assert first.doc.epoch == second.doc.epoch == 1
+    assert first.doc.text == second.doc.text == ">> Hello!, world!"
+    assert first.doc.patch_set == second.doc.patch_set
+    # echo of patch sent before rebalance acknowledges translated one
+    assert not second.msg_service.outgoing
+    assert not second.msg_service.unacked
+    assert [MessageService.decode_patch(packet).epoch
+            for packet in packets] == [0, 1, 1, 1]
+
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    loaded = DocumentEditor(msg_service)
+    history += [json.dumps({"type": "rebalance", "epoch": 1})] + [
+        patch.to_json() for packet in packets
+        for patch in MessageService.decode_patches(packet)]
+    msg_service.load_history(loaded, history)
+    assert loaded.doc.text == first.doc.text
+    assert loaded.doc.patch_set == first.doc.patch_set
+
+
+@mock.patch("document_editor.get_app")
+def test_message_service_missed_rebalance(mock_get_app):
+    """
+    Test that patch of later epoch loads document again from history and
+    patch older than the previous epoch is dropped
+    """
+    remote = Doc(site=3)
+    history = remote.insert_text(0, "Hello")
+    msg_service = MessageService(ApplicationState(), FakeWebsocket())
+    msg_service.negotiate_encoding({"rebalance": True})
+    doc_editor = DocumentEditor(msg_service)
+    msg_service.load_history(doc_editor, history)
+
+    late = Doc(site=4)
+    late.apply_patches(history)
+    stale = late.insert(0, "<")
+    remote.rebalance()
+    history.append(json.dumps({"type": "rebalance", "epoch": 1}))
+    missed = remote.insert(5, "!")
+    remote.rebalance()
+    history += [json.dumps({"type": "rebalance", "epoch": 2}), stale]
+    notify = mock.Mock()
+    msg_service.websocket = FakeWebsocket([
+        {"type": "patch", "content": missed},
+        {"type": "file_response", "content": history[:-2] + [missed]},
+        {"type": "rebalance", "epoch": 2},
+        {"type": "patch", "content": stale}])
+    asyncio.run(msg_service.receive_worker(notify, doc_editor))
+
+    assert msg_service.websocket.sent_packets()[0]["type"] == "file_request"
+    assert doc_editor.doc.epoch == 2
+    assert doc_editor.doc.text == "Hello!"
+    assert msg_service.dropped == 1
+    notify.assert_called_once()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+from application_state import ApplicationState
+from docengine import Doc
+from message_service import MessageService
+from patch_journal import PatchJournal
+
+
+def get_patches():
+    doc = Doc()
+    doc.site = 1
+    return doc.insert_text(0, "Hello, world!")
+
+
+def test_patch_journal_replay(tmp_path):
+    """
+    Test that patches not acknowledged are found in journal after restart
+    and journal is truncated once all of them are acknowledged
+    """
+    path = str(tmp_path / "file.journal")
+    patches = get_patches()
+    journal = PatchJournal(path)
+    for patch in patches:
+        journal.append(patch)
+    for patch in patches[:5]:
+        journal.acknowledge(patch)
+    # no close, as after crash, acknowledged patches are kept in file
+    # until it is compacted and are skipped on replay
+    journal = PatchJournal(path)
+    assert journal.pending == patches
+
+    for patch in patches:
+        journal.acknowledge(patch)
+    journal.close()
+    assert os.path.getsize(path) == 0
+    assert PatchJournal(path).pending == []
+
+
+def test_patch_journal_group_commit(tmp_path):
+    """
+    Test that patches appended within commit window are synced together
+    """
+    journal = PatchJournal(str(tmp_path / "file.journal"))
+    patches = get_patches()
+
+    async def run():
+        for patch in patches:
+            journal.append(patch)
+        assert journal.commits == 0
+        # appends reach the file before commit
+        assert PatchJournal(journal.path).pending == patches
+        await asyncio.sleep(journal.COMMIT_WINDOW * 2)
+
+    asyncio.run(run())
+    assert journal.commits == 1
+    journal.close()
+
+
+def test_patch_journal_damaged(tmp_path):
+    """
+    Test that torn last entry is dropped and acknowledged entries are
+    compacted away
+    """
+    path = str(tmp_path / "file.journal")
+    patches = get_patches()
+    journal = PatchJournal(path)
+    journal.COMPACT_SIZE = 4
+    for patch in patches:
+        journal.append(patch)
+    for patch in patches[:4]:
+        journal.acknowledge(patch)
+    journal.commit()
+    with open(path, "rb") as journal_file:
+        assert journal_file.read().decode("utf-8").split("\n")[:-1] == \
+            patches[4:]
+
+    journal.close()
+    with open(path, "ab") as journal_file:
+        journal_file.write(patches[0][:10].encode("utf-8"))
+    assert PatchJournal(path).pending == patches[4:]
+    assert PatchJournal(path).pending == patches[4:]
+
+
+def test_patch_journal_restore(tmp_path):
+    """
+    Test that only patches of journal which server does not have are
+    queued again
+    """
+    path = str(tmp_path / "file.journal")
+    patches = get_patches()
+    journal = PatchJournal(path)
+    for patch in patches:
+        journal.append(patch)
+    journal.close()
+
+    msg_service = MessageService(ApplicationState(), None)
+    msg_service.open_journal(PatchJournal(path))
+    msg_service.acknowledge_history(patches[:5])
+    assert msg_service.requeue_unacked() == patches[5:]
+    assert msg_service.send_queue.qsize() == len(patches) - 5
+    assert not msg_service.unacked
+    assert msg_service.journal.pending == patches[5:]
+    msg_service.journal.close()
@@ -0,0 +1,54 @@
+import os
+from unittest import mock
+
+from docengine import Doc
+from document_editor import DocumentEditor
+from snapshot_cache import SnapshotCache
+
+
+def test_snapshot_cache_roundtrip(tmp_path):
+    """
+    Test that cached file is found by its name and loaded into editor
+    with version vector of snapshot
+    """
+    doc = Doc(site=1)
+    patches = doc.insert_text(0, "Hello")
+    with mock.patch("document_editor.MessageService"):
+        doc_editor = DocumentEditor(None)
+    doc_editor.load_patches(patches)
+
+    cache = SnapshotCache(str(tmp_path))
+    assert cache.find("user", None, "file") is None
+    cache.save("id/1", ("user", None, "file"), doc_editor.doc.snapshot(),
+               doc_editor.versions.to_dict())
+    assert cache.find("user", "owner", "file") is None
+    file_id = cache.find("user", None, "file")
+    assert file_id == "id/1"
+
+    with mock.patch("document_editor.MessageService"):
+        doc_editor = DocumentEditor(None)
+    doc_editor.load_snapshot(*cache.load(file_id))
+    assert doc_editor.text_field.text == "Hello"
+    assert doc_editor.text_field.lexer.doc is doc_editor.doc
+    doc_editor.merge_patches(patches + doc.insert_text(5, "!"))
+    assert doc_editor.doc.text == "Hello!"
+
+    cache.remove(file_id)
+    assert cache.load(file_id) is None
+    assert cache.find("user", None, "file") is None
+
+
+def test_snapshot_cache_damaged(tmp_path):
+    """
+    Test that damaged snapshot is a cache miss and default directory
+    follows XDG_CACHE_HOME
+    """
+    cache = SnapshotCache(str(tmp_path))
+    cache.save("1", ("user", None, "file"), Doc().snapshot(), {})
+    with open(os.path.join(str(tmp_path), "1.snapshot"), "wb") as file:
+        file.write(b"junk")
+    assert cache.load("1") is None
+
+    with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmp_path)}):
+        assert SnapshotCache().directory == \
+            os.path.join(str(tmp_path), "multitext")